@@ -0,0 +1,78 @@
+import asyncio
+import os
+import tempfile
+from typing import Dict, List
+
+from benchmarks.measure import Timer
+from benchmarks.synthetic_site import SyntheticSite
+from core.crawler import DataCrawler
+
+
+class LocalCrawler(DataCrawler):
+    def __init__(self, site_root: str, **kwargs):
+        """
+        A DataCrawler that stays on a local site instead of the https 'uel' ones.
+
+        Args:
+        - site_root (str): The scheme, host and port of the site.
+        """
+        self.site_root = site_root
+        super().__init__(**kwargs)
+
+    def is_valid_url(self, href: str) -> bool:
+        return href.startswith(self.site_root) and not href.endswith('.pdf')
+
+
+async def crawl_site(num_pages: int, fanout: int, texts: List[str], num_workers: int) -> Dict:
+    """
+    Serve a synthetic site and crawl all of it.
+
+    Args:
+    - num_pages (int): The number of pages of the site.
+    - fanout (int): The number of links from a page to its children.
+    - texts (List[str]): The paragraphs pages are made of.
+    - num_workers (int): The number of crawl workers.
+    """
+    site = SyntheticSite(num_pages, fanout, texts)
+    start_url = await site.start()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            crawler = LocalCrawler(
+                site.root, base_url=start_url, max_depth=num_pages, num_workers=num_workers,
+                download_folder=os.path.join(folder, "pdf_files"),
+            )
+            with Timer() as timer:
+                await crawler.start_extract(os.path.join(folder, "page_contents.csv"))
+    finally:
+        await site.stop()
+
+    page_requests = {path: count for path, count in site.requests.items() if path.startswith('/p/')}
+    return {
+        "num_pages": num_pages,
+        "num_workers": num_workers,
+        "seconds": timer.elapsed,
+        "pages_crawled": len(page_requests),
+        "pages_extracted": crawler.pages_extracted,
+        "pages_per_second": len(page_requests) / timer.elapsed,
+        # 1.0 when every page is fetched exactly once; retries and refetches push it up
+        "requests_per_page": sum(page_requests.values()) / max(1, len(page_requests)),
+        "pdfs_downloaded": len(crawler.pdf_manifest),
+    }
+
+
+def run_crawl_benchmark(texts: List[str], page_counts: List[int], fanout: int = 8,
+                        worker_counts: List[int] = None) -> List[Dict]:
+    """
+    Measure crawl throughput against local synthetic sites of increasing size.
+
+    Args:
+    - texts (List[str]): The paragraphs pages are made of.
+    - page_counts (List[int]): The site sizes.
+    - fanout (int): The number of links from a page to its children.
+    - worker_counts (List[int]): The numbers of crawl workers to try, 10 if not given.
+    """
+    results = []
+    for num_pages in page_counts:
+        for num_workers in worker_counts or [10]:
+            results.append(asyncio.run(crawl_site(num_pages, fanout, texts, num_workers)))
+    return results
@@ -0,0 +1,96 @@
+import csv
+import logging
+import multiprocessing
+import os
+import tempfile
+from typing import Dict, List
+
+from benchmarks.measure import Timer, peak_rss_mb
+from core.fake_embedding import FakeEmbeddings
+from handler.insert_csv import InsertCSV
+
+
+def scale_corpus(csv_path: str, scale: int, output_path: str) -> int:
+    """
+    Write a corpus scale times the size of a csv with 'field' and 'content' columns, every copy of a row
+    made distinct so none is skipped as a duplicate.
+
+    Args:
+    - csv_path (str): The csv to scale up, e.g. food_data.csv.
+    - scale (int): The number of copies of each row.
+    - output_path (str): The csv to write.
+
+    Returns:
+    - int: The number of rows written.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        rows = list(csv.DictReader(file))
+    with open(output_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['field', 'content'])
+        writer.writeheader()
+        for copy in range(scale):
+            for row in rows:
+                writer.writerow({'field': row['field'], 'content': f"{row['content']} (copy {copy})"})
+    return scale * len(rows)
+
+
+def ingest(csv_path: str, folder: str, chunksize: int, dimension: int, log_level: int,
+           queue: multiprocessing.Queue) -> None:
+    """
+    Insert a csv into a new store and put the measurements on the queue.
+
+    This runs in a process of its own, so the peak RSS is the one of this insert alone.
+
+    Args:
+    - csv_path (str): The csv to insert.
+    - folder (str): The folder holding the store.
+    - chunksize (int): The number of rows read and inserted at a time.
+    - dimension (int): The fake embedding dimension.
+    - log_level (int): The level up to which logging is disabled, as in the parent process.
+    - queue (multiprocessing.Queue): Where the measurements go.
+    """
+    logging.disable(log_level)
+    embedding = FakeEmbeddings(dimension=dimension, latency=0)
+    handler = InsertCSV('ingest_benchmark', embedding=embedding, folder_path=folder)
+    with Timer() as timer:
+        handler.insert_csv(csv_path, chunksize=chunksize)
+    documents = handler.vector_store.index.ntotal
+    queue.put({
+        "documents": documents,
+        "seconds": timer.elapsed,
+        "documents_per_second": documents / timer.elapsed,
+        "embedding_calls": embedding.calls,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+
+def run_ingest_benchmark(csv_path: str, scales: List[int], chunksize: int = 1000, dimension: int = 768) -> List[Dict]:
+    """
+    Measure insert throughput and memory on corpora scaled up from a csv, embedded by a deterministic
+    fake model answering at once, so the numbers measure chunking, hashing, indexing and saving.
+
+    Args:
+    - csv_path (str): The csv to scale up, e.g. food_data.csv.
+    - scales (List[int]): The scale factors.
+    - chunksize (int): The number of rows read and inserted at a time.
+    - dimension (int): The fake embedding dimension.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as folder:
+            corpus_path = os.path.join(folder, f"corpus_x{scale}.csv")
+            rows = scale_corpus(csv_path, scale, corpus_path)
+
+            queue = context.Queue()
+            process = context.Process(
+                target=ingest, args=(corpus_path, folder, chunksize, dimension, logging.root.manager.disable, queue)
+            )
+            process.start()
+            # The measurements are a few numbers, small enough to stay in the queue until the process exits
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"The ingest of the x{scale} corpus exited with code {process.exitcode}")
+            result = queue.get()
+            results.append({"scale": scale, "rows": rows, "chunksize": chunksize, **result})
+    return results
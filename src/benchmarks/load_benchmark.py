@@ -0,0 +1,51 @@
+import os
+import statistics
+import tempfile
+from typing import Dict, List
+
+from benchmarks.ingest_benchmark import scale_corpus
+from benchmarks.measure import Timer
+from core.fake_embedding import FakeEmbeddings
+from handler.insert_csv import InsertCSV
+
+
+def run_load_benchmark(csv_path: str, scale: int = 2000, repeats: int = 5, dimension: int = 768) -> List[Dict]:
+    """
+    Measure how long VectorStore.load_vector_store takes to open a saved store, memory-mapped or read in full.
+
+    Args:
+    - csv_path (str): The csv to scale up into the store, e.g. food_data.csv.
+    - scale (int): The number of copies of each row, 2000 copies of food_data.csv making about 100k documents.
+    - repeats (int): The number of loads per mode, the median is reported.
+    - dimension (int): The fake embedding dimension.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        corpus_path = os.path.join(folder, f"corpus_x{scale}.csv")
+        scale_corpus(csv_path, scale, corpus_path)
+
+        embedding = FakeEmbeddings(dimension=dimension, latency=0)
+        handler = InsertCSV('load_benchmark', embedding=embedding, folder_path=folder)
+        handler.insert_csv(corpus_path)
+        # Writing the whole index file makes every load open the same file, with an empty vector log
+        handler.VectorStore.write_index(
+            handler.vector_store, handler.vector_store.docstore,
+            handler.VectorStore.vector_store_paths(folder, 'load_benchmark')[0],
+        )
+        documents = handler.vector_store.index.ntotal
+
+        for mmap in (True, False):
+            seconds = []
+            for _ in range(repeats):
+                with Timer() as timer:
+                    vector_store = handler.VectorStore.load_vector_store(folder, 'load_benchmark', embedding, mmap=mmap)
+                seconds.append(timer.elapsed)
+                vector_store.docstore.close()
+            results.append({
+                "mode": "mmap" if mmap else "read",
+                "documents": documents,
+                "repeats": repeats,
+                "median_ms": statistics.median(seconds) * 1000,
+                "max_ms": max(seconds) * 1000,
+            })
+    return results
@@ -0,0 +1,43 @@
+import resource
+import time
+from typing import Dict, List
+
+import numpy as np
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """
+    Summarize latencies, in seconds, as the p50, p99 and mean in milliseconds.
+
+    Args:
+    - latencies (List[float]): The latencies.
+    """
+    milliseconds = np.array(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(milliseconds, 50)),
+        "p99_ms": float(np.percentile(milliseconds, 99)),
+        "mean_ms": float(milliseconds.mean()),
+    }
+
+
+def peak_rss_mb() -> float:
+    """
+    Return the peak resident set size of the current process, in MiB. Linux reports it in KiB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Timer:
+    def __init__(self):
+        """
+        Measure the wall-clock seconds spent in a with block, as elapsed.
+        """
+        self.started_at = None
+        self.elapsed = 0.0
+
+    def __enter__(self) -> 'Timer':
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.elapsed = time.perf_counter() - self.started_at
@@ -0,0 +1,127 @@
+import csv
+import os
+import re
+import tempfile
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from benchmarks.ingest_benchmark import scale_corpus
+from benchmarks.measure import Timer, latency_summary
+from core.fake_embedding import FakeEmbeddings
+from core.index_factory import INDEX_TYPES
+from handler.insert_csv import InsertCSV
+from retrieval.retriever import Retriever
+
+# The suffix scale_corpus and the queries give a text, which the topic of the text leaves out
+VARIANT_PATTERN = re.compile(r' \((copy|query) \d+\)$')
+
+
+class TopicEmbeddings(FakeEmbeddings):
+    def __init__(self, topic_weight: float = 0.8, **kwargs):
+        """
+        Fake embeddings where the copies of a row and the queries about it lie close together, around
+        the vector of the row, so nearest neighbour search has clusters to find like with a real model.
+
+        Args:
+        - topic_weight (float): How much of a vector is the vector of its row, between 0 and 1.
+        """
+        super().__init__(**kwargs)
+        self.topic_weight = topic_weight
+
+    def vector(self, text: str) -> List[float]:
+        topic = np.array(super().vector(VARIANT_PATTERN.sub('', text)))
+        vector = self.topic_weight * topic + (1 - self.topic_weight) * np.array(super().vector(text))
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+def recall_at_k(found: List[List[int]], truth: np.ndarray) -> float:
+    """
+    Return the mean fraction of the exact k nearest neighbours found per query.
+
+    Args:
+    - found (List[List[int]]): The positions found per query.
+    - truth (np.ndarray): The exact positions per query, of shape (queries, k).
+    """
+    k = truth.shape[1]
+    return float(np.mean([len(set(positions) & set(row.tolist())) / k for positions, row in zip(found, truth)]))
+
+
+def run_retrieval_benchmark(csv_path: str, scale: int = 100, num_queries: int = 500, k: int = 5,
+                            batch_size: int = 64, dimension: int = 768, index_types: List[str] = None) -> List[Dict]:
+    """
+    Measure Retriever.query_vector throughput, latency and recall@k against an exact Flat search,
+    for each index type rebuilt from the same vectors.
+
+    Args:
+    - csv_path (str): The csv to scale up into the corpus, e.g. food_data.csv.
+    - scale (int): The number of copies of each row.
+    - num_queries (int): The number of queries.
+    - k (int): The number of documents per query.
+    - batch_size (int): The number of queries per Retriever.query_vectors call for the batched throughput.
+    - dimension (int): The fake embedding dimension.
+    - index_types (List[str]): The index types to measure, all of INDEX_TYPES if not given.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        rows = list(csv.DictReader(file))
+    queries = [f"{rows[i % len(rows)]['content']} (query {i})" for i in range(num_queries)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        corpus_path = os.path.join(folder, f"corpus_x{scale}.csv")
+        scale_corpus(csv_path, scale, corpus_path)
+
+        embedding = TopicEmbeddings(dimension=dimension, latency=0)
+        handler = InsertCSV('retrieval_benchmark', embedding=embedding, folder_path=folder)
+        vector_store = handler.vector_store
+        handler.insert_csv(corpus_path)
+
+        # The baseline and the ground truth are exact searches over the vectors embedded again,
+        # whatever INDEX_TYPE the store was built with
+        texts = [
+            vector_store.docstore.search(vector_store.index_to_docstore_id[position]).page_content
+            for position in range(vector_store.index.ntotal)
+        ]
+        flat_index = faiss.IndexFlatL2(dimension)
+        flat_index.add(np.array(embedding.embed_documents(texts), dtype=np.float32))
+        _, truth = flat_index.search(np.array(embedding.embed_documents(queries), dtype=np.float32), k)
+        positions = {id_: position for position, id_ in vector_store.index_to_docstore_id.items()}
+
+        for index_type in index_types or INDEX_TYPES:
+            vector_store.index = flat_index
+            with Timer() as build_timer:
+                if index_type != 'Flat':
+                    handler.VectorStore.migrate_vector_store(vector_store, index_type)
+
+            # Every configuration embeds its queries again, as a cold service would
+            retriever = Retriever()
+            latencies = []
+            found = []
+            for query in queries:
+                started_at = time.perf_counter()
+                documents = retriever.query_vector(vector_store, query, None, k=k)
+                latencies.append(time.perf_counter() - started_at)
+                found.append([positions[document.id] for document in documents])
+
+            retriever.query_cache.clear()
+            with Timer() as batch_timer:
+                for start in range(0, num_queries, batch_size):
+                    retriever.query_vectors(vector_store, queries[start:start + batch_size], k=k)
+
+            results.append({
+                "index_type": index_type,
+                # A corpus too small to train an IVF index falls back to Flat, see train_index
+                "index": type(faiss.downcast_index(vector_store.index)).__name__,
+                "documents": vector_store.index.ntotal,
+                "queries": num_queries,
+                "k": k,
+                "build_seconds": build_timer.elapsed,
+                "queries_per_second": num_queries / sum(latencies),
+                **latency_summary(latencies),
+                "batched_queries_per_second": num_queries / batch_timer.elapsed,
+                "batch_size": batch_size,
+                f"recall_at_{k}": recall_at_k(found, truth),
+            })
+    return results
@@ -0,0 +1,110 @@
+import csv
+import html
+import random
+from collections import Counter
+from typing import List
+
+from aiohttp import web
+
+# A tiny but well-formed PDF body, enough for the downloader, which never parses it
+PDF_BYTES = b"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n"
+
+
+class SyntheticSite:
+    def __init__(self, num_pages: int, fanout: int, texts: List[str], pdf_every: int = 10):
+        """
+        A local stand-in website for crawl benchmarks: num_pages pages linked as a tree, each with a distinct
+        text and links to its children, its parent and the root, and one page in pdf_every with a link to a PDF.
+
+        Requests are counted by path, to tell how many times each page was fetched.
+
+        Args:
+        - num_pages (int): The number of HTML pages.
+        - fanout (int): The number of children of each page.
+        - texts (List[str]): The paragraphs pages are made of, e.g. the contents of food_data.csv.
+        - pdf_every (int): One page in pdf_every links to a PDF of its own.
+        """
+        self.num_pages = num_pages
+        self.fanout = fanout
+        self.texts = texts
+        self.pdf_every = pdf_every
+        self.requests = Counter()
+        self.runner = None
+        self.root = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/p/{number}', self.page)
+        self.app.router.add_get('/files/{name}', self.pdf)
+
+    async def start(self) -> str:
+        """
+        Serve the site on a free local port.
+
+        Returns:
+        - str: The URL of its first page.
+        """
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.root = f"http://{host}:{port}"
+        return f"{self.root}/p/0"
+
+    async def stop(self) -> None:
+        """
+        Stop serving.
+        """
+        await self.runner.cleanup()
+
+    def page_html(self, number: int) -> str:
+        """
+        Render a page.
+
+        Args:
+        - number (int): The page number.
+        """
+        # Three paragraphs with their words shuffled by the page number, so no two pages are near-duplicates
+        # and the crawler extracts every one of them
+        rng = random.Random(number)
+        paragraphs = []
+        for text in rng.sample(self.texts, min(3, len(self.texts))):
+            words = text.split()
+            rng.shuffle(words)
+            paragraphs.append(' '.join(words))
+        children = range(number * self.fanout + 1, min(number * self.fanout + self.fanout, self.num_pages - 1) + 1)
+        links = [f"{self.root}/p/{child}" for child in children]
+        links += [f"{self.root}/p/{(number - 1) // self.fanout}", f"{self.root}/p/0"] if number else []
+        if number % self.pdf_every == 0:
+            links.append(f"{self.root}/files/document-{number}.pdf")
+
+        return (
+            f"<html><head><meta charset='utf-8'><title>Page {number}</title>"
+            f"<meta name='description' content='Synthetic page {number}'></head><body>"
+            f"<h1>Page {number}</h1>"
+            + ''.join(f"<p>{html.escape(paragraph)}</p>" for paragraph in paragraphs)
+            + ''.join(f"<a href='{link}'>{link}</a>" for link in links)
+            + "</body></html>"
+        )
+
+    async def page(self, request: web.Request) -> web.Response:
+        self.requests[request.path] += 1
+        number = int(request.match_info['number'])
+        if not 0 <= number < self.num_pages:
+            raise web.HTTPNotFound()
+        return web.Response(text=self.page_html(number), content_type='text/html', charset='utf-8')
+
+    async def pdf(self, request: web.Request) -> web.Response:
+        self.requests[request.path] += 1
+        return web.Response(body=PDF_BYTES + request.path.encode('utf-8'), content_type='application/pdf')
+
+
+def read_texts(csv_path: str) -> List[str]:
+    """
+    Read the contents of a csv with a 'content' column, e.g. food_data.csv.
+
+    Args:
+    - csv_path (str): The csv path.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        return [row['content'] for row in csv.DictReader(file) if row.get('content')]
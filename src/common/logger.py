@@ -1,5 +1,7 @@
 import logging
 
+from common.metrics import metrics
+
 class Logger:
     def __init__(self, level=logging.DEBUG, format='%(asctime)s | %(name)s | %(levelname)s | %(message)s'):
         name = self.__class__.__name__
@@ -7,22 +9,36 @@ class Logger:
         self.logger = logging.getLogger(name)
         self.logger.setLevel(level)
 
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(logging.Formatter(format))
+        # Loggers are shared by name, so the handler is only attached by the first instance of a class
+        if not getattr(self.logger, 'console_handler', None):
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter(format))
+            self.logger.addHandler(console_handler)
+            self.logger.console_handler = console_handler
+
+        self.metrics = metrics
+
+    # Messages take %-style args, only formatted if the level is enabled: self.info("Fetched %s", url)
+    def debug(self, message, *args):
+        self.logger.debug(message, *args)
 
-        self.logger.addHandler(console_handler)
+    def info(self, message, *args):
+        self.logger.info(message, *args)
 
-    def debug(self, message):
-        self.logger.debug(message)
+    def warning(self, message, *args):
+        self.logger.warning(message, *args)
 
-    def info(self, message):
-        self.logger.info(message)
+    def error(self, message, *args):
+        self.logger.error(message, *args)
 
-    def warning(self, message):
-        self.logger.warning(message)
+    def critical(self, message, *args):
+        self.logger.critical(message, *args)
 
-    def error(self, message):
-        self.logger.error(message)
+    def span(self, name, **labels):
+        '''
+        Time a block of code into the shared metrics, see MetricsRegistry.span
 
-    def critical(self, message):
-        self.logger.critical(message)
\ No newline at end of file
+        Args:
+        - name (str): the span name, e.g. fetch, parse, embed, index_add, save, load or search
+        '''
+        return self.metrics.span(name, **labels)
@@ -0,0 +1,515 @@
+import bisect
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+# Latency buckets in seconds, from half a millisecond to a minute
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = 'datavengers'
+
+# The span the running code is in, per thread and asyncio task
+current_span: ContextVar = ContextVar('current_span', default=None)
+
+
+def label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    """
+    Turn labels into a hashable key, the same whatever their order.
+
+    Args:
+    - labels (Dict[str, str]): The labels.
+    """
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(key: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    """
+    Format labels the way the Prometheus text format writes them.
+
+    Args:
+    - key (Tuple[Tuple[str, str], ...]): The labels, see label_key.
+    - extra (str): More labels, such as the bucket bound.
+    """
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        A histogram over fixed buckets: observing a value is a binary search and an increment,
+        cheap enough for every request.
+
+        Args:
+        - buckets (Tuple[float, ...]): The upper bounds of the buckets, ascending.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile by interpolating within its bucket, like Prometheus' histogram_quantile.
+
+        Args:
+        - q (float): The quantile, between 0 and 1.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Span:
+    def __init__(self, registry: 'MetricsRegistry', name: str, labels: Dict[str, str]):
+        """
+        Time a block of code into the span_seconds histogram of its name, see MetricsRegistry.span.
+        """
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.parent = None
+        self.token = None
+        self.started_at = 0.0
+
+    def __enter__(self) -> 'Span':
+        self.parent = current_span.get()
+        self.token = current_span.set(self)
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        duration = time.perf_counter() - self.started_at
+        current_span.reset(self.token)
+        self.registry.finish_span(self, duration, exc_type is not None)
+
+
+class NoopSpan:
+    """
+    The span handed out while metrics are disabled.
+    """
+    def __enter__(self) -> 'NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        return None
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True, trace_sample_rate: float = 0.0, trace_buffer_size: int = 1000):
+        """
+        Counters, gauges and latency histograms shared by every component, with spans timing the hot paths
+        (fetch, parse, embed, index_add, save, load, search) into histograms by name.
+
+        A fraction of the spans can also be kept as traces, with their parent span, in a bounded buffer.
+        Everything is kept in memory and read by the exporters: a periodic JSON snapshot or a Prometheus
+        text endpoint, see start_exporters.
+
+        Args:
+        - enabled (bool): Record anything at all. Disabled, spans and counters cost a function call.
+        - trace_sample_rate (float): The fraction of spans kept as traces, between 0 and 1.
+        - trace_buffer_size (int): The number of most recent traces kept.
+        """
+        self.enabled = enabled
+        self.trace_sample_rate = trace_sample_rate
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.traces = deque(maxlen=trace_buffer_size)
+        self.spans_seen = 0
+        self.started_at = time.time()
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Add to a counter.
+
+        Args:
+        - name (str): The counter name, e.g. 'pages_fetched'.
+        - value (float): The amount to add.
+        - labels (str): The labels of the counter.
+        """
+        if not self.enabled:
+            return
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        """
+        Set a gauge, e.g. the number of vectors of a store.
+
+        Args:
+        - name (str): The gauge name.
+        - value (float): The value.
+        - labels (str): The labels of the gauge.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[(name, label_key(labels))] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Add a value to a histogram.
+
+        Args:
+        - name (str): The histogram name.
+        - value (float): The value, in seconds for latencies.
+        - labels (str): The labels of the histogram.
+        """
+        if not self.enabled:
+            return
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def span(self, name: str, **labels: str):
+        """
+        Time a block of code: with metrics.span('search', store=name): ...
+
+        The duration goes to the span_seconds histogram labelled with the span name, and failures
+        are counted in span_errors.
+
+        Args:
+        - name (str): The span name, e.g. 'fetch'.
+        - labels (str): More labels, kept few and of low cardinality.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, labels)
+
+    def finish_span(self, span: Span, duration: float, failed: bool) -> None:
+        key = ('span_seconds', label_key({'span': span.name, **span.labels}))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(duration)
+            if failed:
+                error_key = ('span_errors', key[1])
+                self.counters[error_key] = self.counters.get(error_key, 0) + 1
+
+            # Every n-th span is traced rather than a random one, which needs no random number per span
+            self.spans_seen += 1
+            if self.trace_sample_rate and self.spans_seen % max(1, round(1 / self.trace_sample_rate)) == 0:
+                self.traces.append({
+                    "span": span.name,
+                    "labels": span.labels,
+                    "parent": span.parent.name if span.parent else None,
+                    "thread": threading.current_thread().name,
+                    "started_at": time.time() - duration,
+                    "seconds": duration,
+                    "failed": failed,
+                })
+
+    def snapshot(self) -> Dict:
+        """
+        Return every metric as plain data, with the p50 and p99 of each histogram.
+        """
+        with self.lock:
+            counters = list(self.counters.items())
+            gauges = list(self.gauges.items())
+            histograms = [(key, histogram.count, histogram.sum, histogram.quantile(0.5), histogram.quantile(0.99))
+                          for key, histogram in self.histograms.items()]
+            traces = list(self.traces)
+        return {
+            "timestamp": time.time(),
+            "uptime_seconds": time.time() - self.started_at,
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in counters],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in gauges],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "count": count, "sum": total, "p50": p50, "p99": p99}
+                for (name, labels), count, total, p50, p99 in histograms
+            ],
+            "traces": traces,
+        }
+
+    def prometheus_text(self) -> str:
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    metric = f"{METRIC_PREFIX}_{name}_total" if kind == 'counter' else f"{METRIC_PREFIX}_{name}"
+                    lines.append(f"# TYPE {metric} {kind}")
+                    lines.extend(
+                        f"{metric}{format_labels(labels)} {value}"
+                        for (other, labels), value in metrics.items() if other == name
+                    )
+            for name in sorted({name for name, _ in self.histograms}):
+                metric = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for (other, labels), histogram in self.histograms.items():
+                    if other != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{format_labels(labels, le=str(bound))} {cumulative}")
+                    lines.append(f"{metric}_bucket{format_labels(labels, le='+Inf')} {histogram.count}")
+                    lines.append(f"{metric}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """
+        Forget every metric and trace.
+        """
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+            self.traces.clear()
+            self.spans_seen = 0
+            self.started_at = time.time()
+
+
+# The registry every component records into
+metrics = MetricsRegistry()
+
+
+def timed(name: str, **labels: str):
+    """
+    Decorate a function so every call is timed as a span of the shared registry.
+
+    Args:
+    - name (str): The span name.
+    - labels (str): More labels of the span.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.span(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, max_depth: int = 64, output_path: str = 'profile.collapsed'):
+        """
+        A sampling profiler: a daemon thread reads the stack of every other thread every interval
+        and counts the stacks it sees. The threads being profiled do no extra work.
+
+        The counts are written in the collapsed format flamegraph.pl and speedscope read.
+
+        Args:
+        - interval (float): The seconds between samples.
+        - max_depth (int): The number of innermost frames kept per stack.
+        - output_path (str): Where stop_exporters saves the stacks.
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.output_path = output_path
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self) -> 'SamplingProfiler':
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """
+        Return the sampled stacks in the collapsed format, one 'frame;frame;frame count' line each.
+        """
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common()) + '\n'
+
+    def save(self, path: str) -> None:
+        """
+        Write the sampled stacks in the collapsed format.
+
+        Args:
+        - path (str): The output file.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.collapsed())
+
+
+class SnapshotWriter:
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float = 60):
+        """
+        Write a JSON snapshot of the metrics every interval, and once more when stopped,
+        replacing the file atomically so readers never see it half written.
+
+        Args:
+        - registry (MetricsRegistry): The metrics.
+        - path (str): The snapshot file.
+        - interval (float): The seconds between snapshots.
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self) -> 'SnapshotWriter':
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='metrics-snapshot', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.write()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self) -> None:
+        try:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            with open(f"{self.path}.tmp", 'w', encoding='utf-8') as file:
+                json.dump(self.registry.snapshot(), file, ensure_ascii=False)
+            os.replace(f"{self.path}.tmp", self.path)
+        except Exception:
+            print(f"Can not write the metrics snapshot, traceback = {traceback.format_exc()}", file=sys.stderr)
+
+
+def serve_prometheus(registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9100) -> ThreadingHTTPServer:
+    """
+    Serve the metrics in the Prometheus text format on /metrics, and as JSON on /metrics.json,
+    from a daemon thread.
+
+    Args:
+    - registry (MetricsRegistry): The metrics.
+    - host (str): The interface to listen on, only the local machine by default.
+    - port (int): The port.
+
+    Returns:
+    - ThreadingHTTPServer: The server, to shut down.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = registry.prometheus_text().encode('utf-8'), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(registry.snapshot()).encode('utf-8'), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def start_exporters(config_data: Dict, registry: MetricsRegistry = metrics) -> List[object]:
+    """
+    Configure the registry and start the exporters set in the config:
+    METRICS_ENABLED, TRACE_SAMPLE_RATE, METRICS_SNAPSHOT_PATH with METRICS_SNAPSHOT_INTERVAL,
+    METRICS_PORT with METRICS_HOST, and PROFILER_INTERVAL_MS with PROFILER_OUTPUT_PATH.
+
+    The endpoint listens on 127.0.0.1 unless METRICS_HOST says otherwise: the metrics expose
+    URLs, queries and timings, so exposing them to the network is a choice made in the config.
+
+    Args:
+    - config_data (Dict): The loaded config.yaml.
+    - registry (MetricsRegistry): The metrics.
+
+    Returns:
+    - List[object]: The started exporters and profiler, to stop with stop_exporters.
+    """
+    registry.enabled = config_data.get('METRICS_ENABLED', True)
+    registry.trace_sample_rate = config_data.get('TRACE_SAMPLE_RATE', 0.0)
+    exporters = []
+    if not registry.enabled:
+        return exporters
+
+    if config_data.get('METRICS_SNAPSHOT_PATH'):
+        exporters.append(SnapshotWriter(
+            registry, config_data['METRICS_SNAPSHOT_PATH'], interval=config_data.get('METRICS_SNAPSHOT_INTERVAL', 60)
+        ).start())
+    if config_data.get('METRICS_PORT'):
+        exporters.append(serve_prometheus(registry, config_data.get('METRICS_HOST', '127.0.0.1'), config_data['METRICS_PORT']))
+    if config_data.get('PROFILER_INTERVAL_MS'):
+        exporters.append(SamplingProfiler(
+            interval=config_data['PROFILER_INTERVAL_MS'] / 1000,
+            output_path=config_data.get('PROFILER_OUTPUT_PATH', 'profile.collapsed'),
+        ).start())
+    return exporters
+
+
+def stop_exporters(exporters: List[object]) -> None:
+    """
+    Stop the exporters: write the last snapshot, close the endpoint and save the profile
+    to the profiler's output_path.
+
+    Args:
+    - exporters (List[object]): The exporters returned by start_exporters.
+    """
+    for exporter in exporters:
+        if isinstance(exporter, ThreadingHTTPServer):
+            exporter.shutdown()
+        elif isinstance(exporter, SamplingProfiler):
+            exporter.stop()
+            exporter.save(exporter.output_path)
+        else:
+            exporter.stop()
@@ -0,0 +1,232 @@
+import re
+from typing import Dict, Iterable, List, Set, Tuple
+
+from langchain_core.documents import Document
+
+from common.logger import Logger
+from core.embedding_scheduler import estimate_tokens
+
+BLOCK_PATTERN = re.compile(r'[^\n]+')
+WORD_PATTERN = re.compile(r'\S+')
+# Lines this short, without closing punctuation, are treated as headings
+HEADING_MAX_WORDS = 12
+SENTENCE_ENDINGS = ('.', '!', '?', ':', ';', ',', '…')
+
+
+class Chunker(Logger):
+    def __init__(self, max_tokens: int = 512, overlap_tokens: int = 64, boilerplate_lines: Set[str] = None,
+                 boilerplate_min_documents: int = 2):
+        """
+        Split long documents into token-bounded chunks before they are embedded.
+
+        Texts are split on their structure: crawled pages put every element on its own line,
+        so lines are the paragraphs, and a heading line starts a new chunk once the current one
+        holds a reasonable amount of text. Consecutive chunks overlap by up to overlap_tokens.
+
+        Short boilerplate lines such as menu entries and footers are dropped. They are learned once
+        from a whole source, see learn_boilerplate, and given here: the chunks of a document only depend
+        on the document and that fixed set, never on the other documents split before it, so the same
+        page always gets the same chunks and the same ids.
+
+        Args:
+        - max_tokens (int): The maximum estimated number of tokens per chunk.
+        - overlap_tokens (int): The estimated number of tokens repeated at the start of the next chunk.
+        - boilerplate_lines (Set[str]): The normalized boilerplate lines to drop, none if not given.
+        - boilerplate_min_documents (int): A short line appearing in more documents than this is learned
+          as boilerplate.
+        """
+        super().__init__()
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.boilerplate_lines = boilerplate_lines or set()
+        self.boilerplate_min_documents = boilerplate_min_documents
+        self.dropped_lines = 0
+
+    def is_heading(self, block: str) -> bool:
+        """
+        Guess whether a line of text is a heading.
+
+        Args:
+        - block (str): The line.
+        """
+        return len(block.split()) <= HEADING_MAX_WORDS and not block.rstrip().endswith(SENTENCE_ENDINGS)
+
+    def split_blocks(self, text: str) -> List[Tuple[int, int, int, bool]]:
+        """
+        Split a text into blocks no longer than max_tokens.
+
+        Args:
+        - text (str): The text.
+
+        Returns:
+        - List[Tuple[int, int, int, bool]]: The start offset, end offset, estimated tokens and heading flag
+          of every block.
+        """
+        blocks = []
+        for match in BLOCK_PATTERN.finditer(text):
+            block = match.group().strip()
+            if not block:
+                continue
+            tokens = estimate_tokens(block)
+            if tokens <= self.max_tokens:
+                blocks.append((match.start(), match.end(), tokens, self.is_heading(block)))
+                continue
+
+            # A paragraph longer than a chunk is split on words
+            start = end = match.start()
+            for word in WORD_PATTERN.finditer(match.group()):
+                word_end = match.start() + word.end()
+                if estimate_tokens(text[start:word_end]) > self.max_tokens and end > start:
+                    blocks.append((start, end, estimate_tokens(text[start:end]), False))
+                    start = match.start() + word.start()
+                end = word_end
+            blocks.append((start, end, estimate_tokens(text[start:end]), False))
+        return blocks
+
+    def short_lines(self, text: str, blocks: List[Tuple[int, int, int, bool]]) -> Dict[Tuple[int, int], str]:
+        """
+        Return the normalized short lines of a text, the ones that may be boilerplate, by block span.
+
+        Args:
+        - text (str): The text.
+        - blocks (List[Tuple[int, int, int, bool]]): Its blocks, see split_blocks.
+        """
+        return {
+            (block[0], block[1]): ' '.join(text[block[0]:block[1]].split()).lower()
+            for block in blocks if block[3]
+        }
+
+    def learn_boilerplate(self, batches: Iterable[Iterable[Document]]) -> Set[str]:
+        """
+        Learn the boilerplate lines of a source: the short lines appearing in more than
+        boilerplate_min_documents of its documents.
+
+        Args:
+        - batches (Iterable[Iterable[Document]]): All the documents of the source, in batches.
+
+        Returns:
+        - Set[str]: The normalized boilerplate lines.
+        """
+        line_counts: Dict[str, int] = {}
+        for documents in batches:
+            for document in documents:
+                text = document.page_content
+                for line in set(self.short_lines(text, self.split_blocks(text)).values()):
+                    line_counts[line] = line_counts.get(line, 0) + 1
+        return {line for line, count in line_counts.items() if count > self.boilerplate_min_documents}
+
+    def drop_boilerplate_lines(self, text: str,
+                               blocks: List[Tuple[int, int, int, bool]]) -> List[Tuple[int, int, int, bool]]:
+        """
+        Drop the short lines of a document that are boilerplate.
+
+        Args:
+        - text (str): The text of the document.
+        - blocks (List[Tuple[int, int, int, bool]]): Its blocks, see split_blocks.
+
+        Returns:
+        - List[Tuple[int, int, int, bool]]: The blocks that are not boilerplate.
+        """
+        lines = self.short_lines(text, blocks)
+        kept = [block for block in blocks if lines.get((block[0], block[1])) not in self.boilerplate_lines]
+        self.dropped_lines += len(blocks) - len(kept)
+        return kept
+
+    def overlap_tail(self, text: str, window: List[Tuple[int, int, int, bool]],
+                     next_tokens: int) -> List[Tuple[int, int, int, bool]]:
+        """
+        Pick the tail of a closed chunk that is repeated at the start of the next one.
+
+        Whole blocks are carried over while they fit in overlap_tokens. If not even the last block fits,
+        its last words are carried over instead.
+
+        Args:
+        - text (str): The text being split.
+        - window (List[Tuple[int, int, int, bool]]): The blocks of the closed chunk.
+        - next_tokens (int): The tokens of the block that opens the next chunk.
+
+        Returns:
+        - List[Tuple[int, int, int, bool]]: The blocks to carry over.
+        """
+        budget = min(self.overlap_tokens, self.max_tokens - next_tokens)
+        overlap: List[Tuple[int, int, int, bool]] = []
+        overlap_tokens = 0
+        # Never carry the whole closed chunk over, or no progress is made
+        for block in reversed(window[1:]):
+            if overlap_tokens + block[2] > budget:
+                break
+            overlap.insert(0, block)
+            overlap_tokens += block[2]
+        if overlap or budget <= 0:
+            return overlap
+
+        start, end = window[-1][0], window[-1][1]
+        tail_start = end
+        for word in reversed(list(WORD_PATTERN.finditer(text, start, end))):
+            if estimate_tokens(text[word.start():end]) > budget:
+                break
+            tail_start = word.start()
+        if start < tail_start < end:
+            return [(tail_start, end, estimate_tokens(text[tail_start:end]), False)]
+        return []
+
+    def split_text(self, text: str, blocks: List[Tuple[int, int, int, bool]] = None) -> List[Tuple[str, int, int]]:
+        """
+        Split a text into overlapping, token-bounded chunks.
+
+        Args:
+        - text (str): The text.
+        - blocks (List[Tuple[int, int, int, bool]]): Its blocks, if already split, see split_blocks.
+
+        Returns:
+        - List[Tuple[str, int, int]]: The text, start offset and end offset of every chunk.
+        """
+        blocks = blocks if blocks is not None else self.split_blocks(text)
+        chunks = []
+        window: List[Tuple[int, int, int, bool]] = []
+        window_tokens = 0
+
+        def close_window():
+            chunk_text = '\n'.join(text[start:end].strip() for start, end, _, _ in window)
+            chunks.append((chunk_text, window[0][0], window[-1][1]))
+
+        for block in blocks:
+            tokens, heading = block[2], block[3]
+            starts_section = heading and window_tokens >= self.max_tokens // 4
+            if window and (window_tokens + tokens > self.max_tokens or starts_section):
+                close_window()
+                # A new section starts clean, anything else carries the tail of the closed chunk over
+                window = [] if starts_section else self.overlap_tail(text, window, tokens)
+                window_tokens = sum(previous[2] for previous in window)
+            window.append(block)
+            window_tokens += tokens
+
+        if window:
+            close_window()
+        return chunks
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """
+        Split documents into chunk documents, carrying the parent metadata over.
+
+        Every chunk gets its index and its character offsets in the parent text, next to the parent's
+        own metadata such as its url. The chunks of a document do not depend on the other documents.
+
+        Args:
+        - documents (Iterable[Document]): The documents to split.
+
+        Returns:
+        - List[Document]: The chunks.
+        """
+        chunks = []
+        for document in documents:
+            text = document.page_content
+            blocks = self.split_blocks(text)
+            if self.boilerplate_lines:
+                blocks = self.drop_boilerplate_lines(text, blocks)
+
+            for index, (chunk_text, start, end) in enumerate(self.split_text(text, blocks)):
+                metadata = dict(document.metadata)
+                metadata.update({'chunk_index': index, 'start_offset': start, 'end_offset': end})
+                chunks.append(Document(page_content=chunk_text, metadata=metadata))
+        return chunks
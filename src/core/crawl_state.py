@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, List, Set, Tuple, Union
+
+from common.logger import Logger
+
+
+class CrawlState(Logger):
+    def __init__(self, db_path: str, commit_every: int = 100, commit_interval: float = 5.0):
+        """
+        Persist the crawl frontier and per-URL validators to SQLite, so a crawl can resume
+        after being killed and re-crawls can send conditional requests. The hashes and SimHash
+        fingerprints of the contents extracted by the current crawl are kept too, so a resumed
+        crawl still skips duplicates of the pages extracted before it was killed.
+
+        Writes are committed in batches, always in order, so the store on disk is a consistent
+        prefix of the crawl: at worst the last batch of pages is crawled again on resume.
+
+        The before_commit hook runs ahead of every commit. The crawler points it at the flush of its
+        output sink, so the records of a batch are written out before the batch is marked done, and the
+        sink never writes out records of pages the state will crawl again.
+
+        Args:
+        - db_path (str): The path to the SQLite database file.
+        - commit_every (int): The number of writes between two commits.
+        - commit_interval (float): The maximum number of seconds a write stays uncommitted.
+        """
+        super().__init__()
+        folder = os.path.dirname(db_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.pending_writes = 0
+        self.committed_at = time.monotonic()
+        self.before_commit: Union[Callable[[], None], None] = None
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            "url TEXT PRIMARY KEY, depth INTEGER NOT NULL, done INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, "
+            "links TEXT, pdf_links TEXT, crawled_at REAL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS contents (url TEXT PRIMARY KEY, content_hash TEXT NOT NULL, simhash TEXT)"
+        )
+        self.connection.commit()
+        self.info(f"Opened crawl state: {db_path}")
+
+    def write(self, sql: str, parameters: tuple) -> None:
+        """
+        Execute a write statement, committing once enough writes have accumulated.
+
+        Args:
+        - sql (str): The statement to execute.
+        - parameters (tuple): The statement parameters.
+        """
+        self.connection.execute(sql, parameters)
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every or time.monotonic() - self.committed_at >= self.commit_interval:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Commit all pending writes, after running the before_commit hook.
+        """
+        if self.before_commit:
+            self.before_commit()
+        self.connection.commit()
+        self.pending_writes = 0
+        self.committed_at = time.monotonic()
+
+    def has_pending(self) -> bool:
+        """
+        Check whether a previous crawl stopped before draining its frontier.
+        """
+        return self.connection.execute("SELECT 1 FROM frontier WHERE done = 0 LIMIT 1").fetchone() is not None
+
+    def has_pages(self) -> bool:
+        """
+        Check whether an earlier crawl recorded pages, so this one only passes changed pages downstream.
+        """
+        return self.connection.execute("SELECT 1 FROM pages LIMIT 1").fetchone() is not None
+
+    def pending(self) -> List[Tuple[str, int]]:
+        """
+        Return the (url, depth) pairs that were enqueued but not crawled yet, shallowest first.
+        """
+        return self.connection.execute(
+            "SELECT url, depth FROM frontier WHERE done = 0 ORDER BY depth"
+        ).fetchall()
+
+    def frontier_urls(self) -> Set[str]:
+        """
+        Return every URL enqueued by the current crawl, crawled or not.
+        """
+        return {url for url, in self.connection.execute("SELECT url FROM frontier")}
+
+    def start_run(self) -> None:
+        """
+        Forget the frontier and the contents of the last completed crawl, keeping the per-URL validators.
+        """
+        self.connection.execute("DELETE FROM frontier")
+        self.connection.execute("DELETE FROM contents")
+        self.commit()
+
+    def finish_run(self) -> None:
+        """
+        Mark the current crawl as completed.
+        """
+        self.start_run()
+
+    def enqueue(self, url: str, depth: int) -> None:
+        """
+        Record a URL added to the frontier.
+
+        Args:
+        - url (str): The URL.
+        - depth (int): Its crawl depth.
+        """
+        self.write("INSERT OR IGNORE INTO frontier (url, depth) VALUES (?, ?)", (url, depth))
+
+    def mark_done(self, url: str) -> None:
+        """
+        Record that a URL of the frontier has been crawled.
+
+        Args:
+        - url (str): The URL.
+        """
+        self.write("UPDATE frontier SET done = 1 WHERE url = ?", (url,))
+
+    def get_page(self, url: str) -> Union[Dict[str, Union[str, List[str]]], None]:
+        """
+        Return what the last crawl learned about a URL.
+
+        Args:
+        - url (str): The URL.
+
+        Returns:
+        - Dict[str, Union[str, List[str]]]: The ETag, Last-Modified, content hash, links and PDF links
+          of the page, or None if it was never crawled.
+        """
+        row = self.connection.execute(
+            "SELECT etag, last_modified, content_hash, links, pdf_links FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, content_hash, links, pdf_links = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": content_hash,
+            "links": json.loads(links) if links else [],
+            "pdf_links": json.loads(pdf_links) if pdf_links else [],
+        }
+
+    def save_page(self, url: str, etag: str, last_modified: str, content_hash: str,
+                  links: List[str], pdf_links: List[str]) -> None:
+        """
+        Record the validators, content hash and outgoing links of a crawled page.
+
+        Args:
+        - url (str): The URL.
+        - etag (str): The ETag response header.
+        - last_modified (str): The Last-Modified response header.
+        - content_hash (str): The hash of the page contents.
+        - links (List[str]): The crawlable links found on the page.
+        - pdf_links (List[str]): The PDF links found on the page.
+        """
+        self.write(
+            "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, links, pdf_links, crawled_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_hash, json.dumps(links), json.dumps(pdf_links), time.time()),
+        )
+
+    def save_contents(self, url: str, content_hash: str, simhash: Union[int, None]) -> None:
+        """
+        Record the contents of a page checked for duplicates by the current crawl.
+
+        Args:
+        - url (str): The URL.
+        - content_hash (str): The hash of the page contents.
+        - simhash (int): The SimHash fingerprint of the page text, if it was indexed for near-duplicates.
+        """
+        self.write(
+            "INSERT OR REPLACE INTO contents (url, content_hash, simhash) VALUES (?, ?, ?)",
+            # SQLite integers are signed, so the 64-bit fingerprint is stored as hex
+            (url, content_hash, None if simhash is None else format(simhash, '016x')),
+        )
+
+    def seen_contents(self) -> List[Tuple[str, str, Union[int, None]]]:
+        """
+        Return the (url, content hash, SimHash fingerprint) of the pages the current crawl has checked
+        for duplicates and marked done. A page checked but not marked done is crawled again on resume,
+        and must not be taken for a duplicate of itself.
+        """
+        rows = self.connection.execute(
+            "SELECT contents.url, content_hash, simhash FROM contents "
+            "JOIN frontier ON frontier.url = contents.url WHERE done = 1"
+        ).fetchall()
+        return [(url, content_hash, None if simhash is None else int(simhash, 16))
+                for url, content_hash, simhash in rows]
+
+    def close(self) -> None:
+        """
+        Commit pending writes and close the database.
+        """
+        self.commit()
+        self.connection.close()
@@ -1,17 +1,34 @@
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urljoin
-import os
-import pandas as pd
 import hashlib
-from typing import List, Dict, Union, Set
+import json
+import os
+import re
+import time
+from typing import List, Dict, Union, Set, Tuple
 from common.logger import Logger
+from core.crawl_state import CrawlState
+from core.http_policy import (AdaptiveConcurrency, HostRateLimiter, RETRY_STATUSES, THROTTLE_STATUSES,
+                              backoff_delay, create_connector, parse_retry_after)
+from core.near_duplicate import SimHashIndex
+from core.output_sink import RecordSink, open_sink, read_feed_info, write_feed_info
+from core.page_parser import parse_page
 import aiofiles
-import chardet
+
+OUTPUT_FIELDS = ["url", "title", "metadata", "contents"]
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-')
+
 
 class DataCrawler(Logger):
-    def __init__(self, base_url: str = None, max_depth: int = None, download_folder: str = None):
+    def __init__(self, base_url: str = None, max_depth: int = None, download_folder: str = None,
+                 num_workers: int = None, parser: str = None, parse_executor: str = None,
+                 parse_workers: int = None, max_connections: int = None, max_connections_per_host: int = None,
+                 requests_per_second: float = None, max_concurrency: int = None, target_latency: float = None,
+                 retries: int = None, timeout: float = None, state_path: str = None,
+                 near_duplicate_threshold: float = None):
         """
         Initialize the DataCrawler with optional parameters.
 
@@ -19,285 +36,571 @@ class DataCrawler(Logger):
         - base_url (str): The starting URL for the crawl.
         - max_depth (int): The maximum depth for recursive crawling.
         - download_folder (str): The folder where PDF files will be saved.
+        - num_workers (int): The number of async workers draining the crawl frontier.
+        - parser (str): The BeautifulSoup parser backend, 'html.parser' (default) or 'lxml'.
+        - parse_executor (str): Where pages are decoded and parsed, 'inline' (default) on the event loop
+          or 'process' in a process pool.
+        - parse_workers (int): The number of parser processes when parse_executor is 'process'.
+        - max_connections (int): The maximum number of open connections in total.
+        - max_connections_per_host (int): The maximum number of open connections to a single host.
+        - requests_per_second (float): The rate limit applied to each host, or None for no limit.
+        - max_concurrency (int): The upper bound of the adaptive limit on in-flight requests.
+        - target_latency (float): Responses slower than this, in seconds, make the crawler back off.
+        - retries (int): The number of attempts per request.
+        - timeout (float): The timeout for a single page request, in seconds.
+        - state_path (str): The SQLite file persisting the crawl state. When set, a killed crawl resumes
+          where it stopped and re-crawls only pass changed pages downstream.
+        - near_duplicate_threshold (float): The SimHash similarity, between 0 and 1, from which the text
+          of a page counts as a near-duplicate of an already extracted page and is skipped.
         """
         super().__init__()
         self.base_url = base_url if base_url else "https://tuyensinh.uel.edu.vn"
         self.page_urls: List[str] = []
-        self.page_contents: List[Dict[str, Union[str, List[str]]]] = []
+        self.output_sink: Union[RecordSink, None] = None
+        self.pages_extracted = 0
         self.pdf_urls: Set[str] = set()
         self.visited_urls: Set[str] = set()
         self.visited_hashes: Set[str] = set()  # For content deduplication
+        self.near_duplicates = SimHashIndex(
+            similarity_threshold=near_duplicate_threshold if near_duplicate_threshold else 0.95
+        )
         self.max_depth = max_depth if max_depth else 0
+        self.num_workers = num_workers if num_workers else 10
+        self.parser = parser if parser else 'html.parser'
+        self.parse_executor = parse_executor if parse_executor else 'inline'
+        self.parse_workers = parse_workers if parse_workers else os.cpu_count()
+        self.parse_pool: Union[ProcessPoolExecutor, None] = None
+        self.max_connections = max_connections if max_connections else 100
+        self.max_connections_per_host = max_connections_per_host if max_connections_per_host else 8
+        self.retries = retries if retries else 5
+        self.timeout = timeout if timeout else 30
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.concurrency = AdaptiveConcurrency(
+            initial=self.max_connections_per_host,
+            maximum=max_concurrency if max_concurrency else 64,
+            target_latency=target_latency if target_latency else 5.0,
+        )
+        self.state_path = state_path
+        self.crawl_state: Union[CrawlState, None] = None
         self.download_folder = download_folder if download_folder else "src/database/extracted_files/pdf_files"
 
         # Exclude social media prefixes and video file extensions
         self.excluded_prefixes = ['facebook', 'linkedin', 'zalo', 'tiktok', 'google']
         self.excluded_extensions = ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mkv']
 
-        if not os.path.exists(self.download_folder):
-            os.makedirs(self.download_folder)
+        if self.parser == 'lxml':
+            try:
+                import lxml  # noqa: F401
+            except ImportError:
+                self.warning("lxml is not installed, falling back to 'html.parser'.")
+                self.parser = 'html.parser'
+
+        # Partial downloads live in a hidden folder until they are complete and renamed by content hash
+        self.partial_folder = os.path.join(self.download_folder, ".partial")
+        if not os.path.exists(self.partial_folder):
+            os.makedirs(self.partial_folder)
+
+        self.manifest_path = os.path.join(self.download_folder, "manifest.json")
+        self.pdf_manifest: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as manifest_file:
+                self.pdf_manifest = json.load(manifest_file)
 
         self.info(f"Initialized DataCrawler with base_url: {self.base_url}")
 
-    async def fetch_text_with_retries(self, session, url, retries=3, delay=1, timeout=10):
+    async def read_response(self, response: aiohttp.ClientResponse) -> Tuple[bytes, Union[str, None]]:
         """
-        Fetch the text content of a URL with retries in case of transient failures.
+        Default response handler: read the whole body.
 
         Args:
-        - session (aiohttp.ClientSession): The current session for HTTP requests.
-        - url (str): The URL to fetch content from.
-        - retries (int): The number of retry attempts.
-        - delay (int): The delay between retries in seconds.
-        - timeout (int): The timeout for the request in seconds.
+        - response (aiohttp.ClientResponse): The successful response.
 
         Returns:
-        - str: The decoded HTML content, or None if all retries fail.
+        - Tuple[bytes, str]: The raw body and the charset from the response headers.
         """
-        for attempt in range(retries):
-            try:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
-                    raw_data = await response.read()
-                    encoding = chardet.detect(raw_data)['encoding']
-
-                    if encoding is None:
-                        self.warning(f"Encoding detection failed for URL: {url}. Falling back to 'ISO-8859-1'.")
-                        encoding = 'ISO-8859-1'
-
-                    html = raw_data.decode(encoding, errors='replace')
-                    return html
+        return await response.read(), response.charset
 
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                if attempt < retries - 1:
-                    self.warning(f"Request failed for {url}: {e}. Retrying in {delay} seconds...")
-                    await asyncio.sleep(delay)
-                else:
-                    self.error(f"Request failed for {url}: {e}. No more retries.")
-                    return None
-
-    async def fetch_binary_with_retries(self, session, url, retries=3, delay=1, timeout=20):
+    async def request_with_retries(self, session, url, timeout=None, headers=None, handler=None):
         """
-        Fetch the binary content of a URL with retries in case of transient failures.
+        Request a URL under the crawl's rate limit and concurrency limit, retrying transient failures.
+
+        Failed attempts and 429/5xx responses are retried with exponential backoff and jitter,
+        honoring the server's Retry-After header when it sends one.
 
         Args:
         - session (aiohttp.ClientSession): The current session for HTTP requests.
-        - url (str): The URL to fetch content from.
-        - retries (int): The number of retry attempts.
-        - delay (int): The delay between retries in seconds.
-        - timeout (int): The timeout for the request in seconds.
+        - url (str): The URL to fetch.
+        - timeout (float): The timeout for the request in seconds, defaults to the crawler's timeout.
+        - headers (dict or callable): Extra request headers, or a function returning them for every attempt.
+        - handler (callable): An async function consuming the response and returning the result,
+          defaults to read_response.
 
         Returns:
-        - bytes: The binary content, or None if all retries fail.
+        - object: The handler's result, or None if all retries fail.
         """
-        for attempt in range(retries):
+        timeout = timeout if timeout else self.timeout
+        handler = handler if handler else self.read_response
+
+        for attempt in range(self.retries):
+            await self.rate_limiter.acquire(url)
+            await self.concurrency.acquire()
+            started_at = time.monotonic()
+            latency, throttled, retry_after = None, False, None
             try:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
-                    return await response.read()
+                request_headers = headers() if callable(headers) else headers
+                async with session.get(url, headers=request_headers,
+                                       timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    # The time to the response headers is the server's latency; reading the body,
+                    # e.g. streaming a large PDF, takes as long as the file is big and says nothing of the load
+                    header_latency = time.monotonic() - started_at
+                    self.metrics.increment('http_responses', status=response.status)
+                    if response.status in RETRY_STATUSES:
+                        throttled = response.status in THROTTLE_STATUSES
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        reason = f"HTTP {response.status}"
+                    else:
+                        result = await handler(response)
+                        latency = header_latency
+                        return result
             except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                if attempt < retries - 1:
-                    self.warning(f"Request failed for {url}: {e}. Retrying in {delay} seconds...")
-                    await asyncio.sleep(delay)
-                else:
-                    self.error(f"Request failed for {url}: {e}. No more retries.")
-                    return None
-
-    async def fetch_page_urls(self, session: aiohttp.ClientSession, url: str) -> List[str]:
+                reason = repr(e)
+                self.metrics.increment('http_errors', error=type(e).__name__)
+            finally:
+                await self.concurrency.release(latency=latency, throttled=throttled)
+
+            if attempt < self.retries - 1:
+                delay = backoff_delay(attempt, retry_after=retry_after)
+                self.warning(f"Request failed for {url}: {reason}. Retrying in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+            else:
+                self.error(f"Request failed for {url}: {reason}. No more retries.")
+        return None
+
+    async def read_page_response(
+            self, response: aiohttp.ClientResponse) -> Tuple[Union[bytes, None], Union[str, None], Dict[str, str]]:
         """
-        Asynchronously fetch and return all valid URLs from the given page.
+        Response handler for pages: read the body along with the status and cache validators.
 
         Args:
-        - session (aiohttp.ClientSession): The current session for HTTP requests.
-        - url (str): The URL of the page to fetch links from.
+        - response (aiohttp.ClientResponse): The successful response.
 
         Returns:
-        - List[str]: A list of valid URLs found on the page.
+        - Tuple[bytes, str, Dict[str, str]]: The raw body (None for 304 Not Modified), the charset,
+          and the status, ETag and Last-Modified of the response.
         """
-        self.info(f"Fetching page URLs from: {url}")
-        html = await self.fetch_text_with_retries(session, url)
-        if not html:
-            return []
-
-        soup = BeautifulSoup(html, 'html.parser')
-
-        def is_valid_url(href: str) -> bool:
-            """
-            Check if the URL is valid for crawling.
-
-            Args:
-            - href (str): The URL to validate.
-
-            Returns:
-            - bool: True if the URL is valid, False otherwise.
-            """
-            # Exclude URLs that contain unwanted prefixes or video files
-            if any(prefix in href for prefix in self.excluded_prefixes):
-                return False
-            if any(href.endswith(ext) for ext in self.excluded_extensions):
-                return False
-
-            # Continue with existing checks
-            return href.startswith('https') and 'uel' in href
-
-        new_links = [urljoin(self.base_url, a_tag['href']) for a_tag in soup.find_all('a', href=True) if
-                     is_valid_url(a_tag['href'])]
-        self.info(f"Found {len(new_links)} URLs on {url}")
-        return new_links
-
-    async def fetch_page_contents(self, session: aiohttp.ClientSession, url: str) -> Dict[str, Union[str, List[str]]]:
+        validators = {
+            "status": response.status,
+            "etag": response.headers.get('ETag'),
+            "last_modified": response.headers.get('Last-Modified'),
+        }
+        if response.status == 304:
+            return None, None, validators
+        return await response.read(), response.charset, validators
+
+    async def fetch_html_with_retries(self, session, url,
+                                      headers=None) -> Tuple[Union[bytes, None], Union[str, None], Dict[str, str]]:
         """
-        Asynchronously fetch and return the content (title, metadata, text) of the page.
+        Fetch the raw HTML of a URL with retries in case of transient failures.
+
+        Decoding is left to the parser, so it can happen off the event loop.
 
         Args:
         - session (aiohttp.ClientSession): The current session for HTTP requests.
-        - url (str): The URL of the page to fetch content from.
+        - url (str): The URL to fetch content from.
+        - headers (dict): Extra request headers, e.g. conditional request headers.
 
         Returns:
-        - Dict[str, Union[str, List[str]]]: A dictionary containing the page's title, metadata, text, and URL.
+        - Tuple[bytes, str, Dict[str, str]]: The raw body, the charset and the status and validators
+          of the response, or (None, None, {}) if all retries fail.
         """
-        self.info(f"Fetching page contents from URL: {url}")
-        html = await self.fetch_text_with_retries(session, url)
-        if not html:
-            return {}
+        result = await self.request_with_retries(session, url, headers=headers, handler=self.read_page_response)
+        return result if result else (None, None, {})
 
-        content_hash = hashlib.md5(html.encode('utf-8')).hexdigest()
+    def is_valid_url(self, href: str) -> bool:
+        """
+        Check if the URL is valid for crawling.
 
-        if content_hash in self.visited_hashes:
-            self.info(f"Skipping duplicate content for URL: {url}")
-            return {}
+        Args:
+        - href (str): The URL to validate.
 
-        self.visited_hashes.add(content_hash)
+        Returns:
+        - bool: True if the URL is valid, False otherwise.
+        """
+        # Exclude URLs that contain unwanted prefixes or video files
+        if any(prefix in href for prefix in self.excluded_prefixes):
+            return False
+        if any(href.endswith(ext) for ext in self.excluded_extensions):
+            return False
 
-        soup = BeautifulSoup(html, 'html.parser')
-        title = soup.title.string if soup.title else "No Title"
+        # Continue with existing checks
+        return href.startswith('https') and 'uel' in href
 
-        # Extract all metadata tags
-        metadata = {meta.attrs.get("name", meta.attrs.get("property", "unknown")): meta.attrs.get("content", "")
-                    for meta in soup.find_all("meta")}
+    async def fetch_page(self, session: aiohttp.ClientSession, url: str) -> Dict[str, Union[str, List[str]]]:
+        """
+        Asynchronously fetch a page once and extract everything the crawl needs from a single parse.
 
-        # Join metadata into a single string with key-value pairs
-        metadata_str = "; ".join([f"{key}: {value}" for key, value in metadata.items()])
+        With a crawl state, the request is conditional on the validators of the last crawl. A page that
+        comes back 304 Not Modified, or with the same content hash, is flagged unchanged and keeps the
+        links recorded last time.
 
-        page_text = soup.get_text(separator='\n', strip=True)
+        Args:
+        - session (aiohttp.ClientSession): The current session for HTTP requests.
+        - url (str): The URL of the page to fetch.
 
-        page_content = {
+        Returns:
+        - Dict[str, Union[str, List[str]]]: A dictionary containing the page's links, PDF links, content hash,
+          unchanged flag, response validators, title, metadata, text, and URL, or an empty dictionary if the page
+          could not be fetched. A 304 response has no validators, the recorded ones stay valid.
+        """
+        self.info("Fetching page from URL: %s", url)
+        cached = self.crawl_state.get_page(url) if self.crawl_state else None
+        headers = {}
+        if cached and cached["etag"]:
+            headers['If-None-Match'] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers['If-Modified-Since'] = cached["last_modified"]
+
+        with self.span('fetch'):
+            raw_data, charset, validators = await self.fetch_html_with_retries(session, url, headers=headers)
+        if validators.get("status") == 304 and cached:
+            self.info("Page not modified since last crawl: %s", url)
+            self.metrics.increment('pages_fetched', status='not_modified')
+            return {
+                "url": url,
+                "unchanged": True,
+                "content_hash": cached["content_hash"],
+                "links": cached["links"],
+                "pdf_links": cached["pdf_links"],
+            }
+        if not raw_data:
+            self.metrics.increment('pages_fetched', status='failed')
+            return {}
+        self.metrics.increment('pages_fetched', status='ok')
+        self.metrics.increment('page_bytes', len(raw_data))
+
+        with self.span('parse', executor=self.parse_executor):
+            if self.parse_pool:
+                loop = asyncio.get_running_loop()
+                parsed = await loop.run_in_executor(self.parse_pool, parse_page, raw_data, charset, self.parser)
+            else:
+                parsed = parse_page(raw_data, charset, self.parser)
+
+        hrefs = parsed.pop("hrefs")
+        page = {
             "url": url,
-            "title": title,
-            "metadata": metadata_str,
-            "contents": page_text
+            **parsed,
+            "links": [urljoin(self.base_url, href) for href in hrefs if self.is_valid_url(href)],
+            "pdf_links": [urljoin(self.base_url, href) for href in hrefs if href.endswith('.pdf')],
         }
-        self.info(f"Extracted contents from {url}")
-        return page_content
+        page["unchanged"] = cached is not None and cached["content_hash"] == page["content_hash"]
+        page["validators"] = validators
+        self.info("Found %d URLs and %d PDF URLs on %s", len(page['links']), len(page['pdf_links']), url)
+        return page
 
-    async def fetch_pdf_urls(self, session: aiohttp.ClientSession, url: str) -> List[str]:
+    def collect_page(self, page: Dict[str, Union[str, List[str]]]) -> None:
         """
-        Asynchronously fetch and return all PDF URLs from the given page.
+        Record the contents and PDF links of a fetched page, skipping exact and near-duplicate contents
+        and pages unchanged since the last crawl.
 
         Args:
-        - session (aiohttp.ClientSession): The current session for HTTP requests.
-        - url (str): The URL of the page to fetch PDF links from.
+        - page (Dict[str, Union[str, List[str]]]): The page returned by fetch_page.
+        """
+        if page["unchanged"]:
+            self.info("Skipping unchanged content for URL: %s", page['url'])
+            self.metrics.increment('pages_skipped', reason='unchanged')
+            return
+
+        self.pdf_urls.update(page["pdf_links"])
+
+        if page["content_hash"] in self.visited_hashes:
+            self.info("Skipping duplicate content for URL: %s", page['url'])
+            self.metrics.increment('pages_skipped', reason='duplicate')
+            return
+        self.visited_hashes.add(page["content_hash"])
+
+        fingerprint = self.near_duplicates.fingerprint(page["contents"])
+        duplicate_of = self.near_duplicates.find(fingerprint) if fingerprint is not None else None
+        if fingerprint is not None and duplicate_of is None:
+            self.near_duplicates.add(page["url"], fingerprint)
+        if self.crawl_state:
+            self.crawl_state.save_contents(page["url"], page["content_hash"],
+                                           fingerprint if duplicate_of is None else None)
+        if duplicate_of:
+            self.info("Skipping near-duplicate content for URL: %s (similar to %s)", page['url'], duplicate_of)
+            self.metrics.increment('pages_skipped', reason='near_duplicate')
+            return
+
+        self.output_sink.write({key: page[key] for key in OUTPUT_FIELDS})
+        self.pages_extracted += 1
+        self.metrics.increment('pages_extracted')
+        self.info("Extracted contents from %s", page['url'])
+
+    async def stream_pdf_response(self, response: aiohttp.ClientResponse, part_path: str) -> Union[str, None]:
+        """
+        Response handler for PDFs: stream the body into the partial file chunk by chunk, hashing it on the way.
+
+        A 206 Partial Content response continues the partial file from the offset the server resumed at.
+
+        Args:
+        - response (aiohttp.ClientResponse): The successful response.
+        - part_path (str): The partial file of the download.
 
         Returns:
-        - List[str]: A list of PDF URLs found on the page.
+        - str: The SHA-256 of the complete file, or None if the server did not return it.
         """
-        self.info(f"Fetching PDF URLs from: {url}")
-        html = await self.fetch_text_with_retries(session, url)
-        if not html:
-            return []
-
-        soup = BeautifulSoup(html, 'html.parser')
-        pdfs_on_page = [
-            urljoin(self.base_url, a_tag['href']) for a_tag in soup.find_all('a', href=True)
-            if a_tag['href'].endswith('.pdf')
-        ]
-        self.info(f"Found {len(pdfs_on_page)} PDF URLs on {url}")
-        return pdfs_on_page
+        if response.status == 416:
+            os.remove(part_path)
+            raise aiohttp.ClientPayloadError(f"Range not satisfiable for {response.url}, restarting the download")
+        if response.status not in (200, 206):
+            self.warning(f"Unexpected status {response.status} for PDF: {response.url}")
+            return None
+
+        digest = hashlib.sha256()
+        mode = 'wb'
+        if response.status == 206:
+            match = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+            offset = int(match.group(1)) if match else 0
+            if offset > (os.path.getsize(part_path) if os.path.exists(part_path) else 0):
+                os.remove(part_path)
+                raise aiohttp.ClientPayloadError(f"Cannot resume {response.url} from byte {offset}, restarting")
+
+            # Hash the bytes we already have, dropping anything past the offset the server resumed at
+            with open(part_path, 'r+b') as part_file:
+                part_file.truncate(offset)
+            async with aiofiles.open(part_path, 'rb') as part_file:
+                while chunk := await part_file.read(DOWNLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+            mode = 'ab'
+
+        async with aiofiles.open(part_path, mode) as part_file:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                await part_file.write(chunk)
+        return digest.hexdigest()
 
     async def download_pdf(self, session: aiohttp.ClientSession, pdf_url: str):
         """
         Asynchronously download a single PDF file.
 
+        The file is streamed to a partial file and renamed to its content hash once complete,
+        so identical PDFs behind different URLs are stored once. An interrupted download resumes
+        from its partial file with a Range request. URLs already in the manifest are skipped.
+
         Args:
         - session (aiohttp.ClientSession): The current session for HTTP requests.
         - pdf_url (str): The URL of the PDF to download.
         """
-        pdf_name = os.path.join(self.download_folder, os.path.basename(pdf_url))
-        self.info(f"Downloading PDF: {pdf_name}")
-        raw_data = await self.fetch_binary_with_retries(session, pdf_url)
-        if not raw_data:
+        entry = self.pdf_manifest.get(pdf_url)
+        if entry and os.path.exists(os.path.join(self.download_folder, entry["file"])):
+            self.info("PDF already downloaded: %s", pdf_url)
             return
 
-        try:
-            async with aiofiles.open(pdf_name, 'wb') as pdf_file:
-                await pdf_file.write(raw_data)
-            self.info(f"Downloaded PDF: {pdf_name}")
-        except aiohttp.ClientError as e:
-            self.error(f"Failed to download {pdf_url}: {e}")
+        self.info("Downloading PDF: %s", pdf_url)
+        part_path = os.path.join(self.partial_folder, hashlib.sha1(pdf_url.encode('utf-8')).hexdigest() + ".part")
 
-    async def crawl_and_update_links(self, session: aiohttp.ClientSession, url: str, depth: int = 0) -> None:
+        def range_headers() -> Dict[str, str]:
+            size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            return {'Range': f'bytes={size}-'} if size else {}
+
+        async def handler(response: aiohttp.ClientResponse) -> Union[str, None]:
+            return await self.stream_pdf_response(response, part_path)
+
+        with self.span('download'):
+            content_hash = await self.request_with_retries(
+                session, pdf_url, timeout=2 * self.timeout, headers=range_headers, handler=handler
+            )
+        if not content_hash:
+            self.metrics.increment('pdfs_downloaded', status='failed')
+            return
+        self.metrics.increment('pdfs_downloaded', status='ok')
+
+        file_name = f"{content_hash}.pdf"
+        pdf_path = os.path.join(self.download_folder, file_name)
+        if os.path.exists(pdf_path):
+            os.remove(part_path)
+            self.info("Skipping duplicate PDF: %s has the same contents as %s", pdf_url, file_name)
+        else:
+            os.replace(part_path, pdf_path)
+            self.info("Downloaded PDF: %s to %s", pdf_url, file_name)
+
+        self.pdf_manifest[pdf_url] = {"file": file_name, "sha256": content_hash, "name": os.path.basename(pdf_url)}
+
+    def save_pdf_manifest(self) -> None:
         """
-        Recursively and asynchronously crawl the website starting from the given URL.
+        Atomically write the manifest mapping each PDF URL to its content-addressed file.
+        """
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(self.pdf_manifest, manifest_file, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    async def crawl_url(self, session: aiohttp.ClientSession, frontier: asyncio.Queue, url: str, depth: int) -> None:
+        """
+        Fetch a single URL of the frontier, collect its contents and enqueue its unseen links.
 
         Args:
         - session (aiohttp.ClientSession): The current session for HTTP requests.
-        - url (str): The URL to start crawling from.
-        - depth (int): The current depth of the crawl.
+        - frontier (asyncio.Queue): The queue of (url, depth) pairs waiting to be crawled.
+        - url (str): The URL to crawl.
+        - depth (int): The depth of the URL.
         """
-        if depth > self.max_depth:
-            self.info(f"Maximum depth reached at URL: {url}")
-            return
-        if url in self.visited_urls:
+        self.info("Crawling URL: %s at depth: %d", url, depth)
+        page = await self.fetch_page(session, url)
+        if not page:
             return
 
-        self.visited_urls.add(url)
-        self.info(f"Crawling URL: {url} at depth: {depth}")
+        self.collect_page(page)
 
-        new_links = await self.fetch_page_urls(session, url)
-        for link in new_links:
-            if link not in self.visited_urls:
-                self.page_urls.append(link)
-                await self.crawl_and_update_links(session, link, depth + 1)
+        # Saved after its record is collected, so the page is never committed to the state ahead of its record
+        if self.crawl_state and "validators" in page:
+            validators = page["validators"]
+            self.crawl_state.save_page(url, validators.get("etag"), validators.get("last_modified"),
+                                       page["content_hash"], page["links"], page["pdf_links"])
 
-    async def start_extract(self, output_csv: str = "src/database/extracted_files/page_contents.csv"):
+        # Pages one level past max_depth are fetched for their contents, but not expanded
+        if depth > self.max_depth:
+            return
+        for link in page["links"]:
+            if link in self.visited_urls:
+                continue
+            self.visited_urls.add(link)
+            self.page_urls.append(link)
+            frontier.put_nowait((link, depth + 1))
+            if self.crawl_state:
+                self.crawl_state.enqueue(link, depth + 1)
+
+    async def crawl_worker(self, session: aiohttp.ClientSession, frontier: asyncio.Queue) -> None:
         """
-        Start the extraction process: crawling pages, fetching content and PDFs, and saving them.
+        Drain the crawl frontier, one URL at a time.
+
+        URLs are marked as visited when they are enqueued, so no two workers ever fetch the same page.
+        A URL is only marked done in the crawl state once it has been handled, so a URL in flight when
+        the crawl is killed is crawled again on resume.
 
         Args:
-        - output_csv (str): The path to the CSV file where the page contents will be saved.
+        - session (aiohttp.ClientSession): The current session for HTTP requests.
+        - frontier (asyncio.Queue): The queue of (url, depth) pairs waiting to be crawled.
         """
-        self.info("Starting extraction process.")
-        async with aiohttp.ClientSession() as session:
-            await self.crawl_and_update_links(session, self.base_url)
-
-            # Fetch contents and PDFs for each URL
-            tasks = []
-            for url in self.page_urls:
-                content_task = self.fetch_page_contents(session, url)
-                pdf_task = self.fetch_pdf_urls(session, url)
-                tasks.append(asyncio.gather(content_task, pdf_task))
+        while True:
+            url, depth = await frontier.get()
+            try:
+                try:
+                    await self.crawl_url(session, frontier, url, depth)
+                except Exception as e:
+                    self.error(f"Failed to crawl {url}: {e}")
+                if self.crawl_state:
+                    self.crawl_state.mark_done(url)
+            finally:
+                frontier.task_done()
 
-            results = await asyncio.gather(*tasks)
+    async def crawl_and_update_links(self, session: aiohttp.ClientSession, url: str, depth: int = 0) -> None:
+        """
+        Crawl the website breadth-first starting from the given URL, using a pool of async workers.
 
-            for content, pdfs in results:
-                if content:
-                    self.page_contents.append(content)
-                if pdfs:
-                    self.pdf_urls.update(pdfs)
+        If the crawl state holds the frontier of an interrupted crawl, that crawl is resumed instead.
 
-            # Download PDFs asynchronously
-            download_tasks = [self.download_pdf(session, pdf_url) for pdf_url in self.pdf_urls]
-            await asyncio.gather(*download_tasks)
+        Args:
+        - session (aiohttp.ClientSession): The current session for HTTP requests.
+        - url (str): The URL to start crawling from.
+        - depth (int): The depth of the starting URL.
+        """
+        frontier: asyncio.Queue = asyncio.Queue()
+
+        if self.crawl_state and self.crawl_state.has_pending():
+            pending = self.crawl_state.pending()
+            known_urls = self.crawl_state.frontier_urls()
+            self.visited_urls.update(known_urls)
+            self.page_urls.extend(known_urls - {url})
+            # The pages extracted before the interruption are still duplicates to skip
+            for seen_url, content_hash, fingerprint in self.crawl_state.seen_contents():
+                self.visited_hashes.add(content_hash)
+                if fingerprint is not None:
+                    self.near_duplicates.add(seen_url, fingerprint)
+            self.info(f"Resuming interrupted crawl with {len(pending)} pending URLs")
+        else:
+            if depth > self.max_depth:
+                self.info("Maximum depth reached at URL: %s", url)
+                return
+            if url in self.visited_urls:
+                return
+
+            pending = [(url, depth)]
+            self.visited_urls.add(url)
+            if self.crawl_state:
+                self.crawl_state.start_run()
+                self.crawl_state.enqueue(url, depth)
+
+        for item in pending:
+            frontier.put_nowait(item)
+
+        workers = [asyncio.create_task(self.crawl_worker(session, frontier)) for _ in range(self.num_workers)]
+        try:
+            await frontier.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
-        # Save contents to CSV
-        self.save_page_contents(output_csv)
-        self.info("Extraction process completed.")
+        if self.crawl_state:
+            self.crawl_state.finish_run()
+        self.info(f"Crawl frontier drained, {len(self.page_urls)} URLs discovered")
 
-    def save_page_contents(self, filename: str) -> None:
+    async def start_extract(self, output_csv: str = "src/database/extracted_files/page_contents.csv"):
         """
-        Save the fetched page contents to a CSV file.
+        Start the extraction process: crawling pages, streaming their contents to the output file
+        as they are fetched, and downloading PDFs.
 
         Args:
-        - filename (str): The path to the CSV file where the page contents will be saved.
+        - output_csv (str): The path to the file where the page contents will be saved. The format follows
+          the extension: .csv, .jsonl or .parquet. A sidecar next to it tells whether it holds every page
+          or, on a re-crawl with a crawl state, only the changed ones, see write_feed_info.
         """
-        self.info(f"Saving page contents to CSV file: {filename}")
-        df = pd.DataFrame(self.page_contents)
-        df.to_csv(filename, index=False)
-        self.info(f"Page contents saved to {filename}")
+        self.info("Starting extraction process.")
+        if self.state_path:
+            self.crawl_state = CrawlState(self.state_path)
+        if self.parse_executor == 'process':
+            self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+            self.info(f"Parsing pages in a pool of {self.parse_workers} processes")
+
+        # A resumed crawl keeps the contents written before it was interrupted
+        resuming = self.crawl_state is not None and self.crawl_state.has_pending()
+        # With the pages of an earlier crawl recorded, only changed pages are written: the output is incremental
+        if resuming:
+            feed_info = read_feed_info(output_csv)
+            incremental = feed_info["incremental"] if feed_info else True
+        else:
+            incremental = self.crawl_state is not None and self.crawl_state.has_pages()
+        if self.crawl_state:
+            # The records are written out right before each state commit, and only then: a killed crawl
+            # neither loses the records of pages marked done nor appends again those of pages it re-crawls
+            self.output_sink = open_sink(output_csv, OUTPUT_FIELDS, append=resuming, buffer_size=None)
+            self.crawl_state.before_commit = self.output_sink.flush
+        else:
+            self.output_sink = open_sink(output_csv, OUTPUT_FIELDS, append=resuming)
+        write_feed_info(output_csv, incremental=incremental, complete=False)
+        self.info(f"Streaming page contents to {output_csv}")
+
+        completed = False
+        try:
+            connector = create_connector(limit=self.max_connections, limit_per_host=self.max_connections_per_host)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await self.crawl_and_update_links(session, self.base_url)
+
+                # Download PDFs asynchronously
+                download_tasks = [self.download_pdf(session, pdf_url) for pdf_url in self.pdf_urls]
+                await asyncio.gather(*download_tasks)
+            completed = True
+        finally:
+            self.save_pdf_manifest()
+            if self.crawl_state:
+                self.crawl_state.close()
+                self.crawl_state = None
+            self.output_sink.close()
+            self.output_sink = None
+            if completed:
+                write_feed_info(output_csv, incremental=incremental, complete=True)
+            if self.parse_pool:
+                self.parse_pool.shutdown()
+                self.parse_pool = None
+
+        self.info(f"Extraction process completed, {self.pages_extracted} pages saved to {output_csv}.")
@@ -3,6 +3,8 @@ import traceback
 
 from common.config_loader import ConfigLoader
 from common.logger import Logger
+from core.embedding_cache import CachedEmbeddings
+from core.embedding_scheduler import EmbeddingScheduler
 
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
@@ -14,8 +16,23 @@ class Embedding(Logger):
         gg_api_key = config_loader.config_data['GOOGLE_API_KEY']
         os.environ["GOOGLE_API_KEY"] = gg_api_key
         model_id = config_loader.config_data['MODEL_ID']
+        cache_path = config_loader.config_data.get('EMBEDDING_CACHE_PATH', 'src/database/embedding_cache.sqlite')
+        cache_max_entries = config_loader.config_data.get('EMBEDDING_CACHE_MAX_ENTRIES', 1_000_000)
         try:
-            self.embedding = GoogleGenerativeAIEmbeddings(model=model_id)
+            # Cache hits never reach the scheduler, which batches the misses under the API quota
+            scheduler = EmbeddingScheduler(
+                GoogleGenerativeAIEmbeddings(model=model_id),
+                batch_size=config_loader.config_data.get('EMBEDDING_BATCH_SIZE', 100),
+                max_batch_tokens=config_loader.config_data.get('EMBEDDING_MAX_BATCH_TOKENS', 20000),
+                max_workers=config_loader.config_data.get('EMBEDDING_CONCURRENCY', 4),
+                requests_per_minute=config_loader.config_data.get('EMBEDDING_REQUESTS_PER_MINUTE'),
+            )
+            self.embedding = CachedEmbeddings(
+                scheduler,
+                model_id=model_id,
+                cache_path=cache_path,
+                max_entries=cache_max_entries,
+            )
         except:
             self.error(
                 message= f"Can not load embedding from google vertex AI, traceback = {traceback.format_exc()}"
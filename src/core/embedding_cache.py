@@ -0,0 +1,270 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from common.logger import Logger
+from core.embedding_scheduler import embed_queries
+
+# The text used to probe the dimension of a model that is not in the cache yet
+DIMENSION_PROBE_TEXT = "I am Vietnamese"
+# SQLite limits the number of host parameters of a statement
+LOOKUP_BATCH_SIZE = 500
+# The number of cache hits whose last use is kept in memory before it is written to the cache
+TOUCH_BATCH_SIZE = 1000
+
+
+class CachedEmbeddings(Logger, Embeddings):
+    def __init__(self, embeddings: Embeddings, model_id: str, cache_path: str, max_entries: int = 1_000_000):
+        """
+        Wrap an embedding model with a persistent cache, keyed by model id and text hash.
+
+        Vectors are stored in SQLite as float32 blobs. Once the cache holds more than max_entries vectors,
+        the least recently used ones are evicted. Query and document embeddings are cached separately,
+        since models may embed the same text differently for each task.
+
+        Lookups only read the cache: the last use of the vectors they hit is kept in memory and written
+        in batches, before every eviction and on close, so hits do not each cost a write and a commit.
+
+        Args:
+        - embeddings (Embeddings): The embedding model to cache.
+        - model_id (str): The model id, part of every cache key.
+        - cache_path (str): The path to the SQLite cache file.
+        - max_entries (int): The maximum number of cached vectors.
+        """
+        super().__init__()
+        folder = os.path.dirname(cache_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.touched: Dict[str, float] = {}
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS dimensions (model_id TEXT PRIMARY KEY, dimension INTEGER NOT NULL)"
+        )
+        self.connection.commit()
+        self.num_entries = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.info(f"Opened embedding cache {cache_path} with {self.num_entries} vectors")
+
+    def cache_key(self, text: str, task: str) -> str:
+        """
+        Build the cache key of a text.
+
+        Args:
+        - text (str): The text.
+        - task (str): 'document' or 'query'.
+        """
+        return hashlib.sha256(f"{self.model_id}\0{task}\0{text}".encode('utf-8')).hexdigest()
+
+    def select(self, columns: str, keys: List[str]) -> List[tuple]:
+        """
+        Select the rows of the given keys, in batches of LOOKUP_BATCH_SIZE. The caller holds the lock.
+
+        Args:
+        - columns (str): The selected columns.
+        - keys (List[str]): The cache keys.
+
+        Returns:
+        - List[tuple]: The rows found.
+        """
+        rows = []
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + LOOKUP_BATCH_SIZE]
+            rows.extend(self.connection.execute(
+                f"SELECT {columns} FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return rows
+
+    def write_touched(self) -> None:
+        """
+        Write the last use of the vectors hit since the last write, without committing. The caller holds the lock.
+        """
+        if self.touched:
+            self.connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self.touched.items()],
+            )
+            self.touched = {}
+
+    def lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Fetch the cached vectors of the given keys, recording their last use.
+
+        Args:
+        - keys (List[str]): The cache keys.
+
+        Returns:
+        - Dict[str, List[float]]: The cached vectors, by key.
+        """
+        with self.lock:
+            found = {
+                key: np.frombuffer(vector, dtype=np.float32).tolist()
+                for key, vector in self.select("key, vector", keys)
+            }
+            if found:
+                now = time.time()
+                self.touched.update((key, now) for key in found)
+                if len(self.touched) >= TOUCH_BATCH_SIZE:
+                    self.write_touched()
+                    self.connection.commit()
+        return found
+
+    def store(self, vectors: Dict[str, List[float]]) -> None:
+        """
+        Cache new vectors, evicting the least recently used ones if the cache is full.
+
+        Args:
+        - vectors (Dict[str, List[float]]): The vectors, by cache key.
+        """
+        now = time.time()
+        with self.lock:
+            # Replaced keys are not new entries, and their pending last use is older than now
+            num_replaced = len(self.select("key", list(vectors)))
+            for key in vectors:
+                self.touched.pop(key, None)
+            self.write_touched()
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in vectors.items()],
+            )
+            self.num_entries += len(vectors) - num_replaced
+            if self.num_entries > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (self.num_entries - self.max_entries,),
+                )
+                self.num_entries = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self.connection.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents, calling the model only for texts that are not cached.
+
+        Args:
+        - texts (List[str]): The texts to embed.
+
+        Returns:
+        - List[List[float]]: The vectors, in the order of the texts.
+        """
+        keys = [self.cache_key(text, 'document') for text in texts]
+        vectors = self.lookup(keys)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        num_missing = sum(1 for key in keys if key in missing)
+        with self.lock:
+            self.hits += len(keys) - num_missing
+            self.misses += num_missing
+        self.metrics.increment('embedding_cache_lookups', len(keys) - num_missing, result='hit')
+        self.metrics.increment('embedding_cache_lookups', num_missing, result='miss')
+        if missing:
+            new_vectors = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.store(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query, calling the model only if it is not cached.
+
+        Args:
+        - text (str): The query.
+
+        Returns:
+        - List[float]: The vector.
+        """
+        key = self.cache_key(text, 'query')
+        vectors = self.lookup([key])
+        if key in vectors:
+            with self.lock:
+                self.hits += 1
+            self.metrics.increment('embedding_cache_lookups', result='hit')
+            return vectors[key]
+
+        with self.lock:
+            self.misses += 1
+        self.metrics.increment('embedding_cache_lookups', result='miss')
+        vector = self.embeddings.embed_query(text)
+        self.store({key: vector})
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several queries, calling the model only for queries that are not cached.
+
+        Args:
+        - texts (List[str]): The queries.
+
+        Returns:
+        - List[List[float]]: The vectors, in the order of the queries.
+        """
+        keys = [self.cache_key(text, 'query') for text in texts]
+        vectors = self.lookup(keys)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        num_missing = sum(1 for key in keys if key in missing)
+        with self.lock:
+            self.hits += len(keys) - num_missing
+            self.misses += num_missing
+        self.metrics.increment('embedding_cache_lookups', len(keys) - num_missing, result='hit')
+        self.metrics.increment('embedding_cache_lookups', num_missing, result='miss')
+        if missing:
+            new_vectors = dict(zip(missing, embed_queries(self.embeddings, list(missing.values()))))
+            self.store(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    def get_dimension(self) -> int:
+        """
+        Return the dimension of the model's vectors, probing the model only the first time.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT dimension FROM dimensions WHERE model_id = ?", (self.model_id,)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        dimension = len(self.embed_query(DIMENSION_PROBE_TEXT))
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO dimensions (model_id, dimension) VALUES (?, ?)", (self.model_id, dimension)
+            )
+            self.connection.commit()
+        return dimension
+
+    def close(self) -> None:
+        """
+        Write the pending last uses and close the cache.
+        """
+        with self.lock:
+            self.write_touched()
+            self.connection.commit()
+            self.connection.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the hit and miss counters and the number of cached vectors.
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self.num_entries}
@@ -0,0 +1,194 @@
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from common.logger import Logger
+from core.http_policy import backoff_delay
+
+# The task type GoogleGenerativeAIEmbeddings embeds queries with, as opposed to documents
+QUERY_TASK_TYPE = 'RETRIEVAL_QUERY'
+
+
+def embed_queries(embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embed several queries with a model, the one way every caller embeds queries. Models embed queries
+    for a different task than documents, so the batch goes in one request with the query task type,
+    to the model's own batch method if it has no task type, or else one request per query.
+
+    Args:
+    - embeddings (Embeddings): The embedding model.
+    - texts (List[str]): The queries.
+
+    Returns:
+    - List[List[float]]: The vectors, in the order of the queries.
+    """
+    if 'task_type' in inspect.signature(embeddings.embed_documents).parameters:
+        return embeddings.embed_documents(texts, task_type=QUERY_TASK_TYPE)
+    if hasattr(embeddings, 'embed_queries'):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text, at roughly four characters per token.
+
+    Args:
+    - text (str): The text.
+    """
+    return len(text) // 4 + 1
+
+
+class RequestBudget:
+    def __init__(self, requests_per_minute: float = None):
+        """
+        A thread-safe token bucket spreading requests evenly over each minute.
+
+        Args:
+        - requests_per_minute (float): The number of requests allowed per minute, or None for no limit.
+        """
+        self.rate = requests_per_minute / 60 if requests_per_minute else None
+        self.capacity = max(1.0, self.rate) if self.rate else None
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Block until a request is allowed.
+        """
+        if not self.rate:
+            return
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+
+class EmbeddingScheduler(Logger, Embeddings):
+    def __init__(self, embeddings: Embeddings, batch_size: int = 100, max_batch_tokens: int = 20000,
+                 max_workers: int = 4, requests_per_minute: float = None, retries: int = 5):
+        """
+        Embed texts in size- and token-bounded batches, sent concurrently from a thread pool
+        under a requests-per-minute budget. Failed batches are retried with exponential backoff.
+
+        Args:
+        - embeddings (Embeddings): The embedding model doing the actual work.
+        - batch_size (int): The maximum number of texts per request.
+        - max_batch_tokens (int): The maximum estimated number of tokens per request.
+        - max_workers (int): The number of requests in flight at once.
+        - requests_per_minute (float): The request budget of the model's quota, or None for no limit.
+        - retries (int): The number of attempts per batch.
+        """
+        super().__init__()
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_workers = max_workers
+        self.retries = retries
+        self.budget = RequestBudget(requests_per_minute)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='embedding')
+
+    def make_batches(self, texts: List[str]) -> List[List[str]]:
+        """
+        Split texts into consecutive batches bounded by size and estimated tokens.
+
+        A single text over the token bound gets a batch of its own.
+
+        Args:
+        - texts (List[str]): The texts.
+
+        Returns:
+        - List[List[str]]: The batches, in order.
+        """
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def with_retries(self, function, *args):
+        """
+        Call the embedding model within the request budget, retrying failures with backoff.
+
+        Args:
+        - function (callable): The model method to call.
+        - args: Its arguments.
+        """
+        for attempt in range(self.retries):
+            self.budget.acquire()
+            try:
+                with self.span('embedding_request'):
+                    return function(*args)
+            except Exception as e:
+                self.metrics.increment('embedding_request_errors', error=type(e).__name__)
+                if attempt == self.retries - 1:
+                    self.error(f"Embedding request failed: {e}. No more retries.")
+                    raise
+                delay = backoff_delay(attempt)
+                self.warning(f"Embedding request failed: {e}. Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents in concurrent batches.
+
+        Args:
+        - texts (List[str]): The texts to embed.
+
+        Returns:
+        - List[List[float]]: The vectors, in the order of the texts.
+        """
+        batches = self.make_batches(texts)
+        if len(batches) > 1:
+            self.info(f"Embedding {len(texts)} texts in {len(batches)} batches")
+
+        vectors = []
+        for batch_vectors in self.executor.map(
+                lambda batch: self.with_retries(self.embeddings.embed_documents, batch), batches):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query.
+
+        Args:
+        - text (str): The query.
+
+        Returns:
+        - List[float]: The vector.
+        """
+        return self.with_retries(self.embeddings.embed_query, text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several queries in concurrent batches, bounded like the document batches,
+        each batch in one request with the query task type.
+
+        Args:
+        - texts (List[str]): The queries.
+
+        Returns:
+        - List[List[float]]: The vectors, in the order of the queries.
+        """
+        vectors = []
+        for batch_vectors in self.executor.map(
+                lambda batch: self.with_retries(embed_queries, self.embeddings, batch), self.make_batches(texts)):
+            vectors.extend(batch_vectors)
+        return vectors
@@ -0,0 +1,291 @@
+import json
+import operator
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from core.index_factory import exact_storage, search_parameters
+from core.query_cache import QueryCache
+
+# The number of metadata filters whose allowed positions are kept
+FILTER_CACHE_SIZE = 128
+
+
+class FAISSStore(FAISS):
+    def __init__(self, *args, **kwargs):
+        """
+        A LangChain FAISS vector store that supports deleting documents from any index type.
+
+        Deleted documents leave their vectors in the index as tombstones, which searches skip through
+        a FAISS IDSelector, until the store is compacted. HNSW indexes cannot remove vectors at all, and
+        removing them from IVF indexes would renumber the positions the docstore mapping relies on.
+
+        A store loaded read-only keeps the vectors inserted since its index file was written in a separate
+        exact delta index, searched next to the main one.
+
+        Equality filters on metadata are pushed into the search when the docstore has an attribute index:
+        the search only visits the matching positions, so it returns k hits whenever k documents match.
+
+        Takes the arguments of langchain_community.vectorstores.FAISS.
+        """
+        super().__init__(*args, **kwargs)
+        self.deleted_positions: Set[int] = set()
+        self.delta_index: Optional[faiss.Index] = None
+        # The index object and training state last written to disk, see VectorStore.save_vector_store
+        self.saved_index: Optional[faiss.Index] = None
+        self.saved_trained = False
+        self.selectors = None
+        self.filter_cache = QueryCache(max_entries=FILTER_CACHE_SIZE, ttl=None)
+
+    def mark_deleted(self, positions: Iterable[int]) -> None:
+        """
+        Turn positions into tombstones, skipped by searches.
+
+        Args:
+        - positions (Iterable[int]): The positions of the deleted vectors.
+        """
+        self.deleted_positions.update(int(position) for position in positions)
+        self.selectors = None
+        self.filter_cache.clear()
+
+    def clear_deleted(self) -> None:
+        """
+        Forget the tombstones, once the index was rebuilt without them.
+        """
+        self.deleted_positions = set()
+        self.selectors = None
+        self.filter_cache.clear()
+
+    def deleted_selectors(self) -> Tuple[faiss.IDSelector, faiss.IDSelector]:
+        """
+        Return the selectors excluding the tombstones from the main and the delta index.
+        Both are kept referenced here, since FAISS does not own them.
+        """
+        if self.selectors is None:
+            offset = self.index.ntotal
+            deleted = np.fromiter(self.deleted_positions, dtype=np.int64, count=len(self.deleted_positions))
+            main_batch = faiss.IDSelectorBatch(deleted[deleted < offset])
+            delta_batch = faiss.IDSelectorBatch(deleted[deleted >= offset] - offset)
+            self.selectors = (main_batch, delta_batch,
+                              faiss.IDSelectorNot(main_batch), faiss.IDSelectorNot(delta_batch))
+        return self.selectors[2], self.selectors[3]
+
+    def search_positions(self, vectors: np.ndarray, k: int,
+                         allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search the index, and the delta index if any, skipping tombstones.
+
+        Args:
+        - vectors (np.ndarray): The query vectors, float32 of shape (n, dimension).
+        - k (int): The number of results per query.
+        - allowed (np.ndarray): The only positions to return, e.g. the ones matching a metadata filter.
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray]: The scores and positions, of shape (n, k), best first,
+          with position -1 where there are fewer than k results.
+        """
+        if allowed is not None:
+            return self.search_allowed(vectors, k, allowed)
+
+        main_selector, delta_selector = self.deleted_selectors() if self.deleted_positions else (None, None)
+        if main_selector is not None:
+            scores, positions = self.index.search(vectors, k, params=search_parameters(self.index, main_selector))
+        else:
+            scores, positions = self.index.search(vectors, k)
+        if self.delta_index is None or self.delta_index.ntotal == 0:
+            return scores, positions
+
+        if delta_selector is not None:
+            delta_scores, delta_positions = self.delta_index.search(
+                vectors, k, params=faiss.SearchParameters(sel=delta_selector)
+            )
+        else:
+            delta_scores, delta_positions = self.delta_index.search(vectors, k)
+        return self.merge_results(scores, positions, delta_scores, delta_positions, k)
+
+    def search_allowed(self, vectors: np.ndarray, k: int, allowed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search only the allowed positions, through IDSelectors on the index and the delta index.
+
+        Approximate indexes may miss allowed vectors far from the probed lists or graph neighbourhoods,
+        so queries with fewer than k results, while more positions are allowed, are searched again exactly.
+
+        Args:
+        - vectors (np.ndarray): The query vectors, float32 of shape (n, dimension).
+        - k (int): The number of results per query.
+        - allowed (np.ndarray): The allowed positions, without tombstones.
+        """
+        if self.deleted_positions:
+            allowed = allowed[~np.isin(allowed, list(self.deleted_positions))]
+        if len(allowed) == 0:
+            return np.full((len(vectors), k), np.nan, dtype=np.float32), np.full((len(vectors), k), -1, dtype=np.int64)
+        offset = self.index.ntotal
+        main_selector = faiss.IDSelectorBatch(allowed[allowed < offset])
+        delta_allowed = allowed[allowed >= offset] - offset
+
+        scores, positions = self.index.search(vectors, k, params=search_parameters(self.index, main_selector))
+        wanted = min(k, int((allowed < offset).sum()))
+        short = np.flatnonzero((positions >= 0).sum(axis=1) < wanted)
+        if len(short):
+            storage = exact_storage(self.index)
+            if storage is not None:
+                exact_scores, exact_positions = storage.search(
+                    vectors[short], k, params=faiss.SearchParameters(sel=main_selector)
+                )
+            else:
+                exact_scores, exact_positions = self.index.search(
+                    vectors[short], k, params=search_parameters(self.index, main_selector, exhaustive=True)
+                )
+            scores[short], positions[short] = exact_scores, exact_positions
+
+        if self.delta_index is None or self.delta_index.ntotal == 0 or len(delta_allowed) == 0:
+            return scores, positions
+        delta_selector = faiss.IDSelectorBatch(delta_allowed)
+        delta_scores, delta_positions = self.delta_index.search(
+            vectors, k, params=faiss.SearchParameters(sel=delta_selector)
+        )
+        return self.merge_results(scores, positions, delta_scores, delta_positions, k)
+
+    def merge_results(self, scores: np.ndarray, positions: np.ndarray, delta_scores: np.ndarray,
+                      delta_positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Merge the results of the index and the delta index into the k best per query.
+
+        Args:
+        - scores (np.ndarray): The scores from the index.
+        - positions (np.ndarray): The positions from the index.
+        - delta_scores (np.ndarray): The scores from the delta index.
+        - delta_positions (np.ndarray): The positions within the delta index.
+        - k (int): The number of results per query.
+        """
+        delta_positions = np.where(delta_positions >= 0, delta_positions + self.index.ntotal, -1)
+
+        # Missing results last
+        scores = np.hstack([scores, delta_scores])
+        positions = np.hstack([positions, delta_positions])
+        descending = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        scores[positions < 0] = -np.inf if descending else np.inf
+        order = np.argsort(-scores if descending else scores, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(positions, order, axis=1)
+
+    def filter_positions(self, filter: Optional[Union[Callable, Dict[str, Any]]]) -> Optional[np.ndarray]:
+        """
+        Resolve a metadata filter to the positions it allows with the docstore's attribute index,
+        caching the result until documents are added or deleted.
+
+        Args:
+        - filter (Union[Callable, Dict[str, Any]]): The metadata filter.
+
+        Returns:
+        - np.ndarray: The allowed positions, or None if the filter has to be applied to the results instead.
+        """
+        if not isinstance(filter, dict) or not hasattr(self.docstore, 'filter_positions'):
+            return None
+        try:
+            key = (json.dumps(filter, sort_keys=True), self.index.ntotal,
+                   self.delta_index.ntotal if self.delta_index is not None else 0)
+        except TypeError:
+            return None
+
+        cached = self.filter_cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        allowed = self.docstore.filter_positions(filter)
+        self.filter_cache.put_many({key: allowed})
+        return allowed
+
+    def collect_documents(
+        self,
+        scores: np.ndarray,
+        positions: np.ndarray,
+        k: int,
+        filter_func: Optional[Callable] = None,
+        score_threshold: Optional[float] = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Turn one row of search results into documents and their scores, applying the metadata filter
+        and the score threshold like FAISS does.
+
+        Args:
+        - scores (np.ndarray): The scores of one query.
+        - positions (np.ndarray): The positions of one query, -1 for missing results.
+        - k (int): The number of documents to keep.
+        - filter_func (Callable): The metadata filter, if any.
+        - score_threshold (float): The score threshold, if any.
+        """
+        docs = []
+        for score, position in zip(scores, positions):
+            if position == -1:
+                continue
+            _id = self.index_to_docstore_id[position]
+            doc = self.docstore.search(_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {_id}, got {doc}")
+            if filter_func is None or filter_func(doc.metadata):
+                docs.append((doc, score))
+
+        if score_threshold is not None:
+            cmp = (
+                operator.ge
+                if self.distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+                else operator.le
+            )
+            docs = [(doc, similarity) for doc, similarity in docs if cmp(similarity, score_threshold)]
+        return docs[:k]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the documents most similar to an embedding and their scores, like FAISS does,
+        searching through search_positions.
+        """
+        return self.similarity_search_with_score_by_vectors([embedding], k, filter, fetch_k, **kwargs)[0]
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Return the documents most similar to each of several embeddings and their scores,
+        with a single search of the whole query matrix.
+
+        Args:
+        - embeddings (List[List[float]]): The query vectors.
+        - k (int): The number of documents per query.
+        - filter (Union[Callable, Dict[str, Any]]): The metadata filter, if any.
+        - fetch_k (int): The number of results fetched per query before filtering.
+
+        Returns:
+        - List[List[Tuple[Document, float]]]: The documents and their raw index scores, per query.
+        """
+        if len(embeddings) == 0:
+            return []
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        # Filters the attribute index can answer restrict the search itself, the others are applied
+        # to fetch_k results
+        allowed = self.filter_positions(filter) if filter is not None else None
+        if filter is None or allowed is not None:
+            scores, positions = self.search_positions(vectors, k, allowed)
+            filter_func = None
+        else:
+            scores, positions = self.search_positions(vectors, fetch_k)
+            filter_func = self._create_filter_func(filter)
+        score_threshold = kwargs.get("score_threshold")
+        return [self.collect_documents(row_scores, row_positions, k, filter_func, score_threshold)
+                for row_scores, row_positions in zip(scores, positions)]
@@ -0,0 +1,50 @@
+import hashlib
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, dimension: int = 768, latency: float = 0.05, model_id: str = 'fake'):
+        """
+        A local stand-in for the embedding API, for load tests and benchmarks that must not spend quota.
+
+        Vectors are pseudo-random but deterministic per text, and every call sleeps for a fixed latency,
+        as one request to the API would, whatever the number of texts.
+
+        Args:
+        - dimension (int): The vector dimension.
+        - latency (float): The seconds each call takes.
+        - model_id (str): The model id, keying query caches like a real model's.
+        """
+        self.dimension = dimension
+        self.latency = latency
+        self.model_id = model_id
+        self.calls = 0
+
+    def vector(self, text: str) -> List[float]:
+        """
+        Return the unit vector of a text.
+
+        Args:
+        - text (str): The text.
+        """
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    def get_dimension(self) -> int:
+        return self.dimension
@@ -0,0 +1,182 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Union
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Statuses worth retrying, and the subset that means the server is asking us to slow down
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+
+def create_connector(limit: int = 100, limit_per_host: int = 8, ttl_dns_cache: int = 300) -> aiohttp.TCPConnector:
+    """
+    Create the TCP connector shared by every request of a crawl.
+
+    Args:
+    - limit (int): The maximum number of open connections in total.
+    - limit_per_host (int): The maximum number of open connections to a single host.
+    - ttl_dns_cache (int): How long resolved addresses are cached, in seconds.
+
+    Returns:
+    - aiohttp.TCPConnector: The connector to open the client session with.
+    """
+    return aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, ttl_dns_cache=ttl_dns_cache)
+
+
+def parse_retry_after(value: str) -> Union[float, None]:
+    """
+    Parse a Retry-After header, given either as delay seconds or as an HTTP date.
+
+    Args:
+    - value (str): The header value.
+
+    Returns:
+    - float: The number of seconds to wait, or None if the header is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: float = None) -> float:
+    """
+    Compute how long to wait before the next attempt, using exponential backoff with full jitter.
+
+    A Retry-After hint from the server takes precedence, capped like any other delay.
+
+    Args:
+    - attempt (int): The zero-based number of the attempt that just failed.
+    - base (float): The delay of the first retry, in seconds.
+    - cap (float): The maximum delay, in seconds.
+    - retry_after (float): The delay requested by the server, if any.
+
+    Returns:
+    - float: The delay in seconds.
+    """
+    if retry_after is not None:
+        return min(cap, retry_after)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        A token bucket refilled continuously at a fixed rate.
+
+        Args:
+        - rate (float): The number of tokens added per second.
+        - capacity (float): The maximum number of tokens, i.e. the allowed burst.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Wait until a token is available and take it.
+        """
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostRateLimiter:
+    def __init__(self, rate: float, burst: float = None):
+        """
+        Rate limit requests separately for every host, with one token bucket per host.
+
+        Args:
+        - rate (float): The number of requests per second allowed to each host, or None for no limit.
+        - burst (float): The number of requests a host may receive back to back.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    async def acquire(self, url: str) -> None:
+        """
+        Wait until a request to the host of the given URL is allowed.
+
+        Args:
+        - url (str): The URL about to be requested.
+        """
+        if not self.rate:
+            return
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        await self.buckets[host].acquire()
+
+
+class AdaptiveConcurrency:
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64, target_latency: float = 2.0,
+                 increase_every: int = 10):
+        """
+        Limit the number of in-flight requests, adapting the limit to how the server responds
+        (additive increase, multiplicative decrease).
+
+        The limit grows by one after every increase_every fast responses, and is halved when a
+        response is slower than target_latency or the server throttles us.
+
+        Args:
+        - initial (int): The starting limit.
+        - minimum (int): The lowest the limit may go.
+        - maximum (int): The highest the limit may go.
+        - target_latency (float): Responses slower than this, in seconds, count as congestion.
+        - increase_every (int): The number of fast responses needed to raise the limit by one.
+        """
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.increase_every = increase_every
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """
+        Wait for a free request slot and take it.
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, latency: float = None, throttled: bool = False) -> None:
+        """
+        Give back a request slot and adapt the limit to the outcome of the request.
+
+        Args:
+        - latency (float): How long the request took, in seconds, or None if it failed without a response.
+        - throttled (bool): Whether the server asked us to slow down.
+        """
+        async with self.condition:
+            self.in_flight -= 1
+            if throttled or (latency is not None and latency > self.target_latency):
+                self.limit = max(self.minimum, self.limit // 2)
+                self.successes = 0
+            elif latency is not None:
+                self.successes += 1
+                if self.successes >= self.increase_every:
+                    self.limit = min(self.maximum, self.limit + 1)
+                    self.successes = 0
+            self.condition.notify_all()
@@ -0,0 +1,234 @@
+import math
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ['Flat', 'HNSW', 'IVF-Flat', 'IVF-PQ', 'IVF-SQ8']
+# Product quantizer codebooks have 2^8 centroids, which need at least that many training vectors
+PQ_CENTROIDS = 256
+# faiss wants about this many training vectors per IVF list
+TRAINING_POINTS_PER_LIST = 39
+
+
+def auto_nlist(number_of_documents: int) -> int:
+    """
+    Choose the number of IVF lists for the expected corpus size: about 4 * sqrt(N),
+    while keeping enough vectors per list to train on.
+
+    Args:
+    - number_of_documents (int): The expected number of vectors in the index.
+    """
+    return max(1, min(int(4 * math.sqrt(number_of_documents)), number_of_documents // TRAINING_POINTS_PER_LIST))
+
+
+def auto_pq_m(dimension: int) -> int:
+    """
+    Choose the number of product quantizer sub-vectors: the largest divisor of the dimension up to 64,
+    keeping sub-vectors of at least 8 dimensions.
+
+    Args:
+    - dimension (int): The vector dimension.
+    """
+    return next(m for m in range(min(64, max(1, dimension // 8)), 0, -1) if dimension % m == 0)
+
+
+def index_settings(config_data: Dict, dimension: int, number_of_documents: int = None) -> Dict:
+    """
+    Read the index settings from the config, filling in the ones sized from NUMBER_OF_DOCUMENT.
+
+    Args:
+    - config_data (Dict): The loaded config.yaml.
+    - dimension (int): The vector dimension.
+    - number_of_documents (int): The known corpus size, overriding NUMBER_OF_DOCUMENT.
+
+    Returns:
+    - Dict: The index type and its build and search settings.
+    """
+    number_of_documents = number_of_documents if number_of_documents else config_data.get('NUMBER_OF_DOCUMENT', 1000)
+    nlist = config_data.get('IVF_NLIST') or auto_nlist(number_of_documents)
+    return {
+        'index_type': config_data.get('INDEX_TYPE', 'Flat'),
+        'hnsw_m': config_data.get('HNSW_M', 32),
+        'ef_construction': config_data.get('HNSW_EF_CONSTRUCTION', 200),
+        'ef_search': config_data.get('HNSW_EF_SEARCH', 64),
+        'nlist': nlist,
+        'nprobe': config_data.get('IVF_NPROBE') or max(1, nlist // 8),
+        'pq_m': config_data.get('PQ_M') or auto_pq_m(dimension),
+        'rerank_k_factor': config_data.get('RERANK_K_FACTOR', 0),
+        'train_sample_size': config_data.get('TRAIN_SAMPLE_SIZE', max(nlist * TRAINING_POINTS_PER_LIST, 10000)),
+    }
+
+
+def build_index(dimension: int, settings: Dict) -> faiss.Index:
+    """
+    Build an empty FAISS index of the configured type. IVF indexes need to be trained before use.
+
+    Args:
+    - dimension (int): The vector dimension.
+    - settings (Dict): The index settings, see index_settings.
+
+    Returns:
+    - faiss.Index: The index, wrapped in an exact re-ranking stage if rerank_k_factor is set.
+    """
+    index_type = settings['index_type']
+    descriptions = {
+        'Flat': 'Flat',
+        'HNSW': f"HNSW{settings['hnsw_m']}",
+        'IVF-Flat': f"IVF{settings['nlist']},Flat",
+        'IVF-PQ': f"IVF{settings['nlist']},PQ{settings['pq_m']}",
+        'IVF-SQ8': f"IVF{settings['nlist']},SQ8",
+    }
+    if index_type not in descriptions:
+        raise ValueError(f"Unknown INDEX_TYPE '{index_type}', expected one of {INDEX_TYPES}")
+
+    description = descriptions[index_type]
+    if settings['rerank_k_factor'] and index_type != 'Flat':
+        description += ',RFlat'
+    index = faiss.index_factory(dimension, description, faiss.METRIC_L2)
+
+    if index_type == 'HNSW':
+        base_index(index).hnsw.efConstruction = settings['ef_construction']
+    configure_search(index, settings)
+    return index
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """
+    Return the approximate index inside an exact re-ranking stage, or the index itself.
+
+    Args:
+    - index (faiss.Index): The index.
+    """
+    if isinstance(index, faiss.IndexRefine):
+        return faiss.downcast_index(index.base_index)
+    return index
+
+
+def configure_search(index: faiss.Index, settings: Dict) -> None:
+    """
+    Apply the search-time settings (nprobe, efSearch, re-ranking depth) to an index.
+
+    Args:
+    - index (faiss.Index): The index.
+    - settings (Dict): The index settings, see index_settings.
+    """
+    if isinstance(index, faiss.IndexRefine) and settings['rerank_k_factor']:
+        index.k_factor = settings['rerank_k_factor']
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = settings['ef_search']
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None:
+        ivf.nprobe = min(settings['nprobe'], ivf.nlist)
+
+
+def min_training_size(index: faiss.Index) -> int:
+    """
+    Return the smallest number of vectors the index can be trained on.
+
+    Args:
+    - index (faiss.Index): The index.
+    """
+    ivf = faiss.try_extract_index_ivf(base_index(index))
+    if ivf is None:
+        return 0
+    if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ):
+        return max(ivf.nlist, PQ_CENTROIDS)
+    return ivf.nlist
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray, settings: Dict) -> faiss.Index:
+    """
+    Train an index on a sample of vectors.
+
+    A sample too small for the configured index falls back to an exact Flat index, since such
+    a small corpus is searched fast enough without one.
+
+    Args:
+    - index (faiss.Index): The untrained index.
+    - vectors (np.ndarray): The training vectors, float32 of shape (n, dimension).
+    - settings (Dict): The index settings, see index_settings.
+
+    Returns:
+    - faiss.Index: The trained index, or the Flat fallback.
+    """
+    if len(vectors) < min_training_size(index):
+        return faiss.IndexFlatL2(index.d)
+
+    sample = vectors
+    if len(vectors) > settings['train_sample_size']:
+        rows = np.random.default_rng(0).choice(len(vectors), settings['train_sample_size'], replace=False)
+        sample = vectors[rows]
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return index
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector, exhaustive: bool = False) -> faiss.SearchParameters:
+    """
+    Build the search parameters restricting a search to the ids accepted by a selector.
+
+    Search parameters replace the settings stored on the index for that search, so the current
+    nprobe, efSearch and re-ranking depth are carried over.
+
+    Args:
+    - index (faiss.Index): The index to search.
+    - selector (faiss.IDSelector): The selector.
+    - exhaustive (bool): Probe every IVF list, so selected vectors outside the nearest lists are found too.
+    """
+    base = base_index(index)
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist if exhaustive else ivf.nprobe)
+    elif isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+
+    if isinstance(index, faiss.IndexRefine):
+        # The refine stage only re-ranks what the base index returns, so the selector goes to the base
+        return faiss.IndexRefineSearchParameters(k_factor=index.k_factor, base_index_params=params)
+    return params
+
+
+def exact_storage(index: faiss.Index) -> Optional[faiss.Index]:
+    """
+    Return the flat index holding the exact vectors of an index at the same positions, if it has one:
+    the index itself if it is Flat, the re-ranking stage, or the storage of an HNSW graph.
+
+    Args:
+    - index (faiss.Index): The index.
+    """
+    if isinstance(index, faiss.IndexFlat):
+        return index
+    if isinstance(index, faiss.IndexRefine):
+        return faiss.downcast_index(index.refine_index)
+    if isinstance(index, faiss.IndexHNSW):
+        storage = faiss.downcast_index(index.storage)
+        if isinstance(storage, faiss.IndexFlat):
+            return storage
+    return None
+
+
+def reconstruct_vectors(index: faiss.Index, positions: np.ndarray) -> np.ndarray:
+    """
+    Read vectors back from an index. Flat, HNSW and IVF-Flat indexes return them exactly,
+    quantized indexes return their approximation.
+
+    Args:
+    - index (faiss.Index): The index.
+    - positions (np.ndarray): The positions of the vectors.
+
+    Returns:
+    - np.ndarray: The vectors, float32 of shape (len(positions), dimension).
+    """
+    ivf = faiss.try_extract_index_ivf(base_index(index))
+    if ivf is None or isinstance(index, faiss.IndexRefine) or ivf.direct_map.type != faiss.DirectMap.NoMap:
+        return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+    # IVF indexes need a map from positions to their inverted lists to reconstruct, dropped again after
+    ivf.make_direct_map()
+    try:
+        return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+    finally:
+        ivf.make_direct_map(False)
@@ -0,0 +1,161 @@
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+# Letters and digits of any script, so Vietnamese syllables with their diacritics stay whole
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase tokens. Vietnamese writes words as space-separated syllables,
+    so each syllable is a token, composed to NFC so the same syllable always has the same code points.
+
+    Args:
+    - text (str): The text.
+    """
+    return TOKEN_PATTERN.findall(unicodedata.normalize('NFC', text).lower())
+
+
+def fold_diacritics(token: str) -> str:
+    """
+    Strip the diacritics of a token, e.g. 'phở' to 'pho' and 'đường' to 'duong'.
+
+    Args:
+    - token (str): The token.
+    """
+    decomposed = unicodedata.normalize('NFD', token.replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def match_query(text: str) -> Optional[str]:
+    """
+    Build the FTS5 query of a text: any of its tokens, matched exactly if typed with diacritics,
+    and against the folded column otherwise, since queries are often typed without them.
+
+    Args:
+    - text (str): The query text.
+
+    Returns:
+    - str: The FTS5 query, or None if the text has no tokens.
+    """
+    terms = []
+    for token in dict.fromkeys(tokenize(text)):
+        folded = fold_diacritics(token)
+        terms.append(f'folded : "{folded}"' if folded == token else f'exact : "{token}"')
+    return ' OR '.join(terms) if terms else None
+
+
+class LexicalIndex:
+    def __init__(self, docstore):
+        """
+        A BM25 inverted index of the documents of a SQLiteDocstore, kept in an FTS5 table of the same file,
+        so exact-term queries such as dish names need neither an embedding call nor a vector search.
+
+        Each document is indexed twice: its tokens as written, and with their diacritics folded.
+        The docstore keeps the index in step as documents are added and deleted.
+
+        Args:
+        - docstore (SQLiteDocstore): The docstore holding the lexical tables.
+        """
+        self.docstore = docstore
+
+    def create_tables(self) -> bool:
+        """
+        Create the lexical tables. Called by the docstore, within its lock.
+
+        Returns:
+        - bool: Whether they did not exist yet.
+        """
+        connection = self.docstore.connection
+        created = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lexical'"
+        ).fetchone() is None
+        # FTS5 rows are addressed by rowid, so document ids get one of their own
+        connection.execute("CREATE TABLE IF NOT EXISTS lexical_ids (rowid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE)")
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS lexical USING fts5(exact, folded, tokenize='unicode61 remove_diacritics 0')"
+        )
+        return created
+
+    def add_texts(self, texts: Dict[str, str]) -> None:
+        """
+        Index texts. Called by the docstore, within its lock and transaction.
+
+        Args:
+        - texts (Dict[str, str]): The page contents, by document id.
+        """
+        connection = self.docstore.connection
+        connection.executemany("INSERT OR IGNORE INTO lexical_ids (id) VALUES (?)", [(id_,) for id_ in texts])
+        rows = []
+        for id_, text in texts.items():
+            tokens = tokenize(text)
+            rows.append((id_, ' '.join(tokens), ' '.join(fold_diacritics(token) for token in tokens)))
+        connection.executemany(
+            "INSERT INTO lexical (rowid, exact, folded) VALUES ((SELECT rowid FROM lexical_ids WHERE id = ?), ?, ?)",
+            rows,
+        )
+
+    def delete_ids(self, ids: List[str]) -> None:
+        """
+        Drop documents from the index. Called by the docstore, within its lock and transaction.
+
+        Args:
+        - ids (List[str]): The document ids.
+        """
+        connection = self.docstore.connection
+        connection.executemany(
+            "DELETE FROM lexical WHERE rowid = (SELECT rowid FROM lexical_ids WHERE id = ?)", [(id_,) for id_ in ids]
+        )
+        connection.executemany("DELETE FROM lexical_ids WHERE id = ?", [(id_,) for id_ in ids])
+
+    def delete_orphans(self) -> None:
+        """
+        Drop the documents no longer in the docstore. Called by the docstore, within its lock and transaction.
+        """
+        connection = self.docstore.connection
+        connection.execute(
+            "DELETE FROM lexical WHERE rowid IN "
+            "(SELECT rowid FROM lexical_ids WHERE id NOT IN (SELECT id FROM documents))"
+        )
+        connection.execute("DELETE FROM lexical_ids WHERE id NOT IN (SELECT id FROM documents)")
+
+    def clear(self) -> None:
+        """
+        Empty the index. Called by the docstore, within its lock and transaction.
+        """
+        self.docstore.connection.execute("DELETE FROM lexical")
+        self.docstore.connection.execute("DELETE FROM lexical_ids")
+
+    def search(self, text: str, k: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Return the documents best matching a text by BM25.
+
+        Args:
+        - text (str): The query text.
+        - k (int): The number of documents.
+        - filter (Dict[str, Any]): An equality metadata filter, see SQLiteDocstore.filter_positions.
+
+        Returns:
+        - List[Tuple[str, float]]: The document ids and their BM25 scores, higher is better.
+        """
+        query = match_query(text)
+        if query is None:
+            return []
+
+        sql = (
+            "SELECT i.id, -bm25(lexical) AS score FROM lexical JOIN lexical_ids i ON i.rowid = lexical.rowid "
+            "WHERE lexical MATCH ?"
+        )
+        parameters = [query]
+        if filter:
+            ids_query = self.docstore.filter_ids_query(filter)
+            if ids_query is None:
+                raise ValueError(f"Lexical search only supports equality filters, got {filter}")
+            sql += f" AND i.id IN ({ids_query[0]})"
+            parameters.extend(ids_query[1])
+        sql += " ORDER BY bm25(lexical) LIMIT ?"
+        parameters.append(k)
+
+        with self.docstore.lock:
+            return self.docstore.connection.execute(sql, parameters).fetchall()
@@ -0,0 +1,120 @@
+import hashlib
+import re
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+FINGERPRINT_BITS = 64
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+class SimHashIndex:
+    def __init__(self, similarity_threshold: float = 0.95, shingle_size: int = 3):
+        """
+        Detect near-duplicate texts with 64-bit SimHash fingerprints.
+
+        Two texts are near-duplicates when their fingerprints differ in at most max_distance bits,
+        with max_distance derived from the similarity threshold. Lookups are banded: the fingerprint
+        is split into max_distance + 1 bands, and by the pigeonhole principle any fingerprint within
+        max_distance bits matches at least one band exactly. Only those candidates are compared,
+        so a lookup does not scan the whole index.
+
+        Args:
+        - similarity_threshold (float): The fraction of equal fingerprint bits, above 0 and at most 1,
+          from which two texts count as near-duplicates.
+        - shingle_size (int): The number of consecutive words hashed together.
+        """
+        # At 0 every text would match, with more bands than fingerprint bits; above 1 there would be no band
+        if not 0 < similarity_threshold <= 1:
+            raise ValueError(f"similarity_threshold must be above 0 and at most 1, got {similarity_threshold}")
+        self.max_distance = int((1 - similarity_threshold) * FINGERPRINT_BITS)
+        self.shingle_size = shingle_size
+
+        num_bands = self.max_distance + 1
+        band_width = FINGERPRINT_BITS // num_bands
+        self.bands: List[Tuple[int, int]] = [
+            (band * band_width, FINGERPRINT_BITS - band * band_width if band == num_bands - 1 else band_width)
+            for band in range(num_bands)
+        ]
+        self.tables: List[Dict[int, List[Tuple[int, str]]]] = [{} for _ in self.bands]
+
+    def fingerprint(self, text: str) -> Union[int, None]:
+        """
+        Compute the SimHash fingerprint of a text over its word shingles.
+
+        Args:
+        - text (str): The text.
+
+        Returns:
+        - int: The 64-bit fingerprint, or None if the text has no words.
+        """
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        if not tokens:
+            return None
+        size = min(self.shingle_size, len(tokens))
+        shingles = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+             for shingle in shingles],
+            dtype='>u8',
+        )
+        # Every bit of the fingerprint is the majority vote of that bit over the shingle hashes
+        bits = np.unpackbits(hashes.view(np.uint8)).reshape(-1, FINGERPRINT_BITS)
+        majority = bits.sum(axis=0) * 2 > len(hashes)
+        return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
+    def band_keys(self, fingerprint: int) -> List[int]:
+        """
+        Split a fingerprint into its band values.
+
+        Args:
+        - fingerprint (int): The fingerprint.
+        """
+        return [(fingerprint >> start) & ((1 << width) - 1) for start, width in self.bands]
+
+    def find(self, fingerprint: int) -> Union[str, None]:
+        """
+        Find an indexed text that is a near-duplicate of the given fingerprint.
+
+        Args:
+        - fingerprint (int): The fingerprint to look up.
+
+        Returns:
+        - str: The key of the near-duplicate, or None if there is none.
+        """
+        for table, band_key in zip(self.tables, self.band_keys(fingerprint)):
+            for candidate, key in table.get(band_key, []):
+                if bin(candidate ^ fingerprint).count('1') <= self.max_distance:
+                    return key
+        return None
+
+    def add(self, key: str, fingerprint: int) -> None:
+        """
+        Add a fingerprint to the index.
+
+        Args:
+        - key (str): The key identifying the text, e.g. its URL.
+        - fingerprint (int): The fingerprint of the text.
+        """
+        for table, band_key in zip(self.tables, self.band_keys(fingerprint)):
+            table.setdefault(band_key, []).append((fingerprint, key))
+
+    def check_and_add(self, key: str, text: str) -> Union[str, None]:
+        """
+        Look up a text and index it if it is not a near-duplicate of an indexed one.
+
+        Args:
+        - key (str): The key identifying the text, e.g. its URL.
+        - text (str): The text.
+
+        Returns:
+        - str: The key of the near-duplicate, or None if the text is new.
+        """
+        fingerprint = self.fingerprint(text)
+        if fingerprint is None:
+            return None
+        duplicate_of = self.find(fingerprint)
+        if duplicate_of is None:
+            self.add(key, fingerprint)
+        return duplicate_of
@@ -0,0 +1,217 @@
+import csv
+import json
+import os
+import time
+from typing import Dict, List, Union
+
+from common.logger import Logger
+
+# The sidecar describing an output file: whether it holds every page or only the changed ones, and whether
+# the crawl writing it completed
+FEED_INFO_SUFFIX = '.feed.json'
+
+
+class RecordSink(Logger):
+    def __init__(self, path: str, fields: List[str], append: bool = False, buffer_size: Union[int, None] = 100,
+                 flush_interval: float = 5.0):
+        """
+        Base class of the streaming writers: records are buffered and written out in batches,
+        whenever the buffer is full or flush_interval seconds have passed since the last write-out.
+
+        Args:
+        - path (str): The output file.
+        - fields (List[str]): The record fields, in output order.
+        - append (bool): Append to an existing file instead of starting a new one.
+        - buffer_size (int): The number of records buffered before they are written out, or None to
+          write them out only when flush is called, e.g. in step with the commits of a CrawlState.
+        - flush_interval (float): The maximum number of seconds a record stays buffered.
+        """
+        super().__init__()
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self.fields = fields
+        self.append = append
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.buffer: List[Dict[str, str]] = []
+        self.flushed_at = time.monotonic()
+        self.records_written = 0
+
+    def write(self, record: Dict[str, str]) -> None:
+        """
+        Add a record to the output.
+
+        Args:
+        - record (Dict[str, str]): The record, keyed by field name.
+        """
+        self.buffer.append(record)
+        if self.buffer_size is None:
+            return
+        if len(self.buffer) >= self.buffer_size or time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write out every buffered record.
+        """
+        if self.buffer:
+            self.write_records(self.buffer)
+            self.records_written += len(self.buffer)
+            self.buffer = []
+        self.flushed_at = time.monotonic()
+
+    def write_records(self, records: List[Dict[str, str]]) -> None:
+        """
+        Write a batch of records to the file. Implemented by every sink format.
+
+        Args:
+        - records (List[Dict[str, str]]): The records.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Flush the remaining records and close the file.
+        """
+        self.flush()
+        self.info(f"Wrote {self.records_written} records to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CSVSink(RecordSink):
+    def __init__(self, path: str, fields: List[str], **kwargs):
+        """
+        Stream records to a CSV file with a header row.
+        """
+        super().__init__(path, fields, **kwargs)
+        write_header = not (self.append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self.file = open(path, 'a' if self.append else 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction='ignore')
+        if write_header:
+            self.writer.writeheader()
+
+    def write_records(self, records: List[Dict[str, str]]) -> None:
+        self.writer.writerows(records)
+        self.file.flush()
+
+    def close(self) -> None:
+        super().close()
+        self.file.close()
+
+
+class JSONLSink(RecordSink):
+    def __init__(self, path: str, fields: List[str], **kwargs):
+        """
+        Stream records to a JSON Lines file, one object per line.
+        """
+        super().__init__(path, fields, **kwargs)
+        self.file = open(path, 'a' if self.append else 'w', encoding='utf-8')
+
+    def write_records(self, records: List[Dict[str, str]]) -> None:
+        self.file.write(''.join(
+            json.dumps({field: record.get(field) for field in self.fields}, ensure_ascii=False) + '\n'
+            for record in records
+        ))
+        self.file.flush()
+
+    def close(self) -> None:
+        super().close()
+        self.file.close()
+
+
+class ParquetSink(RecordSink):
+    def __init__(self, path: str, fields: List[str], **kwargs):
+        """
+        Stream records to a Parquet file, one row group per flushed batch. Requires pyarrow.
+
+        Parquet files cannot be appended to, so in append mode the records go to a new part file
+        next to the existing one.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(path, fields, **kwargs)
+        if self.append and os.path.exists(path):
+            stem, extension = os.path.splitext(path)
+            part = 1
+            while os.path.exists(f"{stem}.part{part}{extension}"):
+                part += 1
+            self.path = f"{stem}.part{part}{extension}"
+
+        self.pa = pa
+        self.schema = pa.schema([(field, pa.string()) for field in fields])
+        self.writer = pq.ParquetWriter(self.path, self.schema)
+
+    def write_records(self, records: List[Dict[str, str]]) -> None:
+        columns = {field: [record.get(field) for record in records] for field in self.fields}
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self) -> None:
+        super().close()
+        self.writer.close()
+
+
+SINK_FORMATS = {
+    '.csv': CSVSink,
+    '.jsonl': JSONLSink,
+    '.parquet': ParquetSink,
+}
+
+
+def open_sink(path: str, fields: List[str], **kwargs) -> RecordSink:
+    """
+    Open the streaming writer matching the extension of the output file.
+
+    Args:
+    - path (str): The output file, ending in .csv, .jsonl or .parquet.
+    - fields (List[str]): The record fields, in output order.
+    - kwargs: Passed on to the sink, see RecordSink.
+
+    Returns:
+    - RecordSink: The opened sink.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINK_FORMATS:
+        raise ValueError(f"Unsupported output format '{extension}', expected one of {list(SINK_FORMATS)}")
+    return SINK_FORMATS[extension](path, fields, **kwargs)
+
+
+def write_feed_info(path: str, incremental: bool, complete: bool) -> None:
+    """
+    Describe an output file in its sidecar, replaced atomically.
+
+    Args:
+    - path (str): The output file.
+    - incremental (bool): The file only holds the pages that changed since the last crawl.
+    - complete (bool): The crawl writing the file completed.
+    """
+    info_path = path + FEED_INFO_SUFFIX
+    with open(f"{info_path}.tmp", 'w', encoding='utf-8') as file:
+        json.dump({"incremental": incremental, "complete": complete}, file)
+    os.replace(f"{info_path}.tmp", info_path)
+
+
+def read_feed_info(path: str) -> Union[Dict[str, bool], None]:
+    """
+    Read the sidecar of an output file.
+
+    Args:
+    - path (str): The output file.
+
+    Returns:
+    - Dict[str, bool]: The incremental and complete flags, or None if the file has no sidecar,
+      i.e. was not written by the crawler.
+    """
+    info_path = path + FEED_INFO_SUFFIX
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
@@ -0,0 +1,92 @@
+import codecs
+import hashlib
+import re
+from typing import Dict, List, Union
+
+import chardet
+from bs4 import BeautifulSoup
+
+# Only the head of the document is inspected for a <meta charset>, and only a prefix is handed to chardet
+META_SNIFF_BYTES = 4096
+CHARDET_SNIFF_BYTES = 64 * 1024
+
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-:.]+)', re.IGNORECASE)
+FALLBACK_ENCODING = 'ISO-8859-1'
+
+
+def normalize_encoding(encoding: str) -> Union[str, None]:
+    """
+    Return the canonical codec name for an encoding label, or None if Python does not know it.
+
+    Args:
+    - encoding (str): The encoding label, e.g. from an HTTP header or a meta tag.
+    """
+    if not encoding:
+        return None
+    try:
+        return codecs.lookup(encoding.strip()).name
+    except LookupError:
+        return None
+
+
+def detect_encoding(raw_data: bytes, http_charset: str = None) -> str:
+    """
+    Detect the encoding of an HTML document as cheaply as possible.
+
+    The HTTP charset is trusted first, then a <meta charset> in the head of the document,
+    and only then chardet, which runs over a prefix of the body rather than the whole of it.
+
+    Args:
+    - raw_data (bytes): The raw response body.
+    - http_charset (str): The charset from the Content-Type response header, if any.
+
+    Returns:
+    - str: The encoding to decode the document with.
+    """
+    encoding = normalize_encoding(http_charset)
+    if encoding:
+        return encoding
+
+    match = META_CHARSET_PATTERN.search(raw_data[:META_SNIFF_BYTES])
+    if match:
+        encoding = normalize_encoding(match.group(1).decode('ascii', errors='ignore'))
+        if encoding:
+            return encoding
+
+    encoding = normalize_encoding(chardet.detect(raw_data[:CHARDET_SNIFF_BYTES])['encoding'])
+    return encoding if encoding else FALLBACK_ENCODING
+
+
+def parse_page(raw_data: bytes, http_charset: str = None, parser: str = 'html.parser') -> Dict[str, Union[str, List[str]]]:
+    """
+    Decode and parse an HTML document into everything the crawler needs from it.
+
+    This is a module level function so it can be sent to a process pool.
+
+    Args:
+    - raw_data (bytes): The raw response body.
+    - http_charset (str): The charset from the Content-Type response header, if any.
+    - parser (str): The BeautifulSoup parser backend, e.g. 'html.parser' or 'lxml'.
+
+    Returns:
+    - Dict[str, Union[str, List[str]]]: The raw hrefs, title, metadata, text and content hash of the page.
+    """
+    html = raw_data.decode(detect_encoding(raw_data, http_charset), errors='replace')
+    soup = BeautifulSoup(html, parser)
+
+    title = str(soup.title.string) if soup.title and soup.title.string else "No Title"
+
+    # Extract all metadata tags
+    metadata = {meta.attrs.get("name", meta.attrs.get("property", "unknown")): meta.attrs.get("content", "")
+                for meta in soup.find_all("meta")}
+
+    # Join metadata into a single string with key-value pairs
+    metadata_str = "; ".join([f"{key}: {value}" for key, value in metadata.items()])
+
+    return {
+        "title": title,
+        "metadata": metadata_str,
+        "contents": soup.get_text(separator='\n', strip=True),
+        "content_hash": hashlib.md5(html.encode('utf-8')).hexdigest(),
+        "hrefs": [str(a_tag['href']) for a_tag in soup.find_all('a', href=True)],
+    }
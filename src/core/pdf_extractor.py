@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Tuple
+
+from langchain_core.documents import Document
+
+from common.logger import Logger
+
+# The crawler saves PDFs as '{sha256}.pdf'
+CONTENT_ADDRESSED_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+BLANK_LINES_PATTERN = re.compile(r'\n\s*\n')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hash a file, reading it chunk by chunk.
+
+    Args:
+    - path (str): The file path.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def split_blocks(text: str) -> List[str]:
+    """
+    Split the layout-preserving text of a page into its blocks, the runs of lines between blank lines,
+    so headings, paragraphs and table rows become records of their own.
+
+    Args:
+    - text (str): The page text.
+    """
+    blocks = []
+    for block in BLANK_LINES_PATTERN.split(text):
+        # Layout mode pads columns with spaces, which carry no meaning once the block is cut out
+        lines = [re.sub(r' {2,}', '  ', line).strip() for line in block.splitlines()]
+        block = '\n'.join(line for line in lines if line)
+        if block:
+            blocks.append(block)
+    return blocks
+
+
+def extract_pdf(pdf_path: str, layout: bool = False) -> List[Tuple[int, int, str]]:
+    """
+    Extract the text of a PDF page by page, or block by block within pages with layout.
+
+    This is a module level function so it can be sent to a process pool.
+
+    Args:
+    - pdf_path (str): The PDF path.
+    - layout (bool): Extract in layout mode and split pages into blocks.
+
+    Returns:
+    - List[Tuple[int, int, str]]: The (page number, block number, text) records, numbered from 1,
+      without empty pages and blocks.
+    """
+    from pypdf import PdfReader
+
+    records = []
+    for page_number, page in enumerate(PdfReader(pdf_path).pages, start=1):
+        if layout:
+            blocks = split_blocks(page.extract_text(extraction_mode='layout') or '')
+        else:
+            text = (page.extract_text() or '').strip()
+            blocks = [text] if text else []
+        records.extend((page_number, block_number, block) for block_number, block in enumerate(blocks, start=1))
+    return records
+
+
+class PDFExtractor(Logger):
+    def __init__(self, pdf_folder: str, cache_path: str = None, layout: bool = False, workers: int = None):
+        """
+        Extract the text of the PDFs downloaded by the crawler in a process pool, as Documents for insert_document.
+
+        Extracted records are cached in SQLite by PDF content hash and extraction mode, so a PDF is parsed
+        once however often the folder is inserted, and a PDF downloaded again from another URL is not parsed again.
+        The crawler's manifest.json gives each PDF its URL and original file name.
+
+        Args:
+        - pdf_folder (str): The folder holding the PDFs.
+        - cache_path (str): The SQLite cache file, 'pdf_text_cache.sqlite' in pdf_folder if not given.
+        - layout (bool): Split pages into layout blocks, see split_blocks.
+        - workers (int): The number of extraction processes, one per core if not given.
+        """
+        super().__init__()
+        self.pdf_folder = pdf_folder
+        self.cache_path = cache_path if cache_path else os.path.join(pdf_folder, "pdf_text_cache.sqlite")
+        self.layout = layout
+        self.workers = workers if workers else os.cpu_count()
+        self.parsed = 0
+        self.cached = 0
+        self.failed = 0
+
+        folder = os.path.dirname(self.cache_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.connection = sqlite3.connect(self.cache_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pdfs (sha256 TEXT NOT NULL, layout INTEGER NOT NULL, "
+            "num_records INTEGER NOT NULL, extracted_at REAL, PRIMARY KEY (sha256, layout))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS records (sha256 TEXT NOT NULL, layout INTEGER NOT NULL, "
+            "page INTEGER NOT NULL, block INTEGER NOT NULL, text TEXT NOT NULL, PRIMARY KEY (sha256, layout, page, block))"
+        )
+        self.connection.commit()
+
+    def list_pdfs(self) -> List[Dict[str, str]]:
+        """
+        List the PDFs of the folder with their content hash, URL and name.
+        """
+        sources = {}
+        manifest_path = os.path.join(self.pdf_folder, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+                for url, entry in json.load(manifest_file).items():
+                    sources.setdefault(entry["file"], {"url": url, "name": entry["name"]})
+
+        pdfs = []
+        for file_name in sorted(os.listdir(self.pdf_folder)):
+            if not file_name.lower().endswith('.pdf'):
+                continue
+            path = os.path.join(self.pdf_folder, file_name)
+            stem = os.path.splitext(file_name)[0]
+            sha256 = stem if CONTENT_ADDRESSED_PATTERN.match(stem) else file_sha256(path)
+            source = sources.get(file_name, {"url": "", "name": file_name})
+            pdfs.append({"path": path, "sha256": sha256, "url": source["url"], "name": source["name"]})
+        return pdfs
+
+    def cached_records(self, sha256: str) -> List[Tuple[int, int, str]]:
+        """
+        Return the cached records of a PDF, or None if it was not extracted in this mode yet.
+
+        Args:
+        - sha256 (str): The PDF content hash.
+        """
+        layout = int(self.layout)
+        if self.connection.execute(
+            "SELECT 1 FROM pdfs WHERE sha256 = ? AND layout = ?", (sha256, layout)
+        ).fetchone() is None:
+            return None
+        return self.connection.execute(
+            "SELECT page, block, text FROM records WHERE sha256 = ? AND layout = ? ORDER BY page, block",
+            (sha256, layout),
+        ).fetchall()
+
+    def store_records(self, sha256: str, records: List[Tuple[int, int, str]]) -> None:
+        """
+        Cache the records of a PDF.
+
+        Args:
+        - sha256 (str): The PDF content hash.
+        - records (List[Tuple[int, int, str]]): Its records.
+        """
+        layout = int(self.layout)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO records (sha256, layout, page, block, text) VALUES (?, ?, ?, ?, ?)",
+            [(sha256, layout, page, block, text) for page, block, text in records],
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pdfs (sha256, layout, num_records, extracted_at) VALUES (?, ?, ?, ?)",
+            (sha256, layout, len(records), time.time()),
+        )
+        self.connection.commit()
+
+    def to_documents(self, pdf: Dict[str, str], records: List[Tuple[int, int, str]]) -> List[Document]:
+        """
+        Turn the records of a PDF into Documents, with the metadata Preprocessor gives csv rows.
+
+        Args:
+        - pdf (Dict[str, str]): The PDF, see list_pdfs.
+        - records (List[Tuple[int, int, str]]): Its records.
+        """
+        documents = []
+        for page, block, text in records:
+            metadata = {"field": "pdf", "url": pdf["url"], "title": pdf["name"], "page": page}
+            if self.layout:
+                metadata["block"] = block
+            documents.append(Document(page_content=text, metadata=metadata))
+        return documents
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[List[Document]]:
+        """
+        Stream the Documents of the folder's PDFs in batches, like Preprocessor.iter_csv:
+        cached PDFs first, then the others as the process pool finishes them.
+
+        Args:
+        - batch_size (int): The number of documents per batch, a PDF's documents are never split.
+        """
+        batch = []
+        for documents in self.iter_pdf_documents():
+            batch.extend(documents)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def iter_pdf_documents(self) -> Iterator[List[Document]]:
+        """
+        Stream the Documents of the folder's PDFs, PDF by PDF.
+        """
+        pdfs = self.list_pdfs()
+        to_parse = []
+        for pdf in pdfs:
+            records = self.cached_records(pdf["sha256"])
+            if records is None:
+                to_parse.append(pdf)
+                continue
+            self.cached += 1
+            if records:
+                yield self.to_documents(pdf, records)
+
+        if to_parse:
+            self.info(f"Extracting {len(to_parse)} PDFs in {self.workers} processes, {self.cached} cached")
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                # A bounded number of PDFs in flight keeps every core busy without holding every result in memory
+                queue = iter(to_parse)
+                in_flight = {}
+                for pdf in queue:
+                    in_flight[pool.submit(extract_pdf, pdf["path"], self.layout)] = pdf
+                    if len(in_flight) >= 2 * self.workers:
+                        break
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pdf = in_flight.pop(future)
+                        next_pdf = next(queue, None)
+                        if next_pdf is not None:
+                            in_flight[pool.submit(extract_pdf, next_pdf["path"], self.layout)] = next_pdf
+                        try:
+                            records = future.result()
+                        except Exception as e:
+                            self.failed += 1
+                            self.warning(f"Can not extract {pdf['name']} ({pdf['path']}): {e}")
+                            continue
+                        self.parsed += 1
+                        self.store_records(pdf["sha256"], records)
+                        if records:
+                            yield self.to_documents(pdf, records)
+
+        self.info(f"Extracted {self.parsed} PDFs, {self.cached} from cache, {self.failed} failed")
+
+    def close(self) -> None:
+        """
+        Close the cache.
+        """
+        self.connection.close()
@@ -1,33 +1,59 @@
 import pandas as pd
 
+from typing import Iterator, List
+
 from common.logger import Logger
 from langchain_core.documents import Document
 
+# The crawler writes page texts to 'contents', the curated datasets use 'content'
+CONTENT_COLUMNS = ['content', 'contents']
+METADATA_COLUMNS = ['field', 'url', 'title']
+
 
 class Preprocessor(Logger):
     def __init__(self):
         super().__init__()
         pass
 
-    def format_csv(self, csv_file_path: str) -> Document:
+    def iter_csv(self, csv_file_path: str, chunksize: int = 1000) -> Iterator[List[Document]]:
         """
-        Convert your content to right format
+        Stream a CSV file as batches of documents, reading it chunk by chunk
 
         Args:
-        - Content (dict): your content save in dict type
+        - csv_file_path (str): your csv path
+        - chunksize (int): the number of rows read, and documents yielded, at a time
         """
-        df = pd.read_csv(csv_file_path)
+        reader = pd.read_csv(csv_file_path, chunksize=chunksize)
+        for chunk in reader:
+            content_column = next((column for column in CONTENT_COLUMNS if column in chunk.columns), None)
+            if content_column is None:
+                raise ValueError(f"{csv_file_path} has none of the content columns {CONTENT_COLUMNS}")
 
-        documents = []
-        for _, row in df.iterrows():
-            page_content = row['content']
-            metadata = {
-                'field': row.get('field', 'unknown')
+            chunk = chunk[chunk[content_column].notna()]
+            contents = chunk[content_column].astype(str).tolist()
+
+            # Build the metadata column by column rather than row by row
+            metadata_values = {
+                'field': (chunk['field'].fillna('unknown').astype(str).tolist() if 'field' in chunk.columns
+                          else ['unknown'] * len(contents))
             }
-            document = Document(page_content=page_content, metadata=metadata)
-            documents.append(document)
-        
-        return documents
+            for column in METADATA_COLUMNS[1:]:
+                if column in chunk.columns:
+                    metadata_values[column] = chunk[column].fillna('').astype(str).tolist()
+
+            yield [
+                Document(page_content=content, metadata={key: values[i] for key, values in metadata_values.items()})
+                for i, content in enumerate(contents)
+            ]
+
+    def format_csv(self, csv_file_path: str) -> List[Document]:
+        """
+        Convert your content to right format
+
+        Args:
+        - csv_file_path (str): your csv path
+        """
+        return [document for documents in self.iter_csv(csv_file_path) for document in documents]
 
 # test = Preprocessor()
 # print(test.format_csv('/home/hhkhanh/DATAVENGERS/src/core/ex.csv'))
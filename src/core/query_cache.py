@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional
+
+
+class QueryCache:
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = 3600):
+        """
+        A thread-safe in-process LRU cache whose entries expire after a time to live.
+
+        Meant for query embeddings: the same questions come back constantly, and a hit here saves
+        both the embedding request and the SQLite lookup of CachedEmbeddings.
+
+        Args:
+        - max_entries (int): The maximum number of entries, the least recently used ones are evicted past it.
+        - ttl (float): The number of seconds an entry stays valid, or None to keep entries until evicted.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, object]:
+        """
+        Return the live entries of the given keys, marking them as recently used.
+        Expired entries are dropped.
+
+        Args:
+        - keys (Iterable[Hashable]): The keys.
+
+        Returns:
+        - Dict[Hashable, object]: The cached values, by key.
+        """
+        found = {}
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                    continue
+                value, expires_at = entry
+                if expires_at is not None and expires_at <= now:
+                    del self.entries[key]
+                    self.misses += 1
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = value
+                self.hits += 1
+        return found
+
+    def put_many(self, values: Dict[Hashable, object]) -> None:
+        """
+        Cache values, evicting the least recently used entries if the cache is full.
+
+        Args:
+        - values (Dict[Hashable, object]): The values, by key.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            for key, value in values.items():
+                self.entries[key] = (value, expires_at)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drop every entry.
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the hit and miss counters and the number of cached entries.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
@@ -1,4 +1,6 @@
 import asyncio
+from common.config_loader import ConfigLoader
+from common.metrics import start_exporters, stop_exporters
 from core.crawler import DataCrawler
 
 def main():
@@ -8,20 +10,42 @@ def main():
     # Define the maximum depth for recursive crawling
     max_depth = 3
 
+    # Define the number of concurrent crawl workers
+    num_workers = 10
+
+    # Decode and parse pages in a process pool with the lxml backend
+    parser = "lxml"
+    parse_executor = "process"
+
+    # Be polite to the host: cap connections and requests per second
+    max_connections_per_host = 8
+    requests_per_second = 10
+
     # Define paths for saving the results
     extracted_files_dir = "src/database/extracted_files"
     download_folder = f"{extracted_files_dir}/pdf_files"
     output_csv = f"{extracted_files_dir}/page_contents_v3.csv"
+    state_path = f"{extracted_files_dir}/crawl_state.sqlite"
 
     # Initialize the DataCrawler
     crawler = DataCrawler(
         base_url=base_url,
         max_depth=max_depth,
-        download_folder=download_folder
+        download_folder=download_folder,
+        num_workers=num_workers,
+        parser=parser,
+        parse_executor=parse_executor,
+        max_connections_per_host=max_connections_per_host,
+        requests_per_second=requests_per_second,
+        state_path=state_path
     )
 
-    # Start the crawling and extraction process asynchronously
-    asyncio.run(crawler.start_extract(output_csv=output_csv))
+    # Start the crawling and extraction process asynchronously, exporting metrics as configured
+    exporters = start_exporters(ConfigLoader().config_data or {})
+    try:
+        asyncio.run(crawler.start_extract(output_csv=output_csv))
+    finally:
+        stop_exporters(exporters)
 
     print(f"Crawling and extraction completed. Results saved to {output_csv} and PDFs saved in {download_folder}.")
 
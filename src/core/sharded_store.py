@@ -0,0 +1,312 @@
+import hashlib
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from common.config_loader import ConfigLoader
+from common.logger import Logger
+from common.rw_lock import ReadWriteLock
+from core.sqlite_docstore import SQLiteDocstore
+from core.vector_store import VectorStore
+
+
+class ShardedVectorStore(Logger):
+    def __init__(self, vector_store_name, embeddings, num_shards=None, shard_key=None, folder_path=None,
+                 vector_store_handler=None, mmap=False):
+        '''
+        A vector store spread over several FAISS shards, each an ordinary store saved by VectorStore,
+        so each is built, compacted and rebuilt on its own and only one has to be in memory to rebuild it.
+
+        Documents go to a shard by rendezvous hashing of their id, or of a metadata value such as 'field'
+        with shard_key, which keeps the documents sharing it together and lets filters on it search one shard.
+        Adding a shard only moves the documents that now hash to it, when their csv is inserted again.
+
+        Searches run on every shard in parallel threads, FAISS releasing the GIL, and the top k are merged by score.
+        Every shard has a reader/writer lock: searches share it, and inserts and rebuilds take it to change the index.
+        The shard names and the shard key are kept in '{vector_store_name}.shards.json'.
+
+        Args:
+        - vector_store_name (str): your sharded vector store name
+        - embeddings (object): embedding model
+        - num_shards (int): the number of shards of a new store, SHARD_COUNT if not given
+        - shard_key (str): the metadata key to shard by, SHARD_KEY if not given, the document id if neither
+        - folder_path (str): the folder holding the shards, DEFAULT_VECTOR_STORE_SAVING_PATH if not given
+        - vector_store_handler (VectorStore): a VectorStore to share
+        - mmap (bool): memory-map the shard indexes, read-only: inserts are rejected
+        '''
+        super().__init__()
+        config_data = ConfigLoader().config_data or {}
+        self.vector_store_name = vector_store_name
+        self.embedding_function = embeddings
+        self.folder_path = folder_path or config_data.get('DEFAULT_VECTOR_STORE_SAVING_PATH', '.')
+        self.handler = vector_store_handler or VectorStore()
+        self.mmap = mmap
+        self.manifest_path = os.path.join(self.folder_path, f"{vector_store_name}.shards.json")
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        else:
+            num_shards = num_shards or config_data.get('SHARD_COUNT', 4)
+            manifest = {
+                'shards': [self.shard_name(i) for i in range(num_shards)],
+                'shard_key': shard_key or config_data.get('SHARD_KEY'),
+            }
+        self.shard_names = manifest['shards']
+        self.shard_key = manifest['shard_key']
+        self.shards = {name: self.open_shard(name) for name in self.shard_names}
+        self.locks = {name: ReadWriteLock() for name in self.shard_names}
+        self.save_manifest()
+
+        # Searches and inserts have threads of their own, so a batch of upserts waiting on shard write locks
+        # never holds up the searches of the shards it is not writing to
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=config_data.get('SHARD_WORKERS', len(self.shard_names)),
+            thread_name_prefix='shard-search',
+        )
+        self.insert_executor = ThreadPoolExecutor(
+            max_workers=config_data.get('SHARD_INSERT_WORKERS', len(self.shard_names)),
+            thread_name_prefix='shard-insert',
+        )
+
+    def shard_name(self, number):
+        '''
+        Return the store name of a shard
+
+        Args:
+        - number (int): the shard number
+        '''
+        return f"{self.vector_store_name}.shard{number:03d}"
+
+    def save_manifest(self):
+        '''
+        Write the shard names and the shard key
+        '''
+        if not os.path.exists(self.folder_path):
+            os.makedirs(self.folder_path)
+        with open(f"{self.manifest_path}.tmp", 'w', encoding='utf-8') as file:
+            json.dump({'shards': self.shard_names, 'shard_key': self.shard_key}, file)
+        os.replace(f"{self.manifest_path}.tmp", self.manifest_path)
+
+    def open_shard(self, name):
+        '''
+        Load a shard, or create it empty
+
+        Args:
+        - name (str): the shard store name
+        '''
+        index_path, docstore_path = self.handler.vector_store_paths(self.folder_path, name)
+        if os.path.exists(index_path) and os.path.exists(docstore_path):
+            return self.handler.load_vector_store(self.folder_path, name, self.embedding_function, mmap=self.mmap)
+        return self.handler.creat_vector_store(self.embedding_function, docstore=SQLiteDocstore(docstore_path))
+
+    def add_shard(self):
+        '''
+        Add an empty shard. Documents move to it as their csv files are inserted again
+        '''
+        name = self.shard_name(max(int(name.rsplit('shard', 1)[1]) for name in self.shard_names) + 1)
+        self.shards[name] = self.open_shard(name)
+        self.locks[name] = ReadWriteLock()
+        self.shard_names.append(name)
+        self.save_manifest()
+        self.info(
+            message=f"Added shard {name} to {self.vector_store_name}"
+        )
+        return name
+
+    def shard_of(self, value):
+        '''
+        Return the shard a sharding value goes to: the one whose hash with the value is highest
+
+        Args:
+        - value (str): the document id or its shard_key value
+        '''
+        return max(
+            self.shard_names,
+            key=lambda name: hashlib.sha256(f"{name}\0{value}".encode('utf-8')).digest(),
+        )
+
+    def shard_of_document(self, document, id_):
+        '''
+        Return the shard of a document
+
+        Args:
+        - document (Document): the document
+        - id_ (str): its id
+        '''
+        if self.shard_key is None:
+            return self.shard_of(id_)
+        return self.shard_of(json.dumps(document.metadata.get(self.shard_key), ensure_ascii=False))
+
+    def shards_for_filter(self, filter):
+        '''
+        Return the shards that can hold documents matching a filter: one if it fixes the shard_key value
+
+        Args:
+        - filter (dict or callable): the metadata filter, if any
+        '''
+        if self.shard_key is not None and isinstance(filter, dict):
+            value = filter.get(self.shard_key)
+            if isinstance(value, dict) and list(value) == ['$eq']:
+                value = value['$eq']
+            if value is not None and not isinstance(value, (dict, list)):
+                return [self.shard_of(json.dumps(value, ensure_ascii=False))]
+        return self.shard_names
+
+    def insert_document(self, csv_file, chunksize=1000, write_lock=None, delete_missing=None):
+        '''
+        Upsert the documents of a csv into the shards, like VectorStore.insert_document,
+        each batch inserted into its shards in parallel
+
+        Args:
+        - csv_file: your csv path
+        - chunksize (int): the number of rows read and inserted at a time
+        - write_lock (callable): returns the context held while an index changes, e.g. ReadWriteLock.write,
+          taken before the shard's own lock
+        - delete_missing (bool): delete the chunks of the csv not met again, see VectorStore.insert_document
+        '''
+        if self.mmap:
+            # Adding to a memory-mapped FAISS index aborts the process
+            raise ValueError(f"{self.vector_store_name} is memory-mapped and read-only, open it with mmap=False to insert")
+        try:
+            if delete_missing is None:
+                delete_missing = not self.handler.is_partial_feed(csv_file)
+            source = os.path.normpath(csv_file)
+            # Ids are tracked per shard, so documents that moved to another shard are deleted from their old one
+            seen = {name: set() for name in self.shard_names}
+            pending = {name: [] for name in self.shard_names}
+            total = skipped = 0
+            docstores = [self.shards[name].docstore for name in self.shard_names]
+            batches = self.handler.read_chunks(csv_file, chunksize=chunksize, docstores=docstores,
+                                               partial=not delete_missing)
+            for documents in batches:
+                groups = {}
+                for document in documents:
+                    id_ = self.handler.document_id(document)
+                    group = groups.setdefault(self.shard_of_document(document, id_), ([], []))
+                    group[0].append(document)
+                    group[1].append(id_)
+
+                # A page's old chunks may live in any shard
+                for name in self.shard_names:
+                    keep = seen[name] | set(groups[name][1] if name in groups else ())
+                    self.handler.release_replaced(self.shards[name], documents, source, keep,
+                                                  self.shard_write_lock(name, write_lock))
+
+                futures = [
+                    self.insert_executor.submit(self.handler.upsert_documents, self.shards[name], shard_documents, ids,
+                                         seen[name], pending[name], self.shard_write_lock(name, write_lock))
+                    for name, (shard_documents, ids) in groups.items()
+                ]
+                for future in futures:
+                    inserted, batch_skipped = future.result()
+                    total += inserted
+                    skipped += batch_skipped
+
+            for name in self.shard_names:
+                shard_lock = self.shard_write_lock(name, write_lock)
+                total += self.handler.flush_pending(self.shards[name], pending[name], shard_lock)
+                if delete_missing:
+                    self.handler.delete_stale(self.shards[name], source, seen[name], shard_lock)
+            self.info(
+                message=f"Inserted {total} new chunks and skipped {skipped} unchanged ones from {csv_file} "
+                        f"into {len(self.shard_names)} shards"
+            )
+        except:
+            self.error(
+                message= f"Can not insert your contents to the sharded vector store, traceback = {traceback.format_exc()}"
+            )
+
+    def shard_write_lock(self, name, write_lock=None):
+        '''
+        Return the context held while a shard changes: the caller's lock, if any, then the shard's own
+
+        Args:
+        - name (str): the shard store name
+        - write_lock (callable): the caller's lock, e.g. ReadWriteLock.write
+        '''
+        @contextmanager
+        def lock():
+            with (write_lock or nullcontext)():
+                with self.locks[name].write():
+                    yield
+        return lock
+
+    def save(self, write_lock=None):
+        '''
+        Save every shard, each one only written as far as it changed, see VectorStore.save_vector_store
+
+        Args:
+        - write_lock (callable): returns the context held while saving
+        '''
+        with (write_lock or nullcontext)():
+            for name in self.shard_names:
+                with self.locks[name].write():
+                    self.handler.save_vector_store(self.shards[name], self.folder_path, name)
+
+    def rebuild_shard(self, name, index_type=None):
+        '''
+        Rebuild one shard, dropping the vectors of its deleted documents, optionally as another index type,
+        while the other shards keep serving. Searches of this shard wait for the rebuild, which renumbers its positions
+
+        Args:
+        - name (str): the shard store name
+        - index_type (str): the new index type, one of Flat, HNSW, IVF-Flat, IVF-PQ, IVF-SQ8
+        '''
+        shard = self.shards[name]
+        with self.locks[name].write():
+            if shard.deleted_positions:
+                self.handler.compact_vector_store(shard)
+            if index_type is not None:
+                self.handler.migrate_vector_store(shard, index_type)
+            self.handler.save_vector_store(shard, self.folder_path, name)
+
+    def search_shard(self, name, embeddings, k, filter, fetch_k, **kwargs):
+        '''
+        Search one shard under its read lock
+
+        Args:
+        - name (str): the shard store name
+        - embeddings (list): the query vectors
+        '''
+        with self.locks[name].read():
+            return self.shards[name].similarity_search_with_score_by_vectors(embeddings, k, filter, fetch_k, **kwargs)
+
+    def similarity_search_with_score_by_vectors(self, embeddings, k=4, filter=None, fetch_k=20, **kwargs):
+        '''
+        Search the shards in parallel and merge their results into the k best per query,
+        like FAISSStore.similarity_search_with_score_by_vectors
+
+        Args:
+        - embeddings (list): the query vectors
+        - k (int): the number of documents per query
+        - filter (dict or callable): the metadata filter, if any
+        - fetch_k (int): the number of results fetched per query and shard before filtering
+        '''
+        names = self.shards_for_filter(filter)
+        futures = [
+            self.search_executor.submit(self.search_shard, name, embeddings, k, filter, fetch_k, **kwargs)
+            for name in names
+        ]
+        shard_results = [future.result() for future in futures]
+
+        descending = self.distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+        return [
+            sorted((hit for results in shard_results for hit in results[query]),
+                   key=lambda hit: hit[1], reverse=descending)[:k]
+            for query in range(len(embeddings))
+        ]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20, **kwargs):
+        return self.similarity_search_with_score_by_vectors([embedding], k, filter, fetch_k, **kwargs)[0]
+
+    @property
+    def distance_strategy(self):
+        return self.shards[self.shard_names[0]].distance_strategy
+
+    def _select_relevance_score_fn(self):
+        return self.shards[self.shard_names[0]]._select_relevance_score_fn()
@@ -0,0 +1,636 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional, Set, Tuple, Union
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from common.logger import Logger
+from core.lexical_index import LexicalIndex
+
+# SQLite limits the number of host parameters of a statement
+LOOKUP_BATCH_SIZE = 500
+# Metadata the chunker adds to every chunk, unique per chunk and never filtered on
+UNINDEXED_ATTRIBUTES = ('chunk_index', 'start_offset', 'end_offset')
+
+
+class SQLiteDocstore(Logger, Docstore, AddableMixin):
+    def __init__(self, path: str):
+        """
+        A docstore kept in an indexed SQLite file instead of a pickled dict.
+
+        Opening the store reads nothing: documents are fetched by id when a search returns them,
+        so a process serving queries starts without loading the corpus, and several processes can
+        read the same file at once. The file also holds the FAISS position to document id mapping,
+        see index_mapping, the tombstones of deleted positions and the log of vectors added since
+        the index file was last written.
+
+        Documents are indexed by the sources they were read from, e.g. CSV paths: a chunk met in several
+        files is stored once and belongs to each of them, see add_sources and release_source. Every
+        scalar metadata value is kept in an attribute index, so metadata filters can be resolved
+        to FAISS positions before searching, see filter_positions. Their contents are also kept
+        in a BM25 index, see lexical_index. The boilerplate lines learned from each source are kept too,
+        so later partial reads of the source are chunked like the full one, see Chunker.
+
+        Args:
+        - path (str): The path to the SQLite file.
+        """
+        super().__init__()
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents "
+            "(id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL, source TEXT)"
+        )
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(documents)")]
+        if 'source' not in columns:
+            self.connection.execute("ALTER TABLE documents ADD COLUMN source TEXT")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS documents_source ON documents (source)")
+        backfill_sources = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'document_sources'"
+        ).fetchone() is None
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS document_sources (id TEXT NOT NULL, source TEXT NOT NULL, PRIMARY KEY (id, source))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS document_sources_source ON document_sources (source)")
+        if backfill_sources:
+            # Stores written before documents could have several sources only know the first one
+            self.connection.execute(
+                "INSERT OR IGNORE INTO document_sources (id, source) SELECT id, source FROM documents WHERE source IS NOT NULL"
+            )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, id TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS positions_id ON positions (id)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tombstones (position INTEGER PRIMARY KEY)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS vector_log (position INTEGER PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        backfill = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'attributes'"
+        ).fetchone() is None
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS attributes (key TEXT NOT NULL, value TEXT NOT NULL, id TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS attributes_key_value ON attributes (key, value)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS attributes_id ON attributes (id)")
+        if backfill:
+            # Stores written before the attribute index existed get it built once
+            self.connection.executemany(
+                "INSERT INTO attributes (key, value, id) VALUES (?, ?, ?)",
+                (row for id_, metadata in self.connection.execute("SELECT id, metadata FROM documents")
+                 for row in attribute_rows(id_, json.loads(metadata))),
+            )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS boilerplate (source TEXT PRIMARY KEY, lines TEXT NOT NULL)")
+        if self.lexical_index().create_tables():
+            self.lexical_index().add_texts(dict(self.connection.execute("SELECT id, page_content FROM documents")))
+        self.connection.commit()
+
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        Fetch a document by id.
+
+        Args:
+        - search (str): The document id.
+
+        Returns:
+        - Document: The document, or a message if there is no such id, like InMemoryDocstore.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT page_content, metadata FROM documents WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def search_many(self, ids: List[str]) -> Dict[str, Document]:
+        """
+        Fetch several documents by id with as few queries as possible.
+
+        Args:
+        - ids (List[str]): The document ids.
+
+        Returns:
+        - Dict[str, Document]: The documents found, by id.
+        """
+        found = {}
+        with self.lock:
+            for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[start:start + LOOKUP_BATCH_SIZE]
+                rows = self.connection.execute(
+                    f"SELECT id, page_content, metadata FROM documents WHERE id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update(
+                    (id_, Document(id=id_, page_content=page_content, metadata=json.loads(metadata)))
+                    for id_, page_content, metadata in rows
+                )
+        return found
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """
+        Add documents to the store.
+
+        Args:
+        - texts (Dict[str, Document]): The documents, by id.
+        """
+        overlapping = self.search_many(list(texts))
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {set(overlapping)}")
+        with self.lock:
+            self.connection.executemany(
+                "INSERT INTO documents (id, page_content, metadata, source) VALUES (?, ?, ?, ?)",
+                [(id_, document.page_content, json.dumps(document.metadata, ensure_ascii=False),
+                  document.metadata.get('source')) for id_, document in texts.items()],
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO document_sources (id, source) VALUES (?, ?)",
+                [(id_, document.metadata['source']) for id_, document in texts.items()
+                 if document.metadata.get('source') is not None],
+            )
+            self.connection.executemany(
+                "INSERT INTO attributes (key, value, id) VALUES (?, ?, ?)",
+                [row for id_, document in texts.items() for row in attribute_rows(id_, document.metadata)],
+            )
+            self.lexical_index().add_texts({id_: document.page_content for id_, document in texts.items()})
+            self.connection.commit()
+
+    def delete(self, ids: List) -> None:
+        """
+        Delete documents from the store.
+
+        Args:
+        - ids (List): The document ids.
+        """
+        with self.lock:
+            self.connection.executemany("DELETE FROM documents WHERE id = ?", [(id_,) for id_ in ids])
+            self.connection.executemany("DELETE FROM document_sources WHERE id = ?", [(id_,) for id_ in ids])
+            self.connection.executemany("DELETE FROM attributes WHERE id = ?", [(id_,) for id_ in ids])
+            self.lexical_index().delete_ids(ids)
+            self.connection.commit()
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """
+        Return which of the given ids are in the store.
+
+        Args:
+        - ids (List[str]): The document ids.
+        """
+        existing = set()
+        with self.lock:
+            for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[start:start + LOOKUP_BATCH_SIZE]
+                existing.update(row[0] for row in self.connection.execute(
+                    f"SELECT id FROM documents WHERE id IN ({','.join('?' * len(batch))})", batch
+                ))
+        return existing
+
+    def source_ids(self, source: str) -> Set[str]:
+        """
+        Return the ids of the documents read from a source.
+
+        Args:
+        - source (str): The source, e.g. a CSV path.
+        """
+        with self.lock:
+            return {row[0] for row in self.connection.execute(
+                "SELECT id FROM document_sources WHERE source = ?", (source,)
+            )}
+
+    def source_ids_with(self, source: str, key: str, values: List[Any]) -> Set[str]:
+        """
+        Return the ids of the documents read from a source whose metadata value of key is one of values.
+
+        Args:
+        - source (str): The source, e.g. a CSV path.
+        - key (str): The metadata key, e.g. 'url'.
+        - values (List[Any]): The accepted values.
+        """
+        encoded = [attribute_value(value) for value in values]
+        ids = set()
+        with self.lock:
+            for start in range(0, len(encoded), LOOKUP_BATCH_SIZE):
+                batch = encoded[start:start + LOOKUP_BATCH_SIZE]
+                ids.update(row[0] for row in self.connection.execute(
+                    "SELECT DISTINCT attributes.id FROM attributes "
+                    "JOIN document_sources ON document_sources.id = attributes.id "
+                    f"WHERE attributes.key = ? AND attributes.value IN ({','.join('?' * len(batch))}) "
+                    "AND document_sources.source = ?", [key, *batch, source]
+                ))
+        return ids
+
+    def boilerplate(self, source: str) -> Optional[Set[str]]:
+        """
+        Return the boilerplate lines learned from a source.
+
+        Args:
+        - source (str): The source, e.g. a CSV path.
+
+        Returns:
+        - Set[str]: The lines, or None if none were learned from the source yet.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT lines FROM boilerplate WHERE source = ?", (source,)).fetchone()
+        return set(json.loads(row[0])) if row else None
+
+    def set_boilerplate(self, source: str, lines: Set[str]) -> None:
+        """
+        Keep the boilerplate lines learned from a source.
+
+        Args:
+        - source (str): The source.
+        - lines (Set[str]): The normalized boilerplate lines.
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO boilerplate (source, lines) VALUES (?, ?)",
+                (source, json.dumps(sorted(lines), ensure_ascii=False)),
+            )
+            self.connection.commit()
+
+    def add_sources(self, pairs: List[Tuple[str, str]]) -> None:
+        """
+        Record that documents already in the store were also read from other sources.
+
+        Args:
+        - pairs (List[Tuple[str, str]]): The (document id, source) pairs.
+        """
+        with self.lock:
+            self.connection.executemany("INSERT OR IGNORE INTO document_sources (id, source) VALUES (?, ?)", pairs)
+            self.connection.commit()
+
+    def release_source(self, ids: Set[str], source: str) -> Set[str]:
+        """
+        Detach documents from a source they are no longer read from.
+
+        Args:
+        - ids (Set[str]): The document ids.
+        - source (str): The source.
+
+        Returns:
+        - Set[str]: The ids left without any source, to delete.
+        """
+        ids = list(ids)
+        with self.lock:
+            self.connection.executemany(
+                "DELETE FROM document_sources WHERE id = ? AND source = ?", [(id_, source) for id_ in ids]
+            )
+            orphans = set()
+            for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[start:start + LOOKUP_BATCH_SIZE]
+                orphans.update(batch)
+                orphans.difference_update(row[0] for row in self.connection.execute(
+                    f"SELECT DISTINCT id FROM document_sources WHERE id IN ({','.join('?' * len(batch))})", batch
+                ))
+            self.connection.commit()
+        return orphans
+
+    def delete_documents(self, ids: List[str]) -> List[int]:
+        """
+        Delete documents and turn their positions into tombstones, in one transaction.
+        Their vectors stay in the index until it is compacted.
+
+        Args:
+        - ids (List[str]): The document ids.
+
+        Returns:
+        - List[int]: The positions of the deleted documents.
+        """
+        positions = []
+        with self.lock:
+            for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                batch = ids[start:start + LOOKUP_BATCH_SIZE]
+                positions.extend(row[0] for row in self.connection.execute(
+                    f"SELECT position FROM positions WHERE id IN ({','.join('?' * len(batch))}) "
+                    "AND position NOT IN (SELECT position FROM tombstones)", batch
+                ))
+            self.connection.executemany("INSERT OR IGNORE INTO tombstones (position) VALUES (?)",
+                                        [(position,) for position in positions])
+            self.connection.executemany("DELETE FROM documents WHERE id = ?", [(id_,) for id_ in ids])
+            self.connection.executemany("DELETE FROM document_sources WHERE id = ?", [(id_,) for id_ in ids])
+            self.connection.executemany("DELETE FROM attributes WHERE id = ?", [(id_,) for id_ in ids])
+            self.lexical_index().delete_ids(ids)
+            self.connection.commit()
+        return positions
+
+    def tombstones(self) -> List[int]:
+        """
+        Return the positions of the deleted documents.
+        """
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT position FROM tombstones")]
+
+    def append_vectors(self, start_position: int, vectors: np.ndarray) -> None:
+        """
+        Log vectors added to the index since its file was last written.
+
+        Args:
+        - start_position (int): The position of the first vector.
+        - vectors (np.ndarray): The vectors, of shape (n, dimension).
+        """
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO vector_log (position, vector) VALUES (?, ?)",
+                [(start_position + i, np.asarray(vector, dtype=np.float32).tobytes()) for i, vector in enumerate(vectors)],
+            )
+            self.connection.commit()
+
+    def logged_vectors(self, start_position: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Read the logged vectors back.
+
+        Args:
+        - start_position (int): The first position to read, the ones before are already in the index file.
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray]: The positions and the float32 vectors, in position order.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT position, vector FROM vector_log WHERE position >= ? ORDER BY position", (start_position,)
+            ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        return (np.array([position for position, _ in rows], dtype=np.int64),
+                np.vstack([np.frombuffer(vector, dtype=np.float32) for _, vector in rows]))
+
+    def log_size(self) -> int:
+        """
+        Return the number of logged vectors.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM vector_log").fetchone()[0]
+
+    def clear_log(self) -> None:
+        """
+        Empty the vector log, once the index file holds every vector.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM vector_log")
+            self.connection.commit()
+
+    def reset_positions(self, ids: List[str]) -> None:
+        """
+        Renumber the positions after the index was rebuilt without its tombstones.
+
+        Args:
+        - ids (List[str]): The document ids, in their new position order.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM positions")
+            self.connection.execute("DELETE FROM tombstones")
+            self.connection.executemany("INSERT INTO positions (position, id) VALUES (?, ?)", enumerate(ids))
+            self.connection.commit()
+
+    def clear(self) -> None:
+        """
+        Delete every document, attribute, position, tombstone and logged vector.
+        """
+        with self.lock:
+            for table in ('documents', 'document_sources', 'attributes', 'positions', 'tombstones', 'vector_log'):
+                self.connection.execute(f"DELETE FROM {table}")
+            self.lexical_index().clear()
+            self.connection.commit()
+
+    def truncate(self, num_positions: int) -> int:
+        """
+        Drop the positions from num_positions on, and the documents they pointed to.
+
+        Documents and positions are committed before their vectors are logged, so after a crash
+        the docstore can be ahead of the index file and the vector log.
+
+        Args:
+        - num_positions (int): The number of vectors in the index.
+
+        Returns:
+        - int: The number of positions dropped.
+        """
+        with self.lock:
+            cursor = self.connection.execute("DELETE FROM positions WHERE position >= ?", (num_positions,))
+            self.connection.execute("DELETE FROM tombstones WHERE position >= ?", (num_positions,))
+            self.connection.execute("DELETE FROM vector_log WHERE position >= ?", (num_positions,))
+            self.connection.execute("DELETE FROM documents WHERE id NOT IN (SELECT id FROM positions)")
+            self.connection.execute("DELETE FROM document_sources WHERE id NOT IN (SELECT id FROM documents)")
+            self.connection.execute("DELETE FROM attributes WHERE id NOT IN (SELECT id FROM documents)")
+            self.lexical_index().delete_orphans()
+            self.connection.commit()
+        return cursor.rowcount
+
+    def filter_positions(self, filter: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        Resolve a metadata filter to the positions of the live documents matching it, with the attribute index.
+
+        Supports the equality filters of FAISS: {key: value}, {key: [values]}, {key: {'$eq': value}},
+        {key: {'$in': [values]}}, several keys and '$and' meaning all of them.
+
+        Args:
+        - filter (Dict[str, Any]): The metadata filter.
+
+        Returns:
+        - np.ndarray: The sorted int64 positions, or None if the filter cannot be answered from the index.
+        """
+        ids_query = self.filter_ids_query(filter)
+        if ids_query is None:
+            return None
+
+        query = (f"SELECT position FROM positions WHERE id IN ({ids_query[0]}) "
+                 "EXCEPT SELECT position FROM tombstones")
+        with self.lock:
+            rows = self.connection.execute(query, ids_query[1]).fetchall()
+        return np.sort(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+
+    def filter_ids_query(self, filter: Dict[str, Any]) -> Optional[Tuple[str, List[str]]]:
+        """
+        Build the query selecting the ids of the documents matching a metadata filter, see filter_positions.
+
+        Args:
+        - filter (Dict[str, Any]): The metadata filter.
+
+        Returns:
+        - Tuple[str, List[str]]: The SQL query and its parameters, or None if the filter cannot be answered
+          from the attribute index.
+        """
+        conditions = filter_conditions(filter)
+        if not conditions:
+            return None
+
+        queries, parameters = [], []
+        for key, values in conditions:
+            queries.append(f"SELECT id FROM attributes WHERE key = ? AND value IN ({','.join('?' * len(values))})")
+            parameters.extend([key, *values])
+        return " INTERSECT ".join(queries), parameters
+
+    def lexical_index(self) -> LexicalIndex:
+        """
+        Return the BM25 index of the document contents kept in the same file.
+        """
+        return LexicalIndex(self)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def index_mapping(self) -> 'SQLiteIndexMapping':
+        """
+        Return the FAISS position to document id mapping kept in the same file.
+        """
+        return SQLiteIndexMapping(self)
+
+    def close(self) -> None:
+        """
+        Commit and close the SQLite connection.
+        """
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+def attribute_value(value: Any) -> Optional[str]:
+    """
+    Encode a metadata value for the attribute index, or return None if it is not a scalar.
+
+    Args:
+    - value (Any): The metadata value.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return json.dumps(value, ensure_ascii=False)
+    return None
+
+
+def attribute_rows(id_: str, metadata: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """
+    Return the attribute index rows of a document.
+
+    Args:
+    - id_ (str): The document id.
+    - metadata (Dict[str, Any]): Its metadata.
+    """
+    rows = []
+    for key, value in metadata.items():
+        encoded = attribute_value(value)
+        if key not in UNINDEXED_ATTRIBUTES and encoded is not None:
+            rows.append((key, encoded, id_))
+    return rows
+
+
+def filter_conditions(filter: Dict[str, Any]) -> Optional[List[Tuple[str, List[str]]]]:
+    """
+    Translate a metadata filter into (key, accepted encoded values) conditions, all of which must hold.
+
+    Args:
+    - filter (Dict[str, Any]): The metadata filter.
+
+    Returns:
+    - List[Tuple[str, List[str]]]: The conditions, or None if the filter uses anything else than equality.
+    """
+    conditions = []
+    for key, value in filter.items():
+        if key == '$and' and isinstance(value, list):
+            for sub_filter in value:
+                sub_conditions = filter_conditions(sub_filter) if isinstance(sub_filter, dict) else None
+                if sub_conditions is None:
+                    return None
+                conditions.extend(sub_conditions)
+            continue
+        if key.startswith('$') or key in UNINDEXED_ATTRIBUTES:
+            return None
+
+        if isinstance(value, dict):
+            if len(value) != 1:
+                return None
+            operator, operand = next(iter(value.items()))
+            if operator == '$eq':
+                value = operand
+            elif operator == '$in' and isinstance(operand, list):
+                value = operand
+            else:
+                return None
+        values = value if isinstance(value, list) else [value]
+        # None also matches documents without the key, which the index does not hold
+        if not values or any(item is None for item in values):
+            return None
+        encoded = [attribute_value(item) for item in values]
+        if None in encoded:
+            return None
+        conditions.append((key, encoded))
+    return conditions
+
+
+class SQLiteIndexMapping(MutableMapping[int, str]):
+    def __init__(self, docstore: SQLiteDocstore):
+        """
+        The index_to_docstore_id mapping of a FAISS vector store, read from and written to
+        the positions table of a SQLiteDocstore, so it is never loaded in full.
+
+        Args:
+        - docstore (SQLiteDocstore): The docstore holding the positions table.
+        """
+        self.docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        with self.docstore.lock:
+            row = self.docstore.connection.execute(
+                "SELECT id FROM positions WHERE position = ?", (int(position),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __setitem__(self, position: int, id_: str) -> None:
+        self.update({position: id_})
+
+    def __delitem__(self, position: int) -> None:
+        with self.docstore.lock:
+            cursor = self.docstore.connection.execute("DELETE FROM positions WHERE position = ?", (int(position),))
+            self.docstore.connection.commit()
+        if cursor.rowcount == 0:
+            raise KeyError(position)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(position for position, _ in self.items())
+
+    def __len__(self) -> int:
+        with self.docstore.lock:
+            return self.docstore.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def items(self) -> List[Tuple[int, str]]:
+        # One query instead of one lookup per position
+        with self.docstore.lock:
+            return self.docstore.connection.execute("SELECT position, id FROM positions ORDER BY position").fetchall()
+
+    def values(self) -> List[str]:
+        return [id_ for _, id_ in self.items()]
+
+    def update(self, mapping: Dict[int, str] = None, **kwargs) -> None:
+        # One transaction instead of one per position
+        with self.docstore.lock:
+            self.docstore.connection.executemany(
+                "INSERT OR REPLACE INTO positions (position, id) VALUES (?, ?)",
+                [(int(position), id_) for position, id_ in dict(mapping or {}, **kwargs).items()],
+            )
+            self.docstore.connection.commit()
+
+    def replace(self, mapping: Dict[int, str]) -> None:
+        """
+        Replace the whole mapping, e.g. after positions were compacted by a delete.
+
+        Args:
+        - mapping (Dict[int, str]): The new mapping.
+        """
+        with self.docstore.lock:
+            self.docstore.connection.execute("DELETE FROM positions")
+            self.docstore.connection.executemany(
+                "INSERT INTO positions (position, id) VALUES (?, ?)",
+                [(int(position), id_) for position, id_ in mapping.items()],
+            )
+            self.docstore.connection.commit()
@@ -1,60 +1,94 @@
 import faiss
+import hashlib
+import json
+import numpy as np
+import os
 import traceback
+from contextlib import nullcontext
 
 from common.config_loader import ConfigLoader
 from common.logger import Logger
+from common.metrics import timed
+from core.chunker import Chunker
+from core.faiss_store import FAISSStore
+from core.index_factory import build_index, configure_search, index_settings, reconstruct_vectors, train_index
+from core.output_sink import read_feed_info
+from core.pdf_extractor import PDFExtractor
 from core.preprocesor import Preprocessor
+from core.sqlite_docstore import SQLiteDocstore, SQLiteIndexMapping
 
-from uuid import uuid4
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
 
+# Vectors are read back and re-added this many at a time when an index is compacted
+COMPACTION_BATCH_SIZE = 10000
+# The metadata key identifying the page a chunk was cut from: a page met again replaces all its old chunks
+PAGE_KEY = 'url'
 
 
 class VectorStore(Logger):
     def __init__(self) -> None:
         super().__init__()
-        pass
+        config_data = ConfigLoader().config_data or {}
+        self.config_data = config_data
+        self.chunk_max_tokens = config_data.get('CHUNK_MAX_TOKENS', 512)
+        self.chunk_overlap_tokens = config_data.get('CHUNK_OVERLAP_TOKENS', 64)
+        # The index file is rewritten once the vector log outgrows both of these
+        self.compaction_min_log_size = config_data.get('COMPACTION_MIN_LOG_SIZE', 10000)
+        self.compaction_log_ratio = config_data.get('COMPACTION_LOG_RATIO', 0.2)
+        # The index is rebuilt without its tombstones once they are this fraction of it
+        self.compaction_tombstone_ratio = config_data.get('COMPACTION_TOMBSTONE_RATIO', 0.2)
 
-    def creat_vector_store(self, embeddings):
+    def creat_vector_store(self, embeddings, docstore=None):
         '''
         Create a new vector store 
 
         Args:
         - embeddings (object): embedding model
+        - docstore (SQLiteDocstore): an on-disk docstore to keep the documents in, in memory if not given
 
         Output:
         - FAISS vector store
         '''
                                                   
-        embedding_dimesion = len(embeddings.embed_query("I am Vietnamese"))
+        # The cached embeddings remember the dimension instead of spending an API call on it
+        if hasattr(embeddings, 'get_dimension'):
+            embedding_dimesion = embeddings.get_dimension()
+        else:
+            embedding_dimesion = len(embeddings.embed_query("I am Vietnamese"))
 
-        index = faiss.IndexFlatL2(embedding_dimesion)
+        # The index family and its sizing come from INDEX_TYPE and related keys in config.yaml
+        settings = index_settings(self.config_data, embedding_dimesion)
+        index = build_index(embedding_dimesion, settings)
 
-        vector_store = FAISS(
+        vector_store = FAISSStore(
             embedding_function=embeddings,
             index=index,
-            docstore=InMemoryDocstore(),
-            index_to_docstore_id={},
+            docstore=docstore if docstore is not None else InMemoryDocstore(),
+            index_to_docstore_id=docstore.index_mapping() if docstore is not None else {},
         )
 
         self.info(
-                message=f'Create a new vector store, save to local'
+                message=f'Create a new {settings["index_type"]} vector store, save to local'
         )
         return vector_store
 
-    def load_local_vector_store(self, vector_store_name, embeddings) -> object:
+    def load_local_vector_store(self, vector_store_name, embeddings, folder_path=None) -> object:
         """
-        Load an exist local vector store
+        Load an exist local vector store saved by FAISS.save_local, with its pickled docstore
 
         Args:
         - vector_store_name (str): your local vector store name
         - embeddings (list): embedding model
+        - folder_path (str): the folder holding the store, DEFAULT_VECTOR_STORE_SAVING_PATH if not given
         """
+        folder_path = folder_path or self.config_data.get('DEFAULT_VECTOR_STORE_SAVING_PATH', '.')
         try:
             vector_store = FAISS.load_local(
-                f"{vector_store_name}", embeddings, allow_dangerous_deserialization=True
+                folder_path, embeddings, index_name=vector_store_name, allow_dangerous_deserialization=True
             )
+            configure_search(vector_store.index, index_settings(self.config_data, vector_store.index.d))
             self.info(
                 message=f'Load vector store {vector_store_name} success'
             )
@@ -64,23 +98,606 @@ class VectorStore(Logger):
                 message= f"Can not load your vector store, traceback = {traceback.format_exc()}"
             )
 
-    def insert_document(self, vector_store, csv_file):
+    def vector_store_paths(self, folder_path, vector_store_name):
         """
-        Insert list of document to the vector store
+        Return the index and docstore paths of a vector store saved by save_vector_store
 
         Args:
-        - vector_store (object): your local vector store name
-        - csv_file: your csv path
+        - folder_path (str): the folder holding the store
+        - vector_store_name (str): your vector store name
+        """
+        return (
+            os.path.join(folder_path, f"{vector_store_name}.faiss"),
+            os.path.join(folder_path, f"{vector_store_name}.docstore.sqlite"),
+        )
+
+    @timed('save')
+    def save_vector_store(self, vector_store, folder_path, vector_store_name):
+        """
+        Save a vector store as a FAISS index file next to a SQLite docstore, without pickling.
+        A store whose docstore already lives in that SQLite file has its documents and new vectors
+        on disk already, so its index file is only rewritten, and compacted, once the vector log
+        or the tombstones grow past the COMPACTION_* thresholds
+
+        Args:
+        - vector_store (object): your vector store
+        - folder_path (str): the folder to save to
+        - vector_store_name (str): your vector store name
         """
+        index_path, docstore_path = self.vector_store_paths(folder_path, vector_store_name)
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+
+        docstore = vector_store.docstore
+        if not (isinstance(docstore, SQLiteDocstore) and os.path.abspath(docstore.path) == os.path.abspath(docstore_path)):
+            docstore = SQLiteDocstore(docstore_path)
+            ids = list(vector_store.index_to_docstore_id.values())
+            docstore.clear()
+            docstore.add({id_: vector_store.docstore.search(id_) for id_ in ids})
+            docstore.index_mapping().replace(dict(vector_store.index_to_docstore_id.items()))
+            self.write_index(vector_store, docstore, index_path)
+            return
+
+        if not isinstance(vector_store.index_to_docstore_id, SQLiteIndexMapping):
+            # FAISS.delete compacts the positions into a plain dict
+            docstore.index_mapping().replace(dict(vector_store.index_to_docstore_id.items()))
+
+        index = vector_store.index
+        num_deleted = len(getattr(vector_store, 'deleted_positions', ()))
+        if num_deleted and num_deleted > self.compaction_tombstone_ratio * index.ntotal:
+            self.compact_vector_store(vector_store)
+            self.write_index(vector_store, docstore, index_path)
+            return
+
+        log_size = docstore.log_size()
+        saved_ntotal = getattr(vector_store, 'saved_ntotal', None)
+        rewrite = (
+            not os.path.exists(index_path)
+            # The index was trained, migrated or rebuilt since it was written
+            or getattr(vector_store, 'saved_index', None) is not index
+            or getattr(vector_store, 'saved_trained', None) != index.is_trained
+            # Vectors were added without going through add_vectors
+            or saved_ntotal is None or index.ntotal != saved_ntotal + log_size
+            or log_size > max(self.compaction_min_log_size, self.compaction_log_ratio * saved_ntotal)
+        )
+        if rewrite:
+            self.write_index(vector_store, docstore, index_path)
+        else:
+            self.info(
+                message=f'Save vector store {vector_store_name}: {log_size} vectors logged since the index was written'
+            )
+
+    def write_index(self, vector_store, docstore, index_path):
+        """
+        Write the whole index file and empty the vector log it now includes
+
+        Args:
+        - vector_store (object): your vector store
+        - docstore (SQLiteDocstore): the docstore saved next to the index
+        - index_path (str): the index file path
+        """
+        # Readers may have the current file memory-mapped, so the new one replaces it atomically
+        faiss.write_index(vector_store.index, f"{index_path}.tmp")
+        os.replace(f"{index_path}.tmp", index_path)
+        docstore.clear_log()
+
+        vector_store.saved_index = vector_store.index
+        vector_store.saved_trained = vector_store.index.is_trained
+        vector_store.saved_ntotal = vector_store.index.ntotal
+        self.info(
+            message=f'Write the index of {vector_store.index.ntotal} vectors to {index_path}'
+        )
+
+    @timed('compact')
+    def compact_vector_store(self, vector_store):
+        """
+        Rebuild the index without the vectors of deleted documents and renumber the positions.
+        The rebuilt index keeps the training of the old one
+
+        Args:
+        - vector_store (object): your vector store, with a SQLite docstore
+        """
+        old_index = vector_store.index
+        live = [(position, id_) for position, id_ in vector_store.index_to_docstore_id.items()
+                if position not in vector_store.deleted_positions]
+
+        index = faiss.clone_index(old_index)
+        index.reset()
+        for start in range(0, len(live), COMPACTION_BATCH_SIZE):
+            positions = np.array([position for position, _ in live[start:start + COMPACTION_BATCH_SIZE]])
+            index.add(reconstruct_vectors(old_index, positions))
+        configure_search(index, index_settings(self.config_data, index.d))
+
+        vector_store.docstore.reset_positions([id_ for _, id_ in live])
+        vector_store.index = index
+        vector_store.clear_deleted()
+        self.info(
+            message=f"Compacted the index from {old_index.ntotal} to {index.ntotal} vectors"
+        )
+
+    @timed('load')
+    def load_vector_store(self, folder_path, vector_store_name, embeddings, mmap=True) -> object:
+        """
+        Load a vector store saved by save_vector_store. Documents stay on disk and are fetched by id
+        when a search returns them.
+        With mmap, the index is memory-mapped rather than read: it opens in milliseconds and processes
+        loading the same file share its pages, but it is read-only, so load without mmap to insert
+
+        Args:
+        - folder_path (str): the folder holding the store
+        - vector_store_name (str): your vector store name
+        - embeddings (object): embedding model
+        - mmap (bool): memory-map the index, read-only
+        """
+        index_path, docstore_path = self.vector_store_paths(folder_path, vector_store_name)
         try:
-            preprocessor = Preprocessor()
-            documents = preprocessor.format_csv(csv_file)
-            uuids = [str(uuid4()) for _ in range(len(documents))]
-            vector_store.add_documents(documents=documents, ids=uuids)
+            if not mmap:
+                index = faiss.read_index(index_path)
+            else:
+                try:
+                    index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC)
+                except RuntimeError:
+                    # IVF indexes map their inverted lists with IO_FLAG_MMAP alone
+                    index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            configure_search(index, index_settings(self.config_data, index.d))
+            saved_ntotal = index.ntotal
+
+            # Vectors inserted since the index file was written are replayed from the log,
+            # as long as their positions follow on from the index
+            docstore = SQLiteDocstore(docstore_path)
+            positions, vectors = docstore.logged_vectors(index.ntotal)
+            expected = np.arange(index.ntotal, index.ntotal + len(positions))
+            num_logged = int(np.argmin(positions == expected)) if (positions != expected).any() else len(positions)
+            if not index.is_trained:
+                num_logged = 0
+            delta_index = None
+            if mmap:
+                # A memory-mapped index is read-only, so they are searched in an exact index of their own
+                delta_index = faiss.IndexFlat(index.d, index.metric_type)
+                if num_logged:
+                    delta_index.add(vectors[:num_logged])
+            else:
+                if num_logged:
+                    index.add(vectors[:num_logged])
+                dropped = docstore.truncate(index.ntotal)
+                if dropped:
+                    self.warning(
+                        message=f'Dropped {dropped} documents inserted after {vector_store_name} was last saved'
+                    )
+
+            vector_store = FAISSStore(
+                embedding_function=embeddings,
+                index=index,
+                docstore=docstore,
+                index_to_docstore_id=docstore.index_mapping(),
+            )
+            vector_store.delta_index = delta_index
+            vector_store.mark_deleted(docstore.tombstones())
+            vector_store.saved_index = index
+            vector_store.saved_trained = index.is_trained
+            vector_store.saved_ntotal = saved_ntotal
             self.info(
-                message=f"Insert {len(documents)} to your vector store"
+                message=f'Load vector store {vector_store_name} success'
             )
+            return vector_store
+        except:
+            self.error(
+                message= f"Can not load your vector store, traceback = {traceback.format_exc()}"
+            )
+
+    def document_id(self, document):
+        """
+        Derive the id of a document from its content and metadata, so inserting the same document
+        again finds it instead of duplicating it. The source file is left out, so moving a file
+        does not change the ids of its documents
+
+        Args:
+        - document (Document): the document
+        """
+        metadata = {key: value for key, value in document.metadata.items() if key != 'source'}
+        payload = json.dumps(metadata, sort_keys=True, ensure_ascii=False) + '\0' + document.page_content
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def existing_ids(self, vector_store, ids):
+        """
+        Return which of the given document ids are already in the vector store
+
+        Args:
+        - vector_store (object): your vector store
+        - ids (list): the document ids
+        """
+        if isinstance(vector_store.docstore, SQLiteDocstore):
+            return vector_store.docstore.existing_ids(ids)
+        return {id_ for id_ in ids if isinstance(vector_store.docstore.search(id_), Document)}
+
+    @timed('index_add')
+    def add_vectors(self, vector_store, documents, ids, vectors):
+        """
+        Add embedded documents to the vector store, logging their vectors next to a SQLite docstore
+        so saving does not rewrite the index file
+
+        Args:
+        - vector_store (object): your vector store
+        - documents (list): the documents
+        - ids (list): their ids
+        - vectors (list): their vectors
+        """
+        start_position = vector_store.index.ntotal
+        vector_store.add_embeddings(
+            text_embeddings=list(zip([document.page_content for document in documents], vectors)),
+            metadatas=[document.metadata for document in documents],
+            ids=ids,
+        )
+        if isinstance(vector_store.docstore, SQLiteDocstore):
+            vector_store.docstore.append_vectors(start_position, np.array(vectors, dtype=np.float32))
+
+    def train_vector_store(self, vector_store, documents, vectors=None):
+        """
+        Train the untrained index of a vector store on a batch of documents, then insert them
+
+        Args:
+        - vector_store (object): your vector store
+        - documents (list): the documents to train on and insert
+        - vectors (list): their vectors, embedded here if not given
+        """
+        if vectors is None:
+            vectors = self.embed_contents(vector_store, documents)
+
+        settings = index_settings(self.config_data, vector_store.index.d)
+        index = train_index(vector_store.index, np.array(vectors, dtype=np.float32), settings)
+        if index is not vector_store.index:
+            self.warning(
+                message=f"{len(vectors)} vectors are too few to train a {settings['index_type']} index, using Flat"
+            )
+        vector_store.index = index
+        self.info(
+            message=f"Trained the {settings['index_type']} index on {len(vectors)} vectors"
+        )
+
+        self.add_vectors(vector_store, documents, [self.document_id(document) for document in documents], vectors)
+
+    @timed('migrate')
+    def migrate_vector_store(self, vector_store, index_type):
+        """
+        Rebuild the index of an existing vector store, e.g. a Flat one, as another index type.
+        Vectors keep their positions, so the docstore mapping stays valid
+
+        Args:
+        - vector_store (object): your vector store, with an index that can reconstruct its vectors
+        - index_type (str): the new index type, one of Flat, HNSW, IVF-Flat, IVF-PQ, IVF-SQ8
+        """
+        old_index = vector_store.index
+        vectors = reconstruct_vectors(old_index, np.arange(old_index.ntotal))
+
+        settings = index_settings(self.config_data, old_index.d, number_of_documents=old_index.ntotal)
+        settings['index_type'] = index_type
+        index = train_index(build_index(old_index.d, settings), vectors, settings)
+        index.add(vectors)
+        vector_store.index = index
+        self.info(
+            message=f"Migrated {old_index.ntotal} vectors to a {index_type} index"
+        )
+        return vector_store
+
+    def delete_documents(self, vector_store, ids):
+        """
+        Delete documents from a vector store with a SQLite docstore. Their vectors are skipped by searches
+        until the index is compacted
+
+        Args:
+        - vector_store (object): your vector store
+        - ids (list): the document ids
+        """
+        positions = vector_store.docstore.delete_documents(list(ids))
+        vector_store.mark_deleted(positions)
+        self.metrics.increment('documents_deleted', len(positions))
+        self.info(
+            message=f"Delete {len(positions)} documents from your vector store"
+        )
+
+    def upsert_documents(self, vector_store, documents, ids, seen, pending, write_lock=None):
+        """
+        Insert the documents of a batch that are not in the vector store yet, see insert_document.
+        While the index is untrained, documents are buffered in pending until there are enough to train on
+
+        Args:
+        - vector_store (object): your vector store
+        - documents (list): the chunk documents
+        - ids (list): their ids, see document_id
+        - seen (set): the ids met so far in this insert, updated here
+        - pending (list): the documents waiting for the index to be trained, updated here
+        - write_lock (callable): returns the context held while the index changes, e.g. ReadWriteLock.write
+
+        Output:
+        - the numbers of documents inserted and skipped as unchanged
+        """
+        write_lock = write_lock or nullcontext
+        existing = self.existing_ids(vector_store, ids)
+        new_documents, new_ids = [], []
+        for id_, document in zip(ids, documents):
+            if id_ not in seen and id_ not in existing:
+                new_documents.append(document)
+                new_ids.append(id_)
+            seen.add(id_)
+        skipped = len(documents) - len(new_documents)
+        self.metrics.increment('documents_skipped', skipped)
+        if existing and isinstance(vector_store.docstore, SQLiteDocstore):
+            # A chunk already stored from another source now belongs to this one too
+            vector_store.docstore.add_sources([
+                (id_, document.metadata['source']) for id_, document in zip(ids, documents)
+                if id_ in existing and document.metadata.get('source') is not None
+            ])
+        if not new_documents:
+            return 0, skipped
+
+        # An untrained index buffers documents until there are enough to train on
+        if not vector_store.index.is_trained:
+            pending.extend(new_documents)
+            settings = index_settings(self.config_data, vector_store.index.d)
+            if len(pending) < settings['train_sample_size']:
+                return 0, skipped
+            return self.flush_pending(vector_store, pending, write_lock), skipped
+
+        vectors = self.embed_contents(vector_store, new_documents)
+        with write_lock():
+            self.add_vectors(vector_store, new_documents, new_ids, vectors)
+        self.metrics.increment('documents_inserted', len(new_documents))
+        return len(new_documents), skipped
+
+    def flush_pending(self, vector_store, pending, write_lock=None):
+        """
+        Train the index on the buffered documents and insert them, see upsert_documents
+
+        Args:
+        - vector_store (object): your vector store
+        - pending (list): the buffered documents, emptied here
+        - write_lock (callable): returns the context held while the index changes
+
+        Output:
+        - the number of documents inserted
+        """
+        if not pending:
+            return 0
+        vectors = self.embed_contents(vector_store, pending)
+        with (write_lock or nullcontext)():
+            self.train_vector_store(vector_store, pending, vectors)
+        inserted = len(pending)
+        self.metrics.increment('documents_inserted', inserted)
+        pending.clear()
+        return inserted
+
+    def delete_stale(self, vector_store, source, seen, write_lock=None):
+        """
+        Detach the documents read from a source that were not met again, once all of it was inserted,
+        and delete the ones no other source still has
+
+        Args:
+        - vector_store (object): your vector store
+        - source (str): the source, e.g. a csv path
+        - seen (set): the ids met while inserting it
+        - write_lock (callable): returns the context held while the index changes
+        """
+        if not isinstance(vector_store.docstore, SQLiteDocstore):
+            return
+        stale = vector_store.docstore.source_ids(source) - seen
+        if stale:
+            orphans = vector_store.docstore.release_source(stale, source)
+            if orphans:
+                with (write_lock or nullcontext)():
+                    self.delete_documents(vector_store, orphans)
+
+    def boilerplate_lines(self, docstores, source, read_batches, partial=False):
+        """
+        Return the boilerplate lines of a source, see Chunker. They are learned from all of the source
+        when it is read in full, and kept in the SQLite docstores, so a partial read of the source,
+        e.g. an incremental re-crawl, chunks its pages exactly like the full one did
+
+        Args:
+        - docstores (list): the docstores of the stores the source goes to
+        - source (str): the source, e.g. a csv path
+        - read_batches (callable): returns the batches of documents of the source, read once more to learn from
+        - partial (bool): the source is only partly read
+        """
+        docstores = [docstore for docstore in docstores if isinstance(docstore, SQLiteDocstore)]
+        if partial and docstores:
+            lines = docstores[0].boilerplate(source)
+            if lines is not None:
+                return lines
+
+        chunker = Chunker(max_tokens=self.chunk_max_tokens, overlap_tokens=self.chunk_overlap_tokens)
+        lines = chunker.learn_boilerplate(read_batches())
+        for docstore in docstores:
+            docstore.set_boilerplate(source, lines)
+        self.info(
+            message=f"Learned {len(lines)} boilerplate lines from {source}"
+        )
+        return lines
+
+    def read_chunks(self, csv_file, chunksize=1000, docstores=(), partial=False):
+        """
+        Read a csv batch by batch as token-bounded chunk documents tagged with their source,
+        dropping the boilerplate lines of the csv, see boilerplate_lines
+
+        Args:
+        - csv_file: your csv path
+        - chunksize (int): the number of rows read at a time
+        - docstores (list): the docstores keeping the boilerplate lines of the csv
+        - partial (bool): the csv is a partial feed, see is_partial_feed
+
+        Output:
+        - yields the chunk documents of each batch, then logs what the chunker dropped
+        """
+        source = os.path.normpath(csv_file)
+        read_batches = lambda: Preprocessor().iter_csv(csv_file, chunksize=chunksize)
+        lines = self.boilerplate_lines(docstores, source, read_batches, partial)
+        return self.chunk_batches(read_batches(), source, lines)
+
+    def chunk_batches(self, batches, source, boilerplate_lines=None):
+        """
+        Split batches of documents into token-bounded chunk documents tagged with their source,
+        dropping boilerplate lines. A document's chunks do not depend on the other documents
+
+        Args:
+        - batches (iterable): the batches of documents, e.g. from Preprocessor.iter_csv or PDFExtractor.iter_documents
+        - source (str): where they were read from, e.g. a csv path or a PDF folder
+        - boilerplate_lines (set): the lines to drop, see boilerplate_lines
+
+        Output:
+        - yields the chunk documents of each batch, then logs what the chunker dropped
+        """
+        chunker = Chunker(max_tokens=self.chunk_max_tokens, overlap_tokens=self.chunk_overlap_tokens,
+                          boilerplate_lines=boilerplate_lines)
+        for documents in batches:
+            for document in documents:
+                document.metadata['source'] = source
+            documents = chunker.split_documents(documents)
+            if documents:
+                yield documents
+        self.info(
+            message=f"Dropped {chunker.dropped_lines} boilerplate lines"
+        )
+
+    def embed_contents(self, vector_store, documents):
+        """
+        Embed the contents of documents, each distinct text once: pages sharing a chunk, e.g. a notice
+        repeated on every page, cost a single embedding
+
+        Args:
+        - vector_store (object): your vector store
+        - documents (list): the documents
+
+        Output:
+        - their vectors, in order
+        """
+        texts = [document.page_content for document in documents]
+        unique_texts = list(dict.fromkeys(texts))
+        with self.span('embed', kind='document'):
+            vectors = dict(zip(unique_texts, vector_store.embedding_function.embed_documents(unique_texts)))
+        return [vectors[text] for text in texts]
+
+    def is_partial_feed(self, csv_file):
+        """
+        Tell whether a csv may miss rows that were not removed, as its sidecar from the crawler states:
+        an incremental re-crawl only writes the pages that changed, and an interrupted crawl did not reach
+        every page. A csv without a sidecar, e.g. a curated dataset, is a full snapshot
+
+        Args:
+        - csv_file: your csv path
+        """
+        feed_info = read_feed_info(csv_file)
+        if feed_info is None:
+            return False
+        return feed_info.get('incremental', True) or not feed_info.get('complete', False)
+
+    def release_replaced(self, vector_store, documents, source, keep, write_lock=None):
+        """
+        Detach from a source the chunks it held of the pages met again, except the ones to keep,
+        and delete the ones no other source still has: a changed page replaces its old chunks
+
+        Args:
+        - vector_store (object): your vector store
+        - documents (list): the chunk documents of a batch
+        - source (str): where they were read from
+        - keep (set): the ids met so far, the batch's included
+        - write_lock (callable): returns the context held while the index changes
+        """
+        if not isinstance(vector_store.docstore, SQLiteDocstore):
+            return
+        pages = list({document.metadata[PAGE_KEY] for document in documents if document.metadata.get(PAGE_KEY)})
+        if not pages:
+            return
+        replaced = vector_store.docstore.source_ids_with(source, PAGE_KEY, pages) - keep
+        if replaced:
+            orphans = vector_store.docstore.release_source(replaced, source)
+            if orphans:
+                with (write_lock or nullcontext)():
+                    self.delete_documents(vector_store, orphans)
+
+    def insert_document(self, vector_store, csv_file, chunksize=1000, write_lock=None, delete_missing=None):
+        """
+        Upsert the documents of a csv into the vector store, batch by batch as the csv is read.
+        Documents are split into token-bounded chunks, without the boilerplate lines of the csv.
+        Chunks get ids derived from their content: chunks already in the store are skipped without
+        being embedded. The old chunks of every page met again, by url, are replaced by its new ones.
+        With delete_missing, the csv is a full snapshot of its source: once it is read, chunks of rows
+        that were removed since it was last inserted are deleted too.
+        Only changes to the index are made under write_lock: reading, chunking and embedding are not,
+        so searches sharing the store keep running meanwhile
+
+        Args:
+        - vector_store (object): your local vector store name
+        - csv_file: your csv path
+        - chunksize (int): the number of rows read and inserted at a time
+        - write_lock (callable): returns the context held while the index changes, e.g. ReadWriteLock.write
+        - delete_missing (bool): delete the chunks of the csv not met again, unless its sidecar says it is
+          a partial feed, such as an incremental re-crawl, if not given, see is_partial_feed
+        """
+        try:
+            if delete_missing is None:
+                delete_missing = not self.is_partial_feed(csv_file)
+            batches = self.read_chunks(csv_file, chunksize=chunksize, docstores=[vector_store.docstore],
+                                       partial=not delete_missing)
+            self.insert_batches(vector_store, batches, os.path.normpath(csv_file), write_lock, delete_missing=delete_missing)
         except:
             self.error(
                 message= f"Can not insert your contents to vector store, traceback = {traceback.format_exc()}"
             )
+
+    def insert_pdfs(self, vector_store, pdf_folder, layout=False, write_lock=None):
+        """
+        Upsert the text of the PDFs in a folder, e.g. the ones the crawler downloaded, like insert_document.
+        Text is extracted page by page in a process pool and cached by PDF content hash, see PDFExtractor,
+        and the pages of PDFs removed from the folder are deleted
+
+        Args:
+        - vector_store (object): your vector store
+        - pdf_folder (str): the folder holding the PDFs
+        - layout (bool): split pages into layout blocks
+        - write_lock (callable): returns the context held while the index changes, e.g. ReadWriteLock.write
+        """
+        try:
+            extractor = PDFExtractor(pdf_folder, layout=layout, workers=self.config_data.get('PDF_EXTRACTION_WORKERS'))
+            source = os.path.normpath(pdf_folder)
+            try:
+                lines = self.boilerplate_lines([vector_store.docstore], source, extractor.iter_documents)
+                self.insert_batches(vector_store, self.chunk_batches(extractor.iter_documents(), source, lines), source,
+                                    write_lock)
+            finally:
+                extractor.close()
+        except:
+            self.error(
+                message= f"Can not insert your PDFs to vector store, traceback = {traceback.format_exc()}"
+            )
+
+    def insert_batches(self, vector_store, batches, source, write_lock=None, delete_missing=True):
+        """
+        Upsert batches of chunk documents read from a source, replacing the old chunks of their pages,
+        then delete the documents of the source that were not met again, see insert_document
+
+        Args:
+        - vector_store (object): your vector store
+        - batches (iterable): the batches of chunk documents, see chunk_batches
+        - source (str): where they were read from
+        - write_lock (callable): returns the context held while the index changes
+        - delete_missing (bool): the batches are all of the source, so documents not met again were removed
+        """
+        seen = set()
+        pending = []
+        total = skipped = 0
+        for documents in batches:
+            ids = [self.document_id(document) for document in documents]
+            self.release_replaced(vector_store, documents, source, seen | set(ids), write_lock)
+            inserted, batch_skipped = self.upsert_documents(vector_store, documents, ids, seen, pending, write_lock)
+            total += inserted
+            skipped += batch_skipped
+            if inserted:
+                self.info(
+                    message=f"Insert {inserted} to your vector store ({total} so far)"
+                )
+        total += self.flush_pending(vector_store, pending, write_lock)
+
+        if delete_missing:
+            self.delete_stale(vector_store, source, seen, write_lock)
+        self.info(
+            message=f"Inserted {total} new chunks and skipped {skipped} unchanged ones from {source}"
+        )
@@ -1,40 +1,93 @@
 import traceback
 import os
+from contextlib import nullcontext
 
 from core.vector_store import VectorStore
 from core.embedding import Embedding
+from core.sqlite_docstore import SQLiteDocstore
 from common.config_loader import ConfigLoader
 from common.logger import Logger
 
 class InsertCSV(Logger):
-    def __init__(self, vector_store_name):
+    def __init__(self, vector_store_name, embedding=None, vector_store_handler=None, folder_path=None):
+        '''
+        Open a local vector store to insert csv files into, creating it if needed
+
+        Args:
+        - vector_store_name (str): your local vector store name
+        - embedding (object): embedding model, a new Embedding one if not given
+        - vector_store_handler (VectorStore): a VectorStore to share, e.g. with a long-lived service
+        - folder_path (str): the folder holding the store, DEFAULT_VECTOR_STORE_SAVING_PATH if not given
+        '''
         super().__init__()
-        self.VectorStore = VectorStore()
-        self.embedding = Embedding().get_embedding()
+        self.VectorStore = vector_store_handler or VectorStore()
+        # An embedding made here is closed with the store, a given one by whoever made it
+        self.owns_embedding = embedding is None
+        self.embedding = embedding or Embedding().get_embedding()
         config_loader = ConfigLoader()
-        self.default_vector_stores_saving_path = config_loader.config_data['DEFAULT_VECTOR_STORE_SAVING_PATH']
+        self.default_vector_stores_saving_path = folder_path or config_loader.config_data['DEFAULT_VECTOR_STORE_SAVING_PATH']
         self.vector_store_name = vector_store_name
         try:
-            vector_store_path = f"{self.default_vector_stores_saving_path}/{vector_store_name}.faiss"
-            if not os.path.exists(vector_store_path):                
+            index_path, docstore_path = self.VectorStore.vector_store_paths(
+                self.default_vector_stores_saving_path, vector_store_name
+            )
+            legacy_docstore_path = f"{self.default_vector_stores_saving_path}/{vector_store_name}.pkl"
+            if os.path.exists(docstore_path):
+                # Inserting writes to the index, so it is read rather than memory-mapped
+                self.vector_store = self.VectorStore.load_vector_store(
+                    self.default_vector_stores_saving_path, vector_store_name, self.embedding, mmap=False
+                )
+            elif os.path.exists(legacy_docstore_path):
                 self.info(
-                    message=f'No local {vector_store_name} vector store was found'
+                    message=f'Convert the pickled {vector_store_name} vector store to a SQLite docstore'
                 )
-                self.vector_store = self.VectorStore.creat_vector_store(self.embedding)
-                self.vector_store.save_local(
-                    folder_path=self.default_vector_stores_saving_path, 
-                    index_name=self.vector_store_name
+                legacy_vector_store = self.VectorStore.load_local_vector_store(
+                    vector_store_name, self.embedding, folder_path=self.default_vector_stores_saving_path
+                )
+                self.VectorStore.save_vector_store(
+                    legacy_vector_store, self.default_vector_stores_saving_path, vector_store_name
+                )
+                self.vector_store = self.VectorStore.load_vector_store(
+                    self.default_vector_stores_saving_path, vector_store_name, self.embedding, mmap=False
                 )
             else:
-                self.vector_store = self.VectorStore.load_local_vector_store(vector_store_name, self.embedding)
+                self.info(
+                    message=f'No local {vector_store_name} vector store was found'
+                )
+                self.vector_store = self.VectorStore.creat_vector_store(
+                    self.embedding, docstore=SQLiteDocstore(docstore_path)
+                )
+                self.VectorStore.save_vector_store(
+                    self.vector_store, self.default_vector_stores_saving_path, vector_store_name
+                )
         except:
             self.error(
                 message= f"Can not load your vector store, traceback = {traceback.format_exc()}"
 
             )
          
-    def insert_csv(self, csv_path):
-        self.VectorStore.insert_document(self.vector_store, csv_path)
+    def insert_csv(self, csv_path, chunksize=1000, write_lock=None, delete_missing=None):
+        self.VectorStore.insert_document(
+            self.vector_store, csv_path, chunksize=chunksize, write_lock=write_lock, delete_missing=delete_missing
+        )
+        with (write_lock or nullcontext)():
+            self.VectorStore.save_vector_store(
+                self.vector_store, self.default_vector_stores_saving_path, self.vector_store_name
+            )
+
+    def insert_pdfs(self, pdf_folder, layout=False, write_lock=None):
+        self.VectorStore.insert_pdfs(self.vector_store, pdf_folder, layout=layout, write_lock=write_lock)
+        with (write_lock or nullcontext)():
+            self.VectorStore.save_vector_store(
+                self.vector_store, self.default_vector_stores_saving_path, self.vector_store_name
+            )
+
+    def close(self):
+        '''
+        Close the embedding cache, if the embedding was made here, writing the last use of its recent hits
+        '''
+        if self.owns_embedding and hasattr(self.embedding, 'close'):
+            self.embedding.close()
 
 
 
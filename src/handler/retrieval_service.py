@@ -0,0 +1,337 @@
+import asyncio
+import json
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from common.config_loader import ConfigLoader
+from common.logger import Logger
+from common.rw_lock import ReadWriteLock
+from core.embedding import Embedding
+from core.vector_store import VectorStore
+from handler.insert_csv import InsertCSV
+from retrieval.retriever import Retriever
+
+SEARCH_MODES = ('dense', 'lexical', 'hybrid')
+# The number of recent search latencies kept for the percentiles
+LATENCY_WINDOW = 100000
+
+
+class RetrievalService(Logger):
+    def __init__(self, vector_store_names, embedding=None, folder_path=None):
+        '''
+        A long-lived retrieval service: vector stores, the embedding client and the query cache are loaded once
+        and stay warm between requests.
+
+        Concurrent searches are gathered into micro-batches, each embedded in one batched embedding request
+        (per EMBEDDING_BATCH_SIZE queries) and answered with one multi-query FAISS search. Every store has
+        a reader/writer lock: searches only take it around the index search, not while embedding, and inserts
+        only take it to change the index, not while reading and embedding, so neither holds the other back
+        for an embedding API call.
+
+        Args:
+        - vector_store_names (list): the local vector stores to serve, created if missing
+        - embedding (object): embedding model, the configured one if not given
+        - folder_path (str): the folder holding the stores, DEFAULT_VECTOR_STORE_SAVING_PATH if not given
+        '''
+        super().__init__()
+        config_data = ConfigLoader().config_data or {}
+        self.max_batch_size = config_data.get('SERVICE_MAX_BATCH_SIZE', 64)
+        self.max_wait = config_data.get('SERVICE_MAX_WAIT_MS', 5) / 1000
+
+        # An embedding made here is closed by stop, a given one by whoever made it
+        self.owns_embedding = embedding is None
+        self.embedding = embedding or Embedding().get_embedding()
+        self.vector_store_handler = VectorStore()
+        self.retriever = Retriever()
+        self.stores = {
+            name: InsertCSV(name, embedding=self.embedding, vector_store_handler=self.vector_store_handler,
+                            folder_path=folder_path)
+            for name in vector_store_names
+        }
+        self.locks = {name: ReadWriteLock() for name in vector_store_names}
+
+        # FAISS and SQLite release the GIL, so searches of different batches run in parallel threads;
+        # inserts get a thread of their own, so a long one never takes a search worker
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=config_data.get('SERVICE_WORKERS', 4), thread_name_prefix='search'
+        )
+        self.insert_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='insert')
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.queue = None
+        self.batcher = None
+        self.batch_tasks = set()
+
+    async def start(self):
+        '''
+        Start gathering searches into batches
+        '''
+        if self.batcher is None:
+            self.queue = asyncio.Queue()
+            self.batcher = asyncio.create_task(self.batch_worker())
+
+    async def stop(self):
+        '''
+        Stop the batcher and the worker threads, then close the embedding cache
+        '''
+        if self.batcher is not None:
+            self.batcher.cancel()
+            self.batcher = None
+        # Running searches and inserts may still be embedding, so they finish before the cache is closed
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.search_executor.shutdown)
+        await loop.run_in_executor(None, self.insert_executor.shutdown)
+        if self.owns_embedding and hasattr(self.embedding, 'close'):
+            self.embedding.close()
+
+    async def search(self, vector_store_name, context, k=5, mode='dense', filter=None):
+        '''
+        Search a store, batched with the searches arriving at the same time
+
+        Args:
+        - vector_store_name (str): the store
+        - context (str): the query
+        - k (int): the number of documents
+        - mode (str): dense, lexical or hybrid, see Retriever
+        - filter (dict): an equality metadata filter, if any
+
+        Output:
+        - the hits of Retriever.query_vectors, query_lexical or query_hybrid for this context
+        '''
+        if vector_store_name not in self.stores:
+            raise KeyError(f"Unknown vector store {vector_store_name}")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode}, expected one of {SEARCH_MODES}")
+        await self.start()
+
+        started_at = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        # Only searches sharing a key can be answered by the same call
+        key = (vector_store_name, mode, k, json.dumps(filter, sort_keys=True))
+        await self.queue.put((key, f"{context}", future))
+        try:
+            return await future
+        finally:
+            latency = time.perf_counter() - started_at
+            self.latencies.append(latency)
+            self.metrics.observe('request_seconds', latency, mode=mode)
+
+    async def batch_worker(self):
+        '''
+        Gather queued searches until the batch is full or the oldest one waited max_wait, then answer them
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            groups = {}
+            for key, context, future in batch:
+                groups.setdefault(key, []).append((context, future))
+            for key, items in groups.items():
+                # The event loop only keeps weak references to tasks
+                task = asyncio.create_task(self.answer_batch(key, items))
+                self.batch_tasks.add(task)
+                task.add_done_callback(self.batch_tasks.discard)
+
+    async def answer_batch(self, key, items):
+        '''
+        Answer a batch of searches sharing a store, mode, k and filter in a worker thread
+
+        Args:
+        - key (tuple): the store, mode, k and filter
+        - items (list): the (context, future) pairs
+        '''
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.search_executor, self.search_batch, key, [context for context, _ in items]
+            )
+            for (_, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+    def search_batch(self, key, contexts):
+        '''
+        Run a batch of searches: the queries are embedded first, and the store's read lock is only held
+        for the index and docstore search, so a waiting insert never queues searches behind an embedding call
+
+        Args:
+        - key (tuple): the store, mode, k and filter
+        - contexts (list): the queries
+        '''
+        vector_store_name, mode, k, filter = key
+        filter = json.loads(filter)
+        vector_store = self.stores[vector_store_name].vector_store
+        vectors = None
+        if mode != 'lexical':
+            vectors = self.retriever.embed_contexts(vector_store.embedding_function, [f"{context}" for context in contexts])
+        with self.locks[vector_store_name].read():
+            if mode == 'dense':
+                results = self.retriever.query_vectors(vector_store, contexts, filter=filter, k=k, vectors=vectors)
+            elif mode == 'lexical':
+                results = self.retriever.query_lexical(vector_store, contexts, filter=filter, k=k)
+            else:
+                results = self.retriever.query_hybrid(vector_store, contexts, filter=filter, k=k, vectors=vectors)
+        if results is None:
+            raise RuntimeError(f"Can not search {vector_store_name}, see the Retriever logs")
+        return results
+
+    async def insert(self, vector_store_name, csv_path, chunksize=1000):
+        '''
+        Upsert a csv into a store and save it, while searches keep being answered
+
+        Args:
+        - vector_store_name (str): the store
+        - csv_path (str): the csv path
+        - chunksize (int): the number of rows read and inserted at a time
+        '''
+        if vector_store_name not in self.stores:
+            raise KeyError(f"Unknown vector store {vector_store_name}")
+        handler = self.stores[vector_store_name]
+        await asyncio.get_running_loop().run_in_executor(
+            self.insert_executor,
+            lambda: handler.insert_csv(csv_path, chunksize=chunksize, write_lock=self.locks[vector_store_name].write),
+        )
+        return {"vector_store": vector_store_name, "vectors": handler.vector_store.index.ntotal}
+
+    def stats(self):
+        '''
+        Return the p50 and p99 search latencies in milliseconds, over the recent searches, and the query cache counters
+        '''
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "searches": len(latencies),
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "query_cache": self.retriever.query_cache.stats(),
+        }
+
+    async def handle_request(self, request):
+        '''
+        Answer one request of the line protocol, see serve
+
+        Args:
+        - request (dict): the decoded request
+        '''
+        op = request.get('op')
+        if op == 'search':
+            hits = await self.search(
+                request['vector_store'], request['context'], k=request.get('k', 5),
+                mode=request.get('mode', 'dense'), filter=request.get('filter'),
+            )
+            return [
+                {"id": hit[0].id, "page_content": hit[0].page_content, "metadata": hit[0].metadata,
+                 "score": float(hit[-1]), **({"distance": float(hit[1])} if len(hit) == 3 else {})}
+                for hit in hits
+            ]
+        if op == 'insert':
+            return await self.insert(request['vector_store'], request['csv_path'], chunksize=request.get('chunksize', 1000))
+        if op == 'stats':
+            return self.stats()
+        if op == 'metrics':
+            return self.metrics.snapshot()
+        raise ValueError(f"Unknown op {op}, expected search, insert, stats or metrics")
+
+    async def handle_line(self, line, writer):
+        '''
+        Answer one request line and write the response line, echoing the request id
+
+        Args:
+        - line (bytes): the JSON request
+        - writer (asyncio.StreamWriter): the connection
+        '''
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            response = {"id": request_id, "ok": True, "result": await self.handle_request(request)}
+        except Exception as e:
+            self.error(message=f"Can not answer {line[:200]!r}, traceback = {traceback.format_exc()}")
+            response = {"id": request_id, "ok": False, "error": str(e)}
+        writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        '''
+        Serve a connection: every line is answered as soon as it is done, so a client can pipeline requests
+
+        Args:
+        - reader (asyncio.StreamReader): the connection
+        - writer (asyncio.StreamWriter): the connection
+        '''
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(self.handle_line(line, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        '''
+        Serve requests over TCP, one JSON object per line each way:
+        {"op": "search", "vector_store": ..., "context": ..., "k": 5, "mode": "dense", "filter": {...}},
+        {"op": "insert", "vector_store": ..., "csv_path": ...}, {"op": "stats"} or {"op": "metrics"}, with an optional "id"
+
+        Args:
+        - host (str): the interface to listen on
+        - port (int): the port
+        '''
+        await self.start()
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=2 ** 20)
+        self.info(message=f"Serving {list(self.stores)} on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def load_test(self, vector_store_name, contexts, num_requests=1000, concurrency=64, mode='dense', k=5):
+        '''
+        Send searches from concurrent clients and report the latency percentiles
+
+        Args:
+        - vector_store_name (str): the store
+        - contexts (list): the queries, sent round robin
+        - num_requests (int): the number of searches
+        - concurrency (int): the number of searches in flight at once
+        - mode (str): the search mode
+        - k (int): the number of documents per search
+        '''
+        self.latencies.clear()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def client(i):
+            async with semaphore:
+                await self.search(vector_store_name, contexts[i % len(contexts)], k=k, mode=mode)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(num_requests)))
+        elapsed = time.perf_counter() - started_at
+
+        stats = self.stats()
+        stats["queries_per_second"] = num_requests / elapsed
+        self.info(
+            message=f"{num_requests} {mode} searches, {concurrency} concurrent: p50 {stats['p50_ms']:.1f} ms, "
+                    f"p99 {stats['p99_ms']:.1f} ms, {stats['queries_per_second']:.0f} queries/s"
+        )
+        return stats
@@ -1,8 +1,22 @@
+import os
+
+from common.config_loader import ConfigLoader
+from common.metrics import start_exporters, stop_exporters
 from handler.insert_csv import InsertCSV
 
-def main(vector_store_name, csv_path):
-    app = InsertCSV(vector_store_name)
-    app.insert_csv(csv_path)
+def main(vector_store_name, csv_path, pdf_folder=None):
+    exporters = start_exporters(ConfigLoader().config_data or {})
+    try:
+        app = InsertCSV(vector_store_name)
+        try:
+            app.insert_csv(csv_path)
+            # The PDFs downloaded by the crawler, if it ran
+            if pdf_folder and os.path.isdir(pdf_folder):
+                app.insert_pdfs(pdf_folder)
+        finally:
+            app.close()
+    finally:
+        stop_exporters(exporters)
 
 if __name__ == '__main__':
-    main("test1", "food_data.csv")
\ No newline at end of file
+    main("test1", "food_data.csv", pdf_folder="src/database/extracted_files/pdf_files")
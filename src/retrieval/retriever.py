@@ -0,0 +1,193 @@
+import traceback
+
+from common.config_loader import ConfigLoader
+from common.logger import Logger
+from core.embedding_scheduler import embed_queries
+from core.query_cache import QueryCache
+
+class  Retriever(Logger):
+    def __init__(self, cache_size=None, cache_ttl=None):
+        '''
+        Query vector stores, one context or many at a time
+
+        Args:
+        - cache_size (int): the number of query embeddings kept in memory, QUERY_CACHE_SIZE if not given
+        - cache_ttl (float): the seconds a query embedding stays cached, QUERY_CACHE_TTL if not given
+        '''
+        super().__init__()
+        config_data = ConfigLoader().config_data or {}
+        # The rank offset of reciprocal rank fusion, damping the weight of the very first ranks
+        self.rrf_k = config_data.get('RRF_K', 60)
+        self.query_cache = QueryCache(
+            max_entries=cache_size or config_data.get('QUERY_CACHE_SIZE', 10000),
+            ttl=cache_ttl or config_data.get('QUERY_CACHE_TTL', 3600),
+        )
+
+    def embed_contexts(self, embeddings, contexts):
+        """
+        Embed contexts as queries, in one batch for the ones missing from the query cache
+
+        Args:
+        - embeddings (object): embedding model
+        - contexts (list): the contexts
+        """
+        # The model id keeps stores embedded by different models from sharing vectors
+        model_id = getattr(embeddings, 'model_id', id(embeddings))
+        keys = [(model_id, context) for context in contexts]
+        vectors = self.query_cache.get_many(keys)
+
+        missing = list(dict.fromkeys(key for key in keys if key not in vectors))
+        self.metrics.increment('query_cache_lookups', len(keys) - len(missing), result='hit')
+        self.metrics.increment('query_cache_lookups', len(missing), result='miss')
+        if missing:
+            with self.span('embed', kind='query'):
+                new_vectors = dict(zip(missing, embed_queries(embeddings, [context for _, context in missing])))
+            self.query_cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+        return [vectors[key] for key in keys]
+
+    def query_vectors(self, vector_store, contexts, filter=None, k=5, fetch_k=20, vectors=None):
+        """
+        Query a vector store with many contexts at once: they are embedded together and searched
+        with a single multi-query index search
+
+        Args:
+        - vector_store (object): your vector store
+        - contexts (list): the contexts
+        - filter (dict or callable): the metadata filter, if any
+        - k (int): the number of documents per context
+        - fetch_k (int): the number of results fetched per context before filtering
+        - vectors (list): the context vectors from embed_contexts, embedded here if not given,
+          so a caller can embed before taking a lock and only hold it to search
+
+        Output:
+        - one list per context of (document, distance, score) tuples, best first, where distance
+          is the raw index score and score the store's relevance score, higher is better. It is not
+          bounded to [0, 1]: with the default Euclidean strategy it is 1 - distance / sqrt(2) of a squared L2
+          distance, down to about -1.8 for unit vectors, so only compare it within a store
+        """
+        try:
+            contexts = [f"{context}" for context in contexts]
+            if vectors is None:
+                vectors = self.embed_contexts(vector_store.embedding_function, contexts)
+            # FAISSStore and ShardedVectorStore search every context at once
+            with self.span('search', mode='dense'):
+                if hasattr(vector_store, 'similarity_search_with_score_by_vectors'):
+                    results = vector_store.similarity_search_with_score_by_vectors(
+                        vectors, k=k, filter=filter, fetch_k=fetch_k
+                    )
+                else:
+                    results = [
+                        vector_store.similarity_search_with_score_by_vector(vector, k=k, filter=filter, fetch_k=fetch_k)
+                        for vector in vectors
+                    ]
+            self.metrics.increment('queries', len(contexts), mode='dense')
+
+            relevance = vector_store._select_relevance_score_fn()
+            return [
+                [(document, float(distance), relevance(distance)) for document, distance in documents]
+                for documents in results
+            ]
+        except:
+            self.error(
+                message= f"Can not query your contexts, traceback = {traceback.format_exc()}"
+            )
+
+    def query_vector(self, vector_store, context, filter, k=5):
+        try:
+            results = self.query_vectors(vector_store, [context], filter=filter, k=k)
+            return [document for document, _, _ in results[0]]
+        except:
+            self.error(
+                message= f"Can not query your context, traceback = {traceback.format_exc()}"
+            )
+
+    def query_lexical(self, vector_store, contexts, filter=None, k=5):
+        """
+        Query a vector store with many contexts by BM25 over its documents, without embedding them.
+        Fast and precise for exact terms such as dish names or program codes
+
+        Args:
+        - vector_store (object): your vector store with a SQLite docstore, or a ShardedVectorStore
+        - contexts (list): the contexts
+        - filter (dict): an equality metadata filter, if any
+        - k (int): the number of documents per context
+
+        Output:
+        - one list per context of (document, score) tuples, best first, where score is the BM25 score.
+          Each shard has its own BM25 statistics, so with several shards their rankings are fused by
+          reciprocal rank, like query_hybrid, and score is the fused score
+        """
+        try:
+            if hasattr(vector_store, 'shards'):
+                stores = [vector_store.shards[name] for name in vector_store.shards_for_filter(filter)]
+            else:
+                stores = [vector_store]
+
+            rankings = [[] for _ in contexts]
+            with self.span('search', mode='lexical'):
+                for store in stores:
+                    docstore = store.docstore
+                    lexical_index = docstore.lexical_index()
+                    hits = [lexical_index.search(f"{context}", k=k, filter=filter) for context in contexts]
+                    documents = docstore.search_many(list({id_ for context_hits in hits for id_, _ in context_hits}))
+                    for context_rankings, context_hits in zip(rankings, hits):
+                        context_rankings.append(
+                            [(documents[id_], score) for id_, score in context_hits if id_ in documents]
+                        )
+            self.metrics.increment('queries', len(contexts), mode='lexical')
+            if len(stores) == 1:
+                return [context_rankings[0][:k] for context_rankings in rankings]
+
+            results = []
+            for context_rankings in rankings:
+                scores = {}
+                documents = {}
+                for ranking in context_rankings:
+                    for rank, (document, _) in enumerate(ranking, start=1):
+                        documents.setdefault(document.id, document)
+                        scores[document.id] = scores.get(document.id, 0.0) + 1.0 / (self.rrf_k + rank)
+                best = sorted(scores, key=scores.get, reverse=True)[:k]
+                results.append([(documents[id_], scores[id_]) for id_ in best])
+            return results
+        except:
+            self.error(
+                message= f"Can not query your contexts lexically, traceback = {traceback.format_exc()}"
+            )
+
+    def query_hybrid(self, vector_store, contexts, filter=None, k=5, fetch_k=20, vectors=None):
+        """
+        Query a vector store with many contexts both by BM25 and by vectors, fusing the two rankings
+        with reciprocal rank fusion: a document scores the sum of 1 / (RRF_K + rank) over the rankings it is in
+
+        Args:
+        - vector_store (object): your vector store, with a SQLite docstore
+        - contexts (list): the contexts
+        - filter (dict): an equality metadata filter, if any
+        - k (int): the number of documents per context
+        - fetch_k (int): the number of documents taken from each ranking before fusing
+        - vectors (list): the context vectors, see query_vectors
+
+        Output:
+        - one list per context of (document, score) tuples, best first, where score is the fused score
+        """
+        try:
+            dense = self.query_vectors(vector_store, contexts, filter=filter, k=fetch_k, fetch_k=max(fetch_k, 20),
+                                       vectors=vectors)
+            lexical = self.query_lexical(vector_store, contexts, filter=filter, k=fetch_k)
+
+            results = []
+            for dense_hits, lexical_hits in zip(dense, lexical):
+                documents, scores = {}, {}
+                rankings = ([document for document, _, _ in dense_hits], [document for document, _ in lexical_hits])
+                for ranking in rankings:
+                    for rank, document in enumerate(ranking, start=1):
+                        documents.setdefault(document.id, document)
+                        scores[document.id] = scores.get(document.id, 0.0) + 1.0 / (self.rrf_k + rank)
+                best = sorted(scores, key=scores.get, reverse=True)[:k]
+                results.append([(documents[id_], scores[id_]) for id_ in best])
+            return results
+        except:
+            self.error(
+                message= f"Can not query your contexts, traceback = {traceback.format_exc()}"
+            )
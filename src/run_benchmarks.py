@@ -0,0 +1,74 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+
+from benchmarks.crawl_benchmark import run_crawl_benchmark
+from benchmarks.ingest_benchmark import run_ingest_benchmark
+from benchmarks.load_benchmark import run_load_benchmark
+from benchmarks.retrieval_benchmark import run_retrieval_benchmark
+from benchmarks.synthetic_site import read_texts
+from common.metrics import metrics
+
+SUITES = ('crawl', 'ingest', 'load', 'retrieval')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark crawling, ingesting, loading and retrieval offline, "
+                    "against a local site and a fake embedding model"
+    )
+    parser.add_argument('suites', nargs='*', default=list(SUITES), choices=SUITES)
+    parser.add_argument('--csv', default="food_data.csv", help="the corpus to scale up and make pages of")
+    parser.add_argument('--output', default="benchmark_results.json")
+    parser.add_argument('--quick', action='store_true', help="small sizes, to check the suites run")
+    parser.add_argument('--verbose', action='store_true', help="keep the per page and per batch logs")
+    args = parser.parse_args()
+
+    # Logging every page and batch would be measured along with the work
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    page_counts = [200] if args.quick else [500, 2000]
+    scales = [10] if args.quick else [20, 100, 500]
+    retrieval_scale = 20 if args.quick else 200
+
+    results = {
+        "started_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": args.quick,
+    }
+    if 'crawl' in args.suites:
+        results["crawl"] = run_crawl_benchmark(read_texts(args.csv), page_counts, worker_counts=[1, 10, 50])
+    if 'ingest' in args.suites:
+        results["ingest"] = run_ingest_benchmark(args.csv, scales)
+    if 'load' in args.suites:
+        results["load"] = run_load_benchmark(args.csv, scale=20 if args.quick else 2000)
+    if 'retrieval' in args.suites:
+        results["retrieval"] = run_retrieval_benchmark(args.csv, scale=retrieval_scale,
+                                                       num_queries=100 if args.quick else 1000)
+    # The spans of the suites run in this process, the ingest ones running in processes of their own
+    results["metrics"] = metrics.snapshot()
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
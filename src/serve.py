@@ -0,0 +1,58 @@
+import asyncio
+import csv
+import sys
+import tempfile
+
+from common.config_loader import ConfigLoader
+from common.metrics import start_exporters, stop_exporters
+from core.fake_embedding import FakeEmbeddings
+from handler.retrieval_service import RetrievalService
+
+
+def main():
+    config_data = ConfigLoader().config_data or {}
+
+    # The stores to keep loaded, and where to listen
+    vector_store_names = config_data.get('SERVICE_VECTOR_STORES', ['test1'])
+    host = config_data.get('SERVICE_HOST', '127.0.0.1')
+    port = config_data.get('SERVICE_PORT', 8765)
+
+    # Metrics go to METRICS_SNAPSHOT_PATH and the METRICS_PORT endpoint, if set
+    exporters = start_exporters(config_data)
+    service = RetrievalService(vector_store_names)
+    try:
+        asyncio.run(service.serve(host, port))
+    finally:
+        stop_exporters(exporters)
+
+
+def load_test():
+    # Searches go to a throwaway store filled from the food csv, embedded by a local fake model
+    # answering every call in 50 ms, so the latencies measure the service and not the API quota
+    csv_path = "food_data.csv"
+    embedding_latency = 0.05
+    num_requests = 2000
+    concurrency = 64
+
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        contexts = [row['field'] for row in csv.DictReader(file)]
+
+    async def run():
+        with tempfile.TemporaryDirectory() as folder_path:
+            service = RetrievalService(
+                ['load_test'], embedding=FakeEmbeddings(latency=embedding_latency), folder_path=folder_path
+            )
+            await service.insert('load_test', csv_path)
+            for mode in ('dense', 'lexical', 'hybrid'):
+                service.retriever.query_cache.clear()
+                await service.load_test('load_test', contexts, num_requests=num_requests, concurrency=concurrency, mode=mode)
+            await service.stop()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['load-test']:
+        load_test()
+    else:
+        main()
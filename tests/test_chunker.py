@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip('langchain_core')
+
+from langchain_core.documents import Document  # noqa: E402
+
+from core.chunker import Chunker  # noqa: E402
+from core.embedding_scheduler import estimate_tokens  # noqa: E402
+
+NAVIGATION = "Trang chủ\nTuyển sinh\nLiên hệ\n"
+
+
+def page(number: int, body: str = None) -> Document:
+    body = body or f"Page {number} explains admission topic {number} at length, with its own details."
+    return Document(page_content=NAVIGATION + f"Topic {number}\n" + body, metadata={"url": f"/p/{number}"})
+
+
+def chunk_texts(chunker: Chunker, documents) -> dict:
+    return {
+        document.metadata["url"]: [chunk.page_content for chunk in chunker.split_documents([document])]
+        for document in documents
+    }
+
+
+def test_boilerplate_is_learned_from_lines_shared_by_enough_documents():
+    documents = [page(number) for number in range(4)]
+    chunker = Chunker(boilerplate_min_documents=2)
+    assert chunker.learn_boilerplate([documents[:2], documents[2:]]) == {"trang chủ", "tuyển sinh", "liên hệ"}
+    assert chunker.learn_boilerplate([documents[:2]]) == set()
+
+
+def test_boilerplate_lines_are_dropped_from_every_document():
+    documents = [page(number) for number in range(4)]
+    lines = Chunker().learn_boilerplate([documents])
+    chunker = Chunker(boilerplate_lines=lines)
+
+    for url, texts in chunk_texts(chunker, documents).items():
+        assert texts and not any("Trang chủ" in text for text in texts)
+    assert chunker.dropped_lines == 4 * 3
+
+
+def test_chunks_do_not_depend_on_the_other_documents():
+    documents = [page(number) for number in range(5)] + [page(5, body=page(1).page_content.split('\n', 4)[4])]
+    lines = Chunker().learn_boilerplate([documents])
+
+    forward = Chunker(boilerplate_lines=lines).split_documents(documents)
+    backward = Chunker(boilerplate_lines=lines).split_documents(list(reversed(documents)))
+    alone = Chunker(boilerplate_lines=lines).split_documents([documents[3]])
+
+    def by_url(chunks):
+        return sorted((chunk.metadata["url"], chunk.page_content, chunk.metadata["chunk_index"]) for chunk in chunks)
+
+    assert by_url(forward) == by_url(backward)
+    assert by_url(alone) == [chunk for chunk in by_url(forward) if chunk[0] == "/p/3"]
+    # A chunk repeated on another page is kept on both, it is only embedded once, see VectorStore.embed_contents
+    assert len([chunk for chunk in forward if chunk.page_content.endswith(page(1).page_content.split('\n', 4)[4])]) == 2
+
+
+def test_long_documents_are_split_into_bounded_overlapping_chunks():
+    text = '\n'.join(f"Sentence number {number} of a long paragraph about tuition and scholarships." for number in range(60))
+    chunker = Chunker(max_tokens=100, overlap_tokens=20)
+    chunks = chunker.split_documents([Document(page_content=text, metadata={"url": "/long"})])
+
+    assert len(chunks) > 1
+    assert all(sum(estimate_tokens(line) for line in chunk.page_content.split('\n')) <= 100 for chunk in chunks)
+    assert [chunk.metadata["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+    # Consecutive chunks share their boundary lines
+    assert all(chunks[i].page_content.split('\n')[-1] in chunks[i + 1].page_content for i in range(len(chunks) - 1))
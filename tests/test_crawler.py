@@ -0,0 +1,354 @@
+import asyncio
+import csv
+import hashlib
+import os
+import sys
+import time
+from collections import defaultdict
+
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('bs4')
+
+from aiohttp import web  # noqa: E402
+
+from benchmarks.crawl_benchmark import LocalCrawler  # noqa: E402
+from benchmarks.synthetic_site import SyntheticSite  # noqa: E402
+from common.metrics import metrics  # noqa: E402
+from core.output_sink import read_feed_info  # noqa: E402
+
+# Paragraphs of distinct words, so no two synthetic pages are near-duplicates
+TEXTS = [' '.join(f"word{paragraph}x{word}" for word in range(40)) for paragraph in range(20)]
+
+
+async def crawl_served(site: SyntheticSite, folder: str, **kwargs) -> LocalCrawler:
+    """
+    Crawl all of a site that is already served into folder.
+    """
+    crawler = LocalCrawler(
+        site.root, base_url=f"{site.root}/p/0", max_depth=site.num_pages,
+        download_folder=os.path.join(folder, "pdf_files"), **kwargs
+    )
+    await crawler.start_extract(os.path.join(folder, "page_contents.csv"))
+    return crawler
+
+
+async def crawl(site: SyntheticSite, folder: str, **kwargs) -> LocalCrawler:
+    """
+    Serve a site and crawl all of it into folder.
+    """
+    await site.start()
+    try:
+        return await crawl_served(site, folder, **kwargs)
+    finally:
+        await site.stop()
+
+
+def page_requests(site: SyntheticSite) -> dict:
+    return {path: count for path, count in site.requests.items() if path.startswith('/p/')}
+
+
+def test_every_page_is_fetched_once(tmp_path):
+    site = SyntheticSite(num_pages=60, fanout=3, texts=TEXTS)
+    crawler = asyncio.run(crawl(site, str(tmp_path), num_workers=10))
+
+    requests = page_requests(site)
+    assert len(requests) == 60
+    assert set(requests.values()) == {1}
+    assert crawler.pages_extracted == 60
+
+
+class ThrottlingSite(SyntheticSite):
+    def __init__(self, *args, statuses=(429, 503), retry_after='0', **kwargs):
+        """
+        A synthetic site answering the first requests of every page with the given error statuses.
+        """
+        super().__init__(*args, **kwargs)
+        self.statuses = statuses
+        self.retry_after = retry_after
+        self.requested_at = defaultdict(list)
+
+    async def page(self, request: web.Request) -> web.Response:
+        self.requested_at[request.path].append(time.monotonic())
+        attempt = self.requests[request.path]
+        if attempt < len(self.statuses):
+            self.requests[request.path] += 1
+            return web.Response(status=self.statuses[attempt], headers={'Retry-After': self.retry_after})
+        return await super().page(request)
+
+
+def test_throttled_pages_are_retried_until_collected(tmp_path):
+    site = ThrottlingSite(num_pages=20, fanout=3, texts=TEXTS)
+    crawler = asyncio.run(crawl(site, str(tmp_path), num_workers=10, max_connections_per_host=8))
+
+    requests = page_requests(site)
+    assert len(requests) == 20
+    assert set(requests.values()) == {3}
+    assert crawler.pages_extracted == 20
+    # Every 429 and 503 halves the limit on requests in flight
+    assert crawler.concurrency.limit < 8
+
+
+def test_retry_after_is_honored(tmp_path):
+    site = ThrottlingSite(num_pages=1, fanout=1, texts=TEXTS, statuses=(429,), retry_after='1')
+    crawler = asyncio.run(crawl(site, str(tmp_path)))
+
+    first, second = site.requested_at['/p/0']
+    assert second - first >= 0.9
+    assert crawler.pages_extracted == 1
+
+
+def test_pages_are_given_up_after_the_last_retry(tmp_path):
+    site = ThrottlingSite(num_pages=1, fanout=1, texts=TEXTS, statuses=(503,) * 5)
+    crawler = asyncio.run(crawl(site, str(tmp_path), retries=3))
+
+    assert site.requests['/p/0'] == 3
+    assert crawler.pages_extracted == 0
+
+
+class SlowBodySite(SyntheticSite):
+    async def pdf(self, request: web.Request) -> web.StreamResponse:
+        """
+        Send the PDF headers at once and the body half a second later.
+        """
+        self.requests[request.path] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'application/pdf'})
+        await response.prepare(request)
+        await asyncio.sleep(0.5)
+        await response.write(b"%PDF-1.4\n%%EOF\n")
+        await response.write_eof()
+        return response
+
+
+def test_latency_is_measured_at_the_response_headers(tmp_path):
+    # Reading a slow body is not server latency, and must not make the crawler back off
+    site = SlowBodySite(num_pages=1, fanout=1, texts=TEXTS, pdf_every=1)
+    crawler = asyncio.run(crawl(site, str(tmp_path), max_connections_per_host=8, target_latency=0.2))
+
+    assert len(crawler.pdf_manifest) == 1
+    assert crawler.concurrency.limit == 8
+
+
+class ETagSite(SyntheticSite):
+    def __init__(self, *args, delay: float = 0.0, **kwargs):
+        """
+        A synthetic site sending an ETag with every page, answering 304 Not Modified to a matching
+        If-None-Match. Bumping versions[number] changes a page.
+        """
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+        self.versions = defaultdict(int)
+        self.not_modified = 0
+
+    async def page(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.delay)
+        number = int(request.match_info['number'])
+        etag = f'"{number}-{self.versions[number]}"'
+        if request.headers.get('If-None-Match') == etag:
+            self.requests[request.path] += 1
+            self.not_modified += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        response = await super().page(request)
+        response.headers['ETag'] = etag
+        return response
+
+    def page_html(self, number: int) -> str:
+        return super().page_html(number).replace('</body>', f'<p>version {self.versions[number]}</p></body>')
+
+
+def output_urls(folder: str) -> list:
+    with open(os.path.join(folder, "page_contents.csv"), newline='', encoding='utf-8') as file:
+        return [row['url'] for row in csv.DictReader(file)]
+
+
+def test_recrawl_only_passes_changed_pages_downstream(tmp_path):
+    async def run():
+        site = ETagSite(num_pages=30, fanout=3, texts=TEXTS)
+        await site.start()
+        try:
+            state_path = str(tmp_path / "crawl_state.sqlite")
+            first = await crawl_served(site, str(tmp_path / "first"), state_path=state_path)
+            second = await crawl_served(site, str(tmp_path / "second"), state_path=state_path)
+            not_modified = site.not_modified
+            site.versions[7] += 1
+            third = await crawl_served(site, str(tmp_path / "third"), state_path=state_path)
+        finally:
+            await site.stop()
+        return site, first, second, not_modified, third
+
+    site, first, second, not_modified, third = asyncio.run(run())
+    assert first.pages_extracted == 30
+    assert not_modified == 30
+    assert second.pages_extracted == 0
+    assert output_urls(str(tmp_path / "second")) == []
+    assert third.pages_extracted == 1
+    assert output_urls(str(tmp_path / "third")) == [f"{site.root}/p/7"]
+    # The sidecars tell the ingestion which outputs hold every page
+    assert read_feed_info(str(tmp_path / "first" / "page_contents.csv")) == {"incremental": False, "complete": True}
+    assert read_feed_info(str(tmp_path / "third" / "page_contents.csv")) == {"incremental": True, "complete": True}
+
+
+# Crawls a served site in a process of its own, so the test can kill it mid-crawl
+CRAWL_SCRIPT = """
+import asyncio, sys
+sys.path.insert(0, sys.argv[1])
+from benchmarks.crawl_benchmark import LocalCrawler
+root, folder, state_path = sys.argv[2:5]
+crawler = LocalCrawler(root, base_url=root + '/p/0', max_depth=1000, num_workers=2,
+                       download_folder=folder + '/pdf_files', state_path=state_path,
+                       near_duplicate_threshold=float(sys.argv[5]))
+asyncio.run(crawler.start_extract(folder + '/page_contents.csv'))
+"""
+
+
+class TwinSite(ETagSite):
+    def __init__(self, *args, **kwargs):
+        """
+        An ETagSite whose last leaves copy early pages, crawled long before them: the even ones exactly,
+        the odd ones with one more word, as near-duplicates.
+        """
+        super().__init__(*args, **kwargs)
+        self.twins = {number: number - 50 for number in range(self.num_pages - 20, self.num_pages)}
+
+    def page_html(self, number: int) -> str:
+        if number not in self.twins:
+            return super().page_html(number)
+        html = super().page_html(self.twins[number])
+        return html if number % 2 == 0 else html.replace('</body>', '<p>mirror</p></body>')
+
+
+# A threshold low enough that one more word keeps a page a near-duplicate, whatever the port in its links
+TWIN_THRESHOLD = 0.8
+
+
+def pages_skipped(reason: str) -> float:
+    return sum(counter["value"] for counter in metrics.snapshot()["counters"]
+               if counter["name"] == "pages_skipped" and counter["labels"] == {"reason": reason})
+
+
+def test_killed_crawl_resumes_without_losing_or_repeating_pages(tmp_path):
+    from core.crawl_state import CrawlState
+
+    src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+    state_path = str(tmp_path / "crawl_state.sqlite")
+
+    async def run():
+        site = TwinSite(num_pages=80, fanout=3, texts=TEXTS, delay=0.02)
+        await site.start()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, '-c', CRAWL_SCRIPT, src_path, site.root, str(tmp_path), state_path, str(TWIN_THRESHOLD),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            )
+            while len(page_requests(site)) < 45:
+                await asyncio.sleep(0.005)
+            process.kill()
+            await process.wait()
+
+            state = CrawlState(state_path)
+            interrupted = state.has_pending()
+            state.close()
+            skipped_before = {reason: pages_skipped(reason) for reason in ("duplicate", "near_duplicate")}
+            crawler = await crawl_served(site, str(tmp_path), num_workers=2, state_path=state_path,
+                                         near_duplicate_threshold=TWIN_THRESHOLD)
+            skipped = {reason: pages_skipped(reason) - skipped_before[reason] for reason in skipped_before}
+        finally:
+            await site.stop()
+        return site, interrupted, skipped
+
+    site, interrupted, skipped = asyncio.run(run())
+    urls = output_urls(str(tmp_path))
+    assert interrupted
+    assert len(urls) == len(set(urls))
+    # The twins of pages extracted before the kill are still skipped as duplicates after it
+    assert set(urls) == {f"{site.root}/p/{number}" for number in range(80) if number not in site.twins}
+    assert skipped == {"duplicate": 10, "near_duplicate": 10}
+    # Pages marked done before the kill are not fetched again
+    assert sum(page_requests(site).values()) < 2 * 80
+
+
+class FlakyPDFSite(SyntheticSite):
+    def __init__(self, *args, pdf_size: int = 3 * 1024 * 1024, **kwargs):
+        """
+        A synthetic site serving large PDFs with Range support, dropping the first download of each
+        PDF mid-stream.
+        """
+        super().__init__(*args, **kwargs)
+        self.pdf_size = pdf_size
+        self.ranges = []
+
+    def pdf_body(self, path: str) -> bytes:
+        return (b"%PDF-1.4\n" + path.encode('utf-8') * self.pdf_size)[:self.pdf_size]
+
+    async def pdf(self, request: web.Request) -> web.StreamResponse:
+        self.requests[request.path] += 1
+        body = self.pdf_body(request.path)
+        self.ranges.append(request.headers.get('Range'))
+        if request.http_range.start:
+            offset = request.http_range.start
+            response = web.StreamResponse(status=206, headers={
+                'Content-Type': 'application/pdf',
+                'Content-Range': f"bytes {offset}-{len(body) - 1}/{len(body)}",
+            })
+            response.content_length = len(body) - offset
+            await response.prepare(request)
+            await response.write(body[offset:])
+            await response.write_eof()
+            return response
+
+        response = web.StreamResponse(headers={'Content-Type': 'application/pdf'})
+        response.content_length = len(body)
+        await response.prepare(request)
+        await response.write(body[:len(body) // 3])
+        if self.requests[request.path] == 1:
+            await asyncio.sleep(0.05)
+            request.transport.close()
+            return response
+        await response.write(body[len(body) // 3:])
+        await response.write_eof()
+        return response
+
+
+def test_interrupted_pdf_download_resumes_from_its_partial_file(tmp_path):
+    site = FlakyPDFSite(num_pages=1, fanout=1, texts=TEXTS, pdf_every=1)
+    crawler = asyncio.run(crawl(site, str(tmp_path)))
+
+    body = site.pdf_body('/files/document-0.pdf')
+    content_hash = hashlib.sha256(body).hexdigest()
+    assert len(site.ranges) == 2 and site.ranges[0] is None
+    assert site.ranges[1].startswith('bytes=') and site.ranges[1] != 'bytes=0-'
+    entry = crawler.pdf_manifest[f"{site.root}/files/document-0.pdf"]
+    assert entry == {"file": f"{content_hash}.pdf", "sha256": content_hash, "name": "document-0.pdf"}
+    with open(tmp_path / "pdf_files" / entry["file"], 'rb') as pdf_file:
+        assert pdf_file.read() == body
+    assert os.listdir(tmp_path / "pdf_files" / ".partial") == []
+
+
+class SamePDFSite(SyntheticSite):
+    async def pdf(self, request: web.Request) -> web.Response:
+        self.requests[request.path] += 1
+        return web.Response(body=b"%PDF-1.4\nthe same file\n%%EOF\n", content_type='application/pdf')
+
+
+def test_pdfs_are_stored_once_by_content_and_not_downloaded_again(tmp_path):
+    async def run():
+        site = SamePDFSite(num_pages=10, fanout=3, texts=TEXTS, pdf_every=3)
+        await site.start()
+        try:
+            first = await crawl_served(site, str(tmp_path))
+            pdf_requests = sum(count for path, count in site.requests.items() if path.startswith('/files/'))
+            second = await crawl_served(site, str(tmp_path))
+        finally:
+            await site.stop()
+        return site, first, pdf_requests, second
+
+    site, first, pdf_requests, second = asyncio.run(run())
+    assert len(first.pdf_manifest) == 4
+    assert len({entry["file"] for entry in first.pdf_manifest.values()}) == 1
+    assert sorted(os.listdir(tmp_path / "pdf_files")) == [".partial", next(iter(first.pdf_manifest.values()))["file"],
+                                                          "manifest.json"]
+    # The second crawl reads the manifest and skips every PDF it lists
+    assert pdf_requests == 4
+    assert sum(count for path, count in site.requests.items() if path.startswith('/files/')) == 4
+    assert second.pdf_manifest == first.pdf_manifest
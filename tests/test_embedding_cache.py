@@ -0,0 +1,82 @@
+import itertools
+import sqlite3
+
+import pytest
+
+pytest.importorskip('langchain_core')
+
+from core.embedding_cache import CachedEmbeddings  # noqa: E402
+from core.fake_embedding import FakeEmbeddings  # noqa: E402
+
+
+def open_cache(tmp_path, model_id='fake', dimension=8, max_entries=1000):
+    return CachedEmbeddings(FakeEmbeddings(dimension=dimension, latency=0, model_id=model_id), model_id=model_id,
+                            cache_path=str(tmp_path / "embedding_cache.sqlite"), max_entries=max_entries)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Every lookup and store gets a later time, however fast they follow each other
+    ticks = itertools.count(1)
+    monkeypatch.setattr('core.embedding_cache.time.time', lambda: float(next(ticks)))
+
+
+def cached_keys(tmp_path):
+    with sqlite3.connect(str(tmp_path / "embedding_cache.sqlite")) as connection:
+        return {key for key, in connection.execute("SELECT key FROM embeddings")}
+
+
+def test_keys_are_stable_across_processes_and_apart_by_model_and_task(tmp_path):
+    cache = open_cache(tmp_path)
+    vectors = cache.embed_documents(["pho bo", "banh mi"])
+    key = cache.cache_key("pho bo", 'document')
+    cache.close()
+
+    reopened = open_cache(tmp_path)
+    assert reopened.cache_key("pho bo", 'document') == key
+    assert reopened.embed_documents(["banh mi", "pho bo"]) == vectors[::-1]
+    assert reopened.embeddings.calls == 0
+    assert reopened.stats() == {"hits": 2, "misses": 0, "entries": 2}
+    other_model = open_cache(tmp_path, 'other')
+    assert len({key, reopened.cache_key("pho bo", 'query'), other_model.cache_key("pho bo", 'document')}) == 3
+
+
+def test_the_least_recently_used_vectors_are_evicted(tmp_path, clock):
+    cache = open_cache(tmp_path, max_entries=2)
+    cache.embed_documents(["old"])
+    cache.embed_documents(["used"])
+    # Using the first vector again leaves the second one the least recently used
+    cache.embed_documents(["old"])
+    cache.embed_documents(["new"])
+    cache.close()
+
+    assert cached_keys(tmp_path) == {cache.cache_key(text, 'document') for text in ("old", "new")}
+
+
+def test_models_of_different_dimensions_share_a_cache_file_apart(tmp_path):
+    small = open_cache(tmp_path, 'small', dimension=8)
+    large = open_cache(tmp_path, 'large', dimension=16)
+
+    assert len(small.embed_query("bun cha")) == 8
+    assert len(large.embed_query("bun cha")) == 16
+    assert (small.get_dimension(), large.get_dimension()) == (8, 16)
+    small.close()
+    large.close()
+
+    # The dimension is remembered, so a reopened cache does not probe the model for it
+    reopened = open_cache(tmp_path, 'large', dimension=16)
+    assert reopened.get_dimension() == 16
+    assert reopened.embeddings.calls == 0
+
+
+def test_closing_writes_the_last_use_of_recent_hits(tmp_path, clock):
+    cache = open_cache(tmp_path)
+    cache.embed_documents(["com tam"])
+    with sqlite3.connect(str(tmp_path / "embedding_cache.sqlite")) as connection:
+        stored_at, = connection.execute("SELECT last_used FROM embeddings").fetchone()
+    cache.embed_documents(["com tam"])
+    cache.close()
+
+    with sqlite3.connect(str(tmp_path / "embedding_cache.sqlite")) as connection:
+        last_used, = connection.execute("SELECT last_used FROM embeddings").fetchone()
+    assert last_used > stored_at
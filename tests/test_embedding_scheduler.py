@@ -0,0 +1,146 @@
+import hashlib
+import random
+import threading
+import time
+from typing import List
+
+import pytest
+
+pytest.importorskip('langchain_core')
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+import core.embedding_scheduler  # noqa: E402
+from core.embedding_scheduler import QUERY_TASK_TYPE, EmbeddingScheduler, RequestBudget  # noqa: E402
+from retrieval.retriever import Retriever  # noqa: E402
+
+
+def fake_vector(text: str, task_type: str = None) -> List[float]:
+    digest = hashlib.sha256(f"{task_type}\0{text}".encode('utf-8')).digest()
+    return [byte / 255 for byte in digest[:8]]
+
+
+class FakeBackend(Embeddings):
+    def __init__(self, failure_rate: float = 0.0, max_latency: float = 0.0, seed: int = 0):
+        """
+        An embedding model that answers after a random latency, failing a share of its requests,
+        and records every request it gets.
+        """
+        self.failure_rate = failure_rate
+        self.max_latency = max_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.failures = 0
+
+    def embed_documents(self, texts: List[str], task_type: str = None) -> List[List[float]]:
+        with self.lock:
+            self.requests.append((list(texts), task_type))
+            latency = self.random.uniform(0, self.max_latency)
+            failed = self.random.random() < self.failure_rate
+            self.failures += failed
+        time.sleep(latency)
+        if failed:
+            raise RuntimeError("503 Service Unavailable")
+        return [fake_vector(text, task_type) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text], task_type=QUERY_TASK_TYPE)[0]
+
+
+class QueryOnlyBackend(Embeddings):
+    def __init__(self):
+        self.queries = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [fake_vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.queries.append(text)
+        return fake_vector(text, QUERY_TASK_TYPE)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(core.embedding_scheduler, 'backoff_delay', lambda attempt: 0)
+
+
+TEXTS = [f"text {number} " + "word " * (number % 50) for number in range(400)]
+
+
+def test_batches_are_bounded_and_keep_the_order():
+    scheduler = EmbeddingScheduler(FakeBackend(), batch_size=16, max_batch_tokens=100)
+    texts = TEXTS + ["x" * 1000]
+    batches = scheduler.make_batches(texts)
+
+    assert [text for batch in batches for text in batch] == texts
+    assert all(len(batch) <= 16 for batch in batches)
+    assert all(sum(len(text) // 4 + 1 for text in batch) <= 100 for batch in batches[:-1])
+    # A text over the token bound gets a batch of its own
+    assert batches[-1] == ["x" * 1000]
+
+
+def test_concurrent_batches_come_back_in_order():
+    backend = FakeBackend(max_latency=0.02)
+    scheduler = EmbeddingScheduler(backend, batch_size=16, max_workers=8)
+
+    assert scheduler.embed_documents(TEXTS) == [fake_vector(text) for text in TEXTS]
+    assert len(backend.requests) == len(scheduler.make_batches(TEXTS))
+
+
+def test_failed_batches_are_retried():
+    backend = FakeBackend(failure_rate=0.2, max_latency=0.01, seed=1)
+    scheduler = EmbeddingScheduler(backend, batch_size=16, max_workers=8, retries=10)
+
+    assert scheduler.embed_documents(TEXTS) == [fake_vector(text) for text in TEXTS]
+    assert backend.failures > 0
+    assert len(backend.requests) == len(scheduler.make_batches(TEXTS)) + backend.failures
+
+
+def test_a_batch_failing_every_attempt_raises():
+    backend = FakeBackend(failure_rate=1.0)
+    scheduler = EmbeddingScheduler(backend, retries=3)
+
+    with pytest.raises(RuntimeError):
+        scheduler.embed_documents(["a", "b"])
+    assert len(backend.requests) == 3
+
+
+def test_queries_are_embedded_in_batches_with_the_query_task_type():
+    backend = FakeBackend()
+    scheduler = EmbeddingScheduler(backend, batch_size=16)
+    queries = TEXTS[:100]
+
+    assert scheduler.embed_queries(queries) == [fake_vector(text, QUERY_TASK_TYPE) for text in queries]
+    assert len(backend.requests) == len(scheduler.make_batches(queries))
+    assert {task_type for _, task_type in backend.requests} == {QUERY_TASK_TYPE}
+
+
+def test_queries_fall_back_to_one_request_each_without_a_task_type():
+    backend = QueryOnlyBackend()
+    scheduler = EmbeddingScheduler(backend, batch_size=16)
+
+    assert scheduler.embed_queries(["a", "b", "c"]) == [fake_vector(text, QUERY_TASK_TYPE) for text in "abc"]
+    assert sorted(backend.queries) == ["a", "b", "c"]
+
+
+def test_request_budget_spreads_requests():
+    budget = RequestBudget(requests_per_minute=600)
+    started_at = time.monotonic()
+    for _ in range(15):
+        budget.acquire()
+    # A burst of 10, then 10 requests per second
+    assert time.monotonic() - started_at >= 0.45
+
+
+def test_the_retriever_embeds_queries_through_the_scheduler_batches():
+    backend = FakeBackend()
+    scheduler = EmbeddingScheduler(backend, batch_size=16)
+    retriever = Retriever(cache_size=100)
+    queries = TEXTS[:40]
+
+    assert retriever.embed_contexts(scheduler, queries) == [fake_vector(text, QUERY_TASK_TYPE) for text in queries]
+    assert len(backend.requests) == len(scheduler.make_batches(queries))
+    # Cached queries are not embedded again
+    retriever.embed_contexts(scheduler, queries[:10])
+    assert len(backend.requests) == len(scheduler.make_batches(queries))
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip('faiss')
+pytest.importorskip('langchain_community')
+
+from langchain_core.documents import Document  # noqa: E402
+
+from core.fake_embedding import FakeEmbeddings  # noqa: E402
+from core.index_factory import search_parameters  # noqa: E402
+from core.sqlite_docstore import SQLiteDocstore  # noqa: E402
+from core.vector_store import VectorStore  # noqa: E402
+
+
+@pytest.fixture
+def handler():
+    return VectorStore()
+
+
+def new_store(handler, tmp_path, dimension=16):
+    return handler.creat_vector_store(FakeEmbeddings(dimension=dimension, latency=0),
+                                      docstore=SQLiteDocstore(str(tmp_path / "store.docstore.sqlite")))
+
+
+def add_texts(handler, vector_store, texts, fields):
+    documents = [Document(page_content=text, metadata={"field": field}) for text, field in zip(texts, fields)]
+    ids = [handler.document_id(document) for document in documents]
+    handler.add_vectors(vector_store, documents, ids, vector_store.embedding_function.embed_documents(texts))
+    return ids
+
+
+def hit_ids(vector_store, query, **kwargs):
+    vector = vector_store.embedding_function.embed_query(query)
+    return [document.id for document, _ in vector_store.similarity_search_with_score_by_vector(vector, **kwargs)]
+
+
+def test_a_filter_matching_fewer_than_k_documents_finds_all_of_them_on_an_ivf_index(tmp_path, handler):
+    vector_store = new_store(handler, tmp_path)
+    texts = [f"document {number}" for number in range(2000)]
+    fields = ["rare" if number % 700 == 0 else "common" for number in range(2000)]
+    ids = add_texts(handler, vector_store, texts, fields)
+    handler.migrate_vector_store(vector_store, 'IVF-Flat')
+    ivf = faiss.extract_index_ivf(vector_store.index)
+    ivf.nprobe = 1
+    rare_ids = {id_ for id_, field in zip(ids, fields) if field == "rare"}
+
+    # Probing one list misses most of the rare documents, spread over the others
+    allowed = vector_store.filter_positions({"field": "rare"})
+    query = np.array([vector_store.embedding_function.embed_query("query")], dtype=np.float32)
+    _, positions = vector_store.index.search(query, 5, params=search_parameters(
+        vector_store.index, faiss.IDSelectorBatch(allowed)))
+    assert (positions >= 0).sum() < len(rare_ids)
+
+    assert set(hit_ids(vector_store, "query", k=5, filter={"field": "rare"})) == rare_ids
+
+
+def test_tombstoned_documents_are_skipped_inside_the_search(tmp_path, handler):
+    vector_store = new_store(handler, tmp_path)
+    texts = [f"document {number}" for number in range(20)]
+    ids = add_texts(handler, vector_store, texts, ["common"] * 20)
+
+    handler.delete_documents(vector_store, [ids[3]])
+
+    hits = hit_ids(vector_store, "document 3", k=5)
+    assert ids[3] not in hits
+    # The tombstone is skipped by the index search, not dropped from its k results
+    assert len(hits) == 5
+    assert ids[3] not in hit_ids(vector_store, "document 3", k=5, filter={"field": "common"})
+
+
+def test_tombstones_are_skipped_in_the_delta_index_of_a_memory_mapped_store(tmp_path, handler):
+    vector_store = new_store(handler, tmp_path)
+    saved_ids = add_texts(handler, vector_store, [f"saved {number}" for number in range(10)], ["saved"] * 10)
+    handler.save_vector_store(vector_store, str(tmp_path), "store")
+    logged_ids = add_texts(handler, vector_store, [f"logged {number}" for number in range(10)], ["logged"] * 10)
+
+    loaded = handler.load_vector_store(str(tmp_path), "store", vector_store.embedding_function, mmap=True)
+    assert loaded.delta_index.ntotal == 10
+    handler.delete_documents(loaded, [saved_ids[0], logged_ids[0]])
+
+    hits = hit_ids(loaded, "logged 0", k=20)
+    assert len(hits) == 18
+    assert not {saved_ids[0], logged_ids[0]} & set(hits)
+    assert set(hit_ids(loaded, "logged 0", k=20, filter={"field": "logged"})) == set(logged_ids[1:])
@@ -0,0 +1,35 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from core.http_policy import AdaptiveConcurrency, backoff_delay, parse_retry_after  # noqa: E402
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2') == 2.0
+    assert parse_retry_after('-5') == 0.0
+    assert 8 <= parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_backoff_delay():
+    assert backoff_delay(0, retry_after=3) == 3
+    assert backoff_delay(0, cap=5, retry_after=30) == 5
+    assert all(0 <= backoff_delay(attempt, base=1, cap=4) <= min(4, 2 ** attempt) for attempt in range(10))
+
+
+def test_adaptive_concurrency():
+    async def run():
+        concurrency = AdaptiveConcurrency(initial=8, maximum=9, target_latency=1.0, increase_every=2)
+        for latency, throttled in [(0.1, False), (0.1, False), (None, True), (2.0, False)]:
+            await concurrency.acquire()
+            await concurrency.release(latency=latency, throttled=throttled)
+        return concurrency.limit
+
+    # Two fast responses raise 8 to 9, a throttle halves it to 4, a slow response to 2
+    assert asyncio.run(run()) == 2
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip('faiss')
+
+from core.index_factory import (  # noqa: E402
+    PQ_CENTROIDS, auto_nlist, auto_pq_m, build_index, index_settings, train_index,
+)
+
+
+@pytest.mark.parametrize("number_of_documents, nlist", [
+    (10, 1),
+    # Small corpora are limited by the training vectors per list, large ones by 4 * sqrt(N)
+    (1000, 1000 // 39),
+    (1_000_000, 4000),
+])
+def test_auto_nlist(number_of_documents, nlist):
+    assert auto_nlist(number_of_documents) == nlist
+
+
+@pytest.mark.parametrize("dimension, pq_m", [(768, 64), (100, 10), (32, 4), (4, 1)])
+def test_auto_pq_m_divides_the_dimension_into_sub_vectors_of_8_or_more(dimension, pq_m):
+    assert auto_pq_m(dimension) == pq_m
+    assert dimension % pq_m == 0
+
+
+def vectors(number, dimension=16):
+    return np.random.default_rng(0).standard_normal((number, dimension)).astype(np.float32)
+
+
+@pytest.mark.parametrize("index_type, too_few", [('IVF-Flat', 15), ('IVF-PQ', PQ_CENTROIDS - 1)])
+def test_training_on_too_few_vectors_falls_back_to_flat(index_type, too_few):
+    settings = {**index_settings({'INDEX_TYPE': index_type, 'IVF_NLIST': 16}, 16), 'pq_m': 4}
+    index = build_index(16, settings)
+
+    trained = train_index(index, vectors(too_few), settings)
+
+    assert isinstance(trained, faiss.IndexFlatL2)
+    assert trained.is_trained and trained.ntotal == 0
+
+
+def test_training_on_enough_vectors_keeps_the_configured_index():
+    settings = index_settings({'INDEX_TYPE': 'IVF-Flat', 'IVF_NLIST': 16}, 16)
+    index = build_index(16, settings)
+
+    trained = train_index(index, vectors(16 * 39), settings)
+
+    assert trained is index
+    assert trained.is_trained
@@ -0,0 +1,62 @@
+import unicodedata
+
+import pytest
+
+pytest.importorskip('langchain_community')
+
+from langchain_core.documents import Document  # noqa: E402
+
+from core.lexical_index import fold_diacritics, match_query  # noqa: E402
+from core.sqlite_docstore import SQLiteDocstore  # noqa: E402
+
+DISHES = {
+    "pho": ("Phở bò Hà Nội", "noodles"),
+    "old_quarter": ("Phố cổ Hà Nội", "places"),
+    "bun_cha": ("Bún chả Hà Nội", "noodles"),
+    "banh_mi": ("Bánh mì Sài Gòn", "bread"),
+}
+
+
+@pytest.fixture
+def lexical_index(tmp_path):
+    docstore = SQLiteDocstore(str(tmp_path / "store.docstore.sqlite"))
+    docstore.add({id_: Document(page_content=text, metadata={"field": field})
+                  for id_, (text, field) in DISHES.items()})
+    return docstore.lexical_index()
+
+
+def ids(hits):
+    return [id_ for id_, _ in hits]
+
+
+def test_diacritics_are_folded_including_the_crossed_d():
+    assert fold_diacritics("phở") == "pho"
+    assert fold_diacritics("Đường") == "Duong"
+
+
+def test_tokens_typed_with_diacritics_match_exactly_and_the_others_folded():
+    assert match_query("phở pho") == 'exact : "phở" OR folded : "pho"'
+    assert match_query("...") is None
+
+
+def test_a_query_without_diacritics_matches_every_folded_spelling(lexical_index):
+    assert set(ids(lexical_index.search("pho"))) == {"pho", "old_quarter"}
+    assert ids(lexical_index.search("banh mi sai gon", k=1)) == ["banh_mi"]
+
+
+def test_a_query_with_diacritics_only_matches_that_spelling(lexical_index):
+    assert ids(lexical_index.search("phở")) == ["pho"]
+    # A decomposed query is composed like the indexed texts
+    assert ids(lexical_index.search(unicodedata.normalize('NFD', "phở"))) == ["pho"]
+
+
+def test_bm25_ranks_documents_matching_more_terms_first(lexical_index):
+    hits = lexical_index.search("bun cha ha noi")
+
+    assert ids(hits)[0] == "bun_cha"
+    assert set(ids(hits)) == {"bun_cha", "pho", "old_quarter"}
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_equality_filters_restrict_the_matches(lexical_index):
+    assert set(ids(lexical_index.search("ha noi", filter={"field": "noodles"}, k=5))) == {"pho", "bun_cha"}
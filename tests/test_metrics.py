@@ -0,0 +1,58 @@
+import logging
+
+from common.logger import Logger
+from common.metrics import MetricsRegistry
+
+
+def test_counters_gauges_and_histograms_in_the_prometheus_text_format():
+    registry = MetricsRegistry()
+    registry.increment('pages_fetched', status='ok')
+    registry.increment('pages_fetched', status='ok')
+    registry.set_gauge('vectors', 10, store='menu')
+    registry.observe('request_seconds', 0.003, mode='dense')
+    registry.observe('request_seconds', 0.2, mode='dense')
+
+    lines = registry.prometheus_text().splitlines()
+
+    assert lines[:4] == [
+        '# TYPE datavengers_pages_fetched_total counter',
+        'datavengers_pages_fetched_total{status="ok"} 2',
+        '# TYPE datavengers_vectors gauge',
+        'datavengers_vectors{store="menu"} 10',
+    ]
+    assert '# TYPE datavengers_request_seconds histogram' in lines
+    # Buckets are cumulative, up to +Inf which counts every observation
+    assert 'datavengers_request_seconds_bucket{mode="dense",le="0.0025"} 0' in lines
+    assert 'datavengers_request_seconds_bucket{mode="dense",le="0.005"} 1' in lines
+    assert 'datavengers_request_seconds_bucket{mode="dense",le="0.25"} 2' in lines
+    assert 'datavengers_request_seconds_bucket{mode="dense",le="+Inf"} 2' in lines
+    assert 'datavengers_request_seconds_sum{mode="dense"} 0.203' in lines
+    assert 'datavengers_request_seconds_count{mode="dense"} 2' in lines
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.increment('errors', message='say "hi"\\\n')
+
+    assert 'datavengers_errors_total{message="say \\"hi\\"\\\\\\n"} 1' in registry.prometheus_text().splitlines()
+
+
+def test_a_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    registry.increment('pages_fetched')
+    with registry.span('fetch'):
+        pass
+
+    assert registry.prometheus_text() == '\n'
+
+
+class MetricsTestComponent(Logger):
+    pass
+
+
+def test_every_instance_of_a_class_shares_one_log_handler():
+    first = MetricsTestComponent()
+    second = MetricsTestComponent()
+
+    assert first.logger is second.logger is logging.getLogger('MetricsTestComponent')
+    assert len(first.logger.handlers) == 1
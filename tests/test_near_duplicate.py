@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from core.near_duplicate import FINGERPRINT_BITS, SimHashIndex  # noqa: E402
+
+
+def flip_bits(fingerprint, num_bits, rng):
+    for bit in rng.sample(range(FINGERPRINT_BITS), num_bits):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+@pytest.mark.parametrize("threshold", [1.0, 0.95, 0.8, 0.5, 0.02])
+def test_bands_split_the_fingerprint_into_max_distance_plus_one_parts(threshold):
+    index = SimHashIndex(similarity_threshold=threshold)
+
+    assert len(index.bands) == index.max_distance + 1
+    # The bands are contiguous and cover every bit once
+    assert [start for start, _ in index.bands] == [sum(width for _, width in index.bands[:band])
+                                                   for band in range(len(index.bands))]
+    assert sum(width for _, width in index.bands) == FINGERPRINT_BITS
+    assert all(width > 0 for _, width in index.bands)
+
+
+@pytest.mark.parametrize("threshold", [0.95, 0.8])
+def test_fingerprints_match_up_to_max_distance_bits_apart(threshold):
+    index = SimHashIndex(similarity_threshold=threshold)
+    rng = random.Random(0)
+    for number in range(200):
+        fingerprint = rng.getrandbits(FINGERPRINT_BITS)
+        index.add(f"text{number}", fingerprint)
+        # Flipped bits land in any band, the pigeonhole principle leaves one band intact
+        assert index.find(flip_bits(fingerprint, index.max_distance, rng)) == f"text{number}"
+        assert index.find(flip_bits(fingerprint, index.max_distance + 1, rng)) is None
+
+
+def test_the_default_threshold_allows_three_bits_in_four_bands():
+    index = SimHashIndex()
+
+    assert index.max_distance == 3
+    assert index.bands == [(0, 16), (16, 16), (32, 16), (48, 16)]
+
+
+@pytest.mark.parametrize("threshold", [0, -0.5, 1.5])
+def test_thresholds_outside_zero_to_one_are_rejected(threshold):
+    with pytest.raises(ValueError):
+        SimHashIndex(similarity_threshold=threshold)
+
+
+def test_near_duplicate_texts_are_found_and_distinct_ones_are_not():
+    index = SimHashIndex(similarity_threshold=0.8)
+    text = ' '.join(f"word{number}" for number in range(200))
+
+    assert index.check_and_add("original", text) is None
+    assert index.check_and_add("copy", text + " appended") == "original"
+    assert index.check_and_add("other", ' '.join(f"term{number}" for number in range(200))) is None
@@ -0,0 +1,83 @@
+import csv
+import json
+
+import pytest
+
+from core.output_sink import open_sink, read_feed_info, write_feed_info
+
+FIELDS = ["url", "contents"]
+FORMATS = ['.csv', '.jsonl', '.parquet']
+
+
+def record(number):
+    return {"url": f"https://example.edu/{number}", "contents": f"Page {number}, with a comma"}
+
+
+def read_records(path):
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as file:
+            return list(csv.DictReader(file))
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+    import pyarrow.parquet as pq
+    return pq.read_table(path).to_pylist()
+
+
+@pytest.fixture(params=FORMATS)
+def output_path(request, tmp_path):
+    if request.param == '.parquet':
+        pytest.importorskip('pyarrow')
+    return str(tmp_path / f"page_contents{request.param}")
+
+
+def test_records_are_written_out_when_the_buffer_fills_and_on_close(output_path):
+    sink = open_sink(output_path, FIELDS, buffer_size=2, flush_interval=3600)
+    sink.write(record(0))
+    assert sink.records_written == 0
+    sink.write(record(1))
+    assert sink.records_written == 2
+    sink.write(record(2))
+    sink.close()
+
+    assert read_records(output_path) == [record(number) for number in range(3)]
+
+
+def test_an_unbounded_buffer_is_only_written_out_by_flush(output_path):
+    sink = open_sink(output_path, FIELDS, buffer_size=None, flush_interval=0)
+    for number in range(5):
+        sink.write(record(number))
+    assert sink.records_written == 0
+    sink.flush()
+    assert sink.records_written == 5
+    sink.close()
+
+    assert read_records(output_path) == [record(number) for number in range(5)]
+
+
+def test_appending_keeps_the_records_already_written(output_path):
+    with open_sink(output_path, FIELDS) as sink:
+        sink.write(record(0))
+    with open_sink(output_path, FIELDS, append=True) as sink:
+        sink.write(record(1))
+        appended_path = sink.path
+
+    records = read_records(output_path)
+    if appended_path != output_path:
+        # Parquet files cannot be appended to, the new records go to a part file next to it
+        assert appended_path.endswith('.part1.parquet')
+        records += read_records(appended_path)
+    assert records == [record(0), record(1)]
+
+
+def test_unknown_formats_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        open_sink(str(tmp_path / "page_contents.xlsx"), FIELDS)
+
+
+def test_the_feed_sidecar_round_trips(tmp_path):
+    path = str(tmp_path / "page_contents.csv")
+    assert read_feed_info(path) is None
+
+    write_feed_info(path, incremental=True, complete=False)
+    assert read_feed_info(path) == {"incremental": True, "complete": False}
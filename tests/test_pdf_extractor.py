@@ -0,0 +1,80 @@
+import shutil
+
+import pytest
+
+pytest.importorskip('pypdf')
+
+from core.pdf_extractor import PDFExtractor, file_sha256  # noqa: E402
+
+
+def write_pdf(path, text):
+    """
+    Write a one-page PDF showing a line of text.
+    """
+    stream = f"BT /F1 12 Tf 72 712 Td ({text}) Tj ET".encode('latin-1')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b"%d 0 obj\n%s\nendobj\n" % (number, content)
+    xref = len(body)
+    body += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    body += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    body += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as file:
+        file.write(body)
+
+
+def extract(folder, layout=False):
+    extractor = PDFExtractor(str(folder), layout=layout, workers=1)
+    try:
+        documents = [document for batch in extractor.iter_documents() for document in batch]
+    finally:
+        extractor.close()
+    return extractor, sorted(document.page_content for document in documents)
+
+
+def test_pdfs_are_parsed_once_and_then_read_from_the_cache(tmp_path):
+    write_pdf(tmp_path / "admissions.pdf", "Admissions open in May")
+    write_pdf(tmp_path / "fees.pdf", "Tuition fees")
+
+    first, contents = extract(tmp_path)
+    second, cached_contents = extract(tmp_path)
+
+    assert contents == ["Admissions open in May", "Tuition fees"]
+    assert (first.parsed, first.cached) == (2, 0)
+    assert (second.parsed, second.cached) == (0, 2)
+    assert cached_contents == contents
+
+
+def test_the_cache_is_keyed_by_content_not_by_file_name(tmp_path):
+    write_pdf(tmp_path / "admissions.pdf", "Admissions open in May")
+    extract(tmp_path)
+    # The crawler saves a PDF downloaded again from another URL under its content hash
+    content_hash = file_sha256(str(tmp_path / "admissions.pdf"))
+    shutil.copy(tmp_path / "admissions.pdf", tmp_path / f"{content_hash}.pdf")
+
+    extractor, contents = extract(tmp_path)
+
+    assert (extractor.parsed, extractor.cached) == (0, 2)
+    assert contents == ["Admissions open in May"] * 2
+
+
+def test_each_extraction_mode_has_its_own_cache_entry(tmp_path):
+    write_pdf(tmp_path / "admissions.pdf", "Admissions open in May")
+    extract(tmp_path)
+
+    layout_extractor, contents = extract(tmp_path, layout=True)
+    cached_layout_extractor, _ = extract(tmp_path, layout=True)
+
+    assert (layout_extractor.parsed, layout_extractor.cached) == (1, 0)
+    assert (cached_layout_extractor.parsed, cached_layout_extractor.cached) == (0, 1)
+    assert contents == ["Admissions open in May"]
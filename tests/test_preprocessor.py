@@ -0,0 +1,52 @@
+import csv
+
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('langchain_core')
+
+from core.preprocesor import Preprocessor  # noqa: E402
+
+
+def write_csv(path, fieldnames, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_curated_datasets_are_read_from_the_content_column(tmp_path):
+    path = write_csv(tmp_path / "food_data.csv", ["field", "content"], [
+        {"field": "Pho, Vietnam", "content": "Rice noodles in a clear broth."},
+        {"field": "", "content": "A dish without a name."},
+    ])
+
+    documents = [document for batch in Preprocessor().iter_csv(path) for document in batch]
+
+    assert [document.page_content for document in documents] == ["Rice noodles in a clear broth.",
+                                                                 "A dish without a name."]
+    assert [document.metadata for document in documents] == [{"field": "Pho, Vietnam"}, {"field": "unknown"}]
+
+
+def test_crawled_pages_are_read_from_the_contents_column_with_their_url_and_title(tmp_path):
+    path = write_csv(tmp_path / "page_contents.csv", ["url", "title", "metadata", "contents"], [
+        {"url": "https://example.edu/a", "title": "A", "metadata": "", "contents": "Admissions open in May."},
+        {"url": "https://example.edu/b", "title": "", "metadata": "", "contents": ""},
+        {"url": "https://example.edu/c", "title": "C", "metadata": "", "contents": "Tuition fees."},
+    ])
+
+    batches = list(Preprocessor().iter_csv(path, chunksize=2))
+
+    # Pages without contents are skipped, and every chunk of rows is a batch of its own
+    assert [[document.page_content for document in batch] for batch in batches] == [
+        ["Admissions open in May."], ["Tuition fees."]
+    ]
+    assert batches[1][0].metadata == {"field": "unknown", "url": "https://example.edu/c", "title": "C"}
+
+
+def test_a_csv_without_a_content_column_is_rejected(tmp_path):
+    path = write_csv(tmp_path / "other.csv", ["field", "text"], [{"field": "a", "text": "b"}])
+
+    with pytest.raises(ValueError):
+        list(Preprocessor().iter_csv(path))
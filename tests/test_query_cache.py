@@ -0,0 +1,50 @@
+import pytest
+
+from core.query_cache import QueryCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr('core.query_cache.time.monotonic', lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_their_time_to_live(clock):
+    cache = QueryCache(ttl=10)
+    cache.put_many({"pho": [1.0]})
+
+    clock[0] = 9.9
+    assert cache.get_many(["pho"]) == {"pho": [1.0]}
+    clock[0] = 10.0
+    assert cache.get_many(["pho"]) == {}
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 0}
+
+
+def test_entries_without_a_time_to_live_stay_until_evicted(clock):
+    cache = QueryCache(ttl=None)
+    cache.put_many({"pho": [1.0]})
+
+    clock[0] = 10 ** 9
+    assert cache.get_many(["pho"]) == {"pho": [1.0]}
+
+
+def test_the_least_recently_used_entries_are_evicted(clock):
+    cache = QueryCache(max_entries=2)
+    cache.put_many({"pho": [1.0], "bun": [2.0]})
+    # Reading the first entry leaves the second one the least recently used
+    cache.get_many(["pho"])
+    cache.put_many({"com": [3.0]})
+
+    assert cache.get_many(["pho", "bun", "com"]) == {"pho": [1.0], "com": [3.0]}
+
+
+def test_putting_an_entry_again_renews_it(clock):
+    cache = QueryCache(max_entries=2, ttl=10)
+    cache.put_many({"pho": [1.0], "bun": [2.0]})
+    clock[0] = 5
+    cache.put_many({"pho": [1.5]})
+    cache.put_many({"com": [3.0]})
+
+    clock[0] = 12
+    assert cache.get_many(["pho", "bun", "com"]) == {"pho": [1.5], "com": [3.0]}
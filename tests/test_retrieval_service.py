@@ -0,0 +1,54 @@
+import asyncio
+import csv
+
+import pytest
+
+pytest.importorskip('faiss')
+pytest.importorskip('langchain_community')
+
+from core.fake_embedding import FakeEmbeddings  # noqa: E402
+from handler.retrieval_service import RetrievalService  # noqa: E402
+
+DISHES = [f"Dish {number} is cooked with ingredient {number} and served hot." for number in range(24)]
+
+
+def write_dishes(path):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=["field", "content"])
+        writer.writeheader()
+        for number, content in enumerate(DISHES):
+            writer.writerow({"field": f"dish {number}", "content": content})
+
+
+def test_concurrent_searches_share_one_embedding_call_and_one_index_search(tmp_path):
+    csv_path = str(tmp_path / "dishes.csv")
+    write_dishes(csv_path)
+    embedding = FakeEmbeddings(dimension=32, latency=0)
+
+    async def run():
+        service = RetrievalService(["menu"], embedding=embedding, folder_path=str(tmp_path))
+        # A wide window, so a slow test machine still gathers every search into the same batch
+        service.max_wait = 0.5
+        try:
+            await service.insert("menu", csv_path)
+            vector_store = service.stores["menu"].vector_store
+            index_searches = []
+            search_by_vectors = vector_store.similarity_search_with_score_by_vectors
+
+            def counting_search(vectors, **kwargs):
+                index_searches.append(len(vectors))
+                return search_by_vectors(vectors, **kwargs)
+
+            vector_store.similarity_search_with_score_by_vectors = counting_search
+            embedding_calls = embedding.calls
+            results = await asyncio.gather(*(service.search("menu", dish, k=1) for dish in DISHES))
+            return results, embedding.calls - embedding_calls, index_searches
+        finally:
+            await service.stop()
+
+    results, embedding_calls, index_searches = asyncio.run(run())
+
+    assert embedding_calls == 1
+    assert index_searches == [len(DISHES)]
+    # Every search gets the answer to its own query back, not another one of the batch
+    assert [hits[0][0].page_content for hits in results] == DISHES
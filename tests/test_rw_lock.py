@@ -0,0 +1,42 @@
+import threading
+import time
+
+from common.rw_lock import ReadWriteLock
+
+
+def test_a_waiting_writer_keeps_new_readers_out():
+    lock = ReadWriteLock()
+    events = []
+    first_reader_holds = threading.Event()
+    release_first_reader = threading.Event()
+
+    def first_reader():
+        with lock.read():
+            first_reader_holds.set()
+            release_first_reader.wait()
+            events.append("first reader done")
+
+    def writer():
+        with lock.write():
+            events.append("writer")
+
+    def late_reader():
+        with lock.read():
+            events.append("late reader")
+
+    threads = [threading.Thread(target=target, daemon=True) for target in (first_reader, writer, late_reader)]
+    try:
+        threads[0].start()
+        first_reader_holds.wait()
+        threads[1].start()
+        while not lock.waiting_writers:
+            time.sleep(0.001)
+        threads[2].start()
+        # The late reader would get in alongside the first one if it did not queue behind the writer
+        time.sleep(0.05)
+        assert events == []
+    finally:
+        release_first_reader.set()
+        for thread in threads:
+            thread.join(timeout=5)
+    assert events == ["first reader done", "writer", "late reader"]
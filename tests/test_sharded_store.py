@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+pytest.importorskip('faiss')
+pytest.importorskip('langchain_community')
+
+from core.fake_embedding import FakeEmbeddings  # noqa: E402
+from core.sharded_store import ShardedVectorStore  # noqa: E402
+from core.sqlite_docstore import SQLiteDocstore  # noqa: E402
+from core.vector_store import VectorStore  # noqa: E402
+
+
+def write_rows(path, num_rows):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=["field", "content"])
+        writer.writeheader()
+        for number in range(num_rows):
+            writer.writerow({"field": f"topic {number % 7}", "content": f"Row {number} is about topic {number % 7}."})
+
+
+def test_adding_a_shard_only_moves_values_to_the_new_shard(tmp_path):
+    store = ShardedVectorStore("sharded", FakeEmbeddings(dimension=8, latency=0), num_shards=3, folder_path=str(tmp_path))
+    values = [f"document {number}" for number in range(2000)]
+    before = {value: store.shard_of(value) for value in values}
+
+    new_shard = store.add_shard()
+    after = {value: store.shard_of(value) for value in values}
+
+    moved = [value for value in values if after[value] != before[value]]
+    assert all(after[value] == new_shard for value in moved)
+    # About a quarter of the values move to the fourth shard
+    assert 0.15 < len(moved) / len(values) < 0.35
+
+
+def test_merged_shard_results_match_a_single_store(tmp_path):
+    csv_path = str(tmp_path / "rows.csv")
+    write_rows(csv_path, 200)
+    embedding = FakeEmbeddings(dimension=16, latency=0)
+    handler = VectorStore()
+
+    single = handler.creat_vector_store(embedding, docstore=SQLiteDocstore(str(tmp_path / "single.docstore.sqlite")))
+    handler.insert_document(single, csv_path)
+    sharded = ShardedVectorStore("sharded", embedding, num_shards=4, folder_path=str(tmp_path / "shards"),
+                                 vector_store_handler=handler)
+    sharded.insert_document(csv_path)
+    assert sum(shard.index.ntotal for shard in sharded.shards.values()) == single.index.ntotal == 200
+
+    queries = embedding.embed_documents([f"query {number}" for number in range(10)])
+    expected = single.similarity_search_with_score_by_vectors(queries, k=5)
+    merged = sharded.similarity_search_with_score_by_vectors(queries, k=5)
+
+    for single_hits, sharded_hits in zip(expected, merged):
+        assert [document.id for document, _ in sharded_hits] == [document.id for document, _ in single_hits]
+        assert [score for _, score in sharded_hits] == pytest.approx([score for _, score in single_hits])
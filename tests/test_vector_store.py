@@ -0,0 +1,193 @@
+import csv
+
+import pytest
+
+pytest.importorskip('faiss')
+pytest.importorskip('langchain_community')
+
+from langchain_core.documents import Document  # noqa: E402
+
+from core.fake_embedding import FakeEmbeddings  # noqa: E402
+from core.output_sink import write_feed_info  # noqa: E402
+from core.sqlite_docstore import SQLiteDocstore  # noqa: E402
+from core.vector_store import VectorStore  # noqa: E402
+
+PAGES = {
+    f"https://example.edu/page{number}": f"Page {number} describes admission topic {number} in detail."
+    for number in range(3)
+}
+
+
+def write_pages(path, pages):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=["url", "title", "metadata", "contents"])
+        writer.writeheader()
+        for url, contents in pages.items():
+            writer.writerow({"url": url, "title": url.rsplit('/', 1)[1], "metadata": "", "contents": contents})
+
+
+@pytest.fixture
+def store(tmp_path):
+    handler = VectorStore()
+    vector_store = handler.creat_vector_store(
+        FakeEmbeddings(dimension=32, latency=0), docstore=SQLiteDocstore(str(tmp_path / "store.docstore.sqlite"))
+    )
+    return handler, vector_store
+
+
+def stored_contents(vector_store):
+    return sorted(document.page_content for document in vector_store.docstore.search_many(
+        list(vector_store.index_to_docstore_id.values())).values())
+
+
+def test_a_changed_page_replaces_its_old_chunks(tmp_path, store):
+    handler, vector_store = store
+    csv_path = str(tmp_path / "page_contents.csv")
+    write_pages(csv_path, PAGES)
+    write_feed_info(csv_path, incremental=False, complete=True)
+    handler.insert_document(vector_store, csv_path)
+
+    changed_url = "https://example.edu/page1"
+    write_pages(csv_path, {changed_url: "Page 1 now lists the new tuition fees."})
+    write_feed_info(csv_path, incremental=True, complete=True)
+    handler.insert_document(vector_store, csv_path)
+
+    hits = [document for document in vector_store.similarity_search("Page 1 tuition fees", k=10)
+            if document.metadata["url"] == changed_url]
+    assert [document.page_content for document in hits] == ["Page 1 now lists the new tuition fees."]
+    # The incremental feed does not remove the pages it does not list
+    assert stored_contents(vector_store) == sorted([PAGES["https://example.edu/page0"],
+                                                    "Page 1 now lists the new tuition fees.",
+                                                    PAGES["https://example.edu/page2"]])
+
+
+def test_unchanged_pages_are_not_embedded_again(tmp_path, store):
+    handler, vector_store = store
+    csv_path = str(tmp_path / "page_contents.csv")
+    write_pages(csv_path, PAGES)
+    handler.insert_document(vector_store, csv_path)
+    calls = vector_store.embedding_function.calls
+
+    handler.insert_document(vector_store, csv_path)
+    assert vector_store.embedding_function.calls == calls
+    assert stored_contents(vector_store) == sorted(PAGES.values())
+
+
+@pytest.mark.parametrize("feed_info, removed", [
+    (None, True),
+    ({"incremental": False, "complete": True}, True),
+    ({"incremental": True, "complete": True}, False),
+    ({"incremental": False, "complete": False}, False),
+])
+def test_pages_missing_from_a_full_feed_are_deleted(tmp_path, store, feed_info, removed):
+    handler, vector_store = store
+    csv_path = str(tmp_path / "page_contents.csv")
+    write_pages(csv_path, PAGES)
+    handler.insert_document(vector_store, csv_path)
+
+    remaining = {url: contents for url, contents in PAGES.items() if not url.endswith("page2")}
+    write_pages(csv_path, remaining)
+    if feed_info is not None:
+        write_feed_info(csv_path, **feed_info)
+    handler.insert_document(vector_store, csv_path)
+
+    expected = remaining if removed else PAGES
+    assert stored_contents(vector_store) == sorted(expected.values())
+
+
+def test_a_partial_feed_chunks_unchanged_pages_like_the_full_one(tmp_path, store):
+    handler, vector_store = store
+    navigation = "Home\nAdmissions\nContact\n"
+    pages = {url: navigation + contents for url, contents in PAGES.items()}
+    pages["https://example.edu/page3"] = navigation + PAGES["https://example.edu/page0"]
+    csv_path = str(tmp_path / "page_contents.csv")
+    write_pages(csv_path, pages)
+    handler.insert_document(vector_store, csv_path)
+    ids = set(vector_store.index_to_docstore_id.values())
+    calls = vector_store.embedding_function.calls
+
+    # Alone in a partial feed, the navigation lines of page1 are not shared by enough pages to be learned again
+    write_pages(csv_path, {"https://example.edu/page1": pages["https://example.edu/page1"]})
+    write_feed_info(csv_path, incremental=True, complete=True)
+    handler.insert_document(vector_store, csv_path)
+
+    assert set(vector_store.index_to_docstore_id.values()) == ids
+    assert vector_store.embedding_function.calls == calls
+    assert not any("Admissions" in contents for contents in stored_contents(vector_store))
+
+
+def test_identical_chunks_are_embedded_once(store):
+    handler, vector_store = store
+    texts = []
+    vector_store.embedding_function.embed_documents = lambda batch: texts.extend(batch) or [[0.0] * 32] * len(batch)
+    documents = [Document(page_content=text, metadata={}) for text in ["a", "b", "a", "a"]]
+
+    assert len(handler.embed_contents(vector_store, documents)) == 4
+    assert texts == ["a", "b"]
+
+
+def add_documents(handler, vector_store, texts):
+    documents = [Document(page_content=text, metadata={"url": f"https://example.edu/{text}"}) for text in texts]
+    ids = [handler.document_id(document) for document in documents]
+    handler.add_vectors(vector_store, documents, ids, vector_store.embedding_function.embed_documents(texts))
+    return ids
+
+
+def mapping(vector_store):
+    return dict(vector_store.index_to_docstore_id.items())
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_loading_replays_the_vectors_logged_after_the_last_save(tmp_path, store, mmap):
+    handler, vector_store = store
+    add_documents(handler, vector_store, ["saved0", "saved1", "saved2"])
+    handler.save_vector_store(vector_store, str(tmp_path), "store")
+    # The process dies after inserting more documents, before saving again
+    logged_ids = add_documents(handler, vector_store, ["logged0", "logged1"])
+    assert vector_store.docstore.log_size() == 2
+
+    loaded = handler.load_vector_store(str(tmp_path), "store", vector_store.embedding_function, mmap=mmap)
+
+    if mmap:
+        # The memory-mapped index is read-only, so the logged vectors go to the delta index
+        assert (loaded.index.ntotal, loaded.delta_index.ntotal) == (3, 2)
+    else:
+        assert loaded.index.ntotal == 5
+    assert mapping(loaded) == mapping(vector_store)
+    hits = loaded.similarity_search_with_score_by_vector(
+        vector_store.embedding_function.embed_query("logged1"), k=1
+    )
+    assert hits[0][0].id == logged_ids[1]
+
+
+def test_loading_drops_documents_whose_vectors_were_never_logged(tmp_path, store):
+    handler, vector_store = store
+    add_documents(handler, vector_store, ["saved0", "saved1"])
+    handler.save_vector_store(vector_store, str(tmp_path), "store")
+    add_documents(handler, vector_store, ["logged0"])
+    # Documents and positions are committed before the vectors are logged: the process dies in between
+    vector_store.add_embeddings(text_embeddings=[("lost0", vector_store.embedding_function.embed_query("lost0"))],
+                                metadatas=[{"url": "https://example.edu/lost0"}], ids=["lost0"])
+
+    loaded = handler.load_vector_store(str(tmp_path), "store", vector_store.embedding_function, mmap=False)
+
+    assert loaded.index.ntotal == 3
+    assert len(mapping(loaded)) == 3
+    assert "lost0" not in mapping(loaded).values()
+    assert loaded.docstore.existing_ids(["lost0"]) == set()
+
+
+def test_writing_the_index_empties_the_vector_log(tmp_path, store):
+    handler, vector_store = store
+    ids = add_documents(handler, vector_store, ["doc0", "doc1", "doc2", "doc3"])
+    handler.save_vector_store(vector_store, str(tmp_path), "store")
+    ids += add_documents(handler, vector_store, ["doc4"])
+    handler.delete_documents(vector_store, ids[:2])
+
+    handler.compact_vector_store(vector_store)
+    handler.write_index(vector_store, vector_store.docstore, handler.vector_store_paths(str(tmp_path), "store")[0])
+
+    assert vector_store.docstore.log_size() == 0
+    loaded = handler.load_vector_store(str(tmp_path), "store", vector_store.embedding_function, mmap=True)
+    assert (loaded.index.ntotal, loaded.delta_index.ntotal) == (3, 0)
+    assert mapping(loaded) == mapping(vector_store) == dict(enumerate(ids[2:]))